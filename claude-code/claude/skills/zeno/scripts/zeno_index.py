@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""Lightweight symbol + dependency indexer for Zeno workflows."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from zeno_paths import (
+    WALK_WORKERS,
+    IgnoreCache,
+    apply_ignore_files,
+    compile_globs,
+    filter_listing,
+    git_list_files,
+    scandir_entries,
+    walk_files,
+)
+from zeno_trigrams import write_index
+
+DEFAULT_EXCLUDE_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    ".venv",
+    "venv",
+    "node_modules",
+    "dist",
+    "build",
+    ".next",
+    ".turbo",
+    ".cache",
+    ".pytest_cache",
+}
+
+DEFAULT_EXCLUDE_GLOBS = ["**/*.min.*", "**/*.map", "**/generated/**", "**/vendor/**"]
+
+# Trigrams present in more than this share of files are recorded as "dense"
+# without a posting list; they never narrow a search enough to be worth storing.
+TRIGRAM_DENSE_RATIO = 0.5
+
+SYMBOL_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("class", re.compile(r"^\s*class\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("struct", re.compile(r"^\s*struct\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("enum", re.compile(r"^\s*enum\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("protocol", re.compile(r"^\s*protocol\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("extension", re.compile(r"^\s*extension\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("func", re.compile(r"^\s*func\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("def", re.compile(r"^\s*def\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("function", re.compile(r"^\s*function\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("interface", re.compile(r"^\s*interface\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("type", re.compile(r"^\s*type\s+([A-Za-z_][A-Za-z0-9_]*)")),
+    ("const", re.compile(r"^\s*const\s+([A-Za-z_][A-Za-z0-9_]*)\s*=\s*\(")),
+]
+
+IMPORT_PATTERNS: Dict[str, List[re.Pattern]] = {
+    "python": [
+        re.compile(r"^\s*import\s+([A-Za-z0-9_\.]+)"),
+        re.compile(r"^\s*from\s+([A-Za-z0-9_\.]+)\s+import\s+"),
+    ],
+    "javascript": [
+        re.compile(r"^\s*import\s+.*?from\s+[\"']([^\"']+)[\"']"),
+        re.compile(r"^\s*const\s+.*?=\s*require\([\"']([^\"']+)[\"']\)"),
+    ],
+    "typescript": [
+        re.compile(r"^\s*import\s+.*?from\s+[\"']([^\"']+)[\"']"),
+        re.compile(r"^\s*const\s+.*?=\s*require\([\"']([^\"']+)[\"']\)"),
+    ],
+    "swift": [re.compile(r"^\s*import\s+([A-Za-z0-9_\.]+)"),],
+    "go": [
+        re.compile(r"^\s*import\s+\"([^\"]+)\""),
+        re.compile(r"^\s*\"([^\"]+)\""),
+    ],
+    "rust": [re.compile(r"^\s*use\s+([^;]+);"),],
+    "java": [re.compile(r"^\s*import\s+([^;]+);"),],
+    "ruby": [re.compile(r"^\s*require\s+[\"']([^\"']+)[\"']"),],
+}
+
+EXT_LANGUAGE = {
+    ".py": "python",
+    ".js": "javascript",
+    ".ts": "typescript",
+    ".swift": "swift",
+    ".go": "go",
+    ".rs": "rust",
+    ".java": "java",
+    ".rb": "ruby",
+}
+
+
+def _utc_ts() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _iter_files(
+    root: Path,
+    include_hidden: bool,
+    exclude_dirs: Iterable[str],
+    exclude_globs: Iterable[str],
+    max_files: int,
+    use_ignore: bool = True,
+    git: str = "auto",
+) -> List[Path]:
+    exclude_dir_set = set(exclude_dirs)
+    excluded = compile_globs(exclude_globs)
+    ignores = IgnoreCache()
+    if use_ignore and git != "off":
+        raw = git_list_files(str(root), untracked=git != "tracked")
+        if raw is not None:
+            rule_dirs = {""} | {path.rpartition("/")[0] for path in raw if path.endswith(".zenoignore")}
+            listed = filter_listing(raw, include_hidden, exclude_dir_set)
+            rels, _ = apply_ignore_files(str(root), listed, ignores, rule_dirs)
+            return [root / rel for rel in rels if not excluded.match(rel)][:max_files]
+    base = str(root)
+
+    def list_dir(rel_dir: str) -> Optional[List[Tuple[str, bool]]]:
+        return scandir_entries(os.path.join(base, rel_dir) if rel_dir else base)
+
+    with ThreadPoolExecutor(max_workers=WALK_WORKERS) as pool:
+        rels = walk_files(
+            [("", ())],
+            list_dir,
+            pool,
+            include_hidden,
+            exclude_dir_set,
+            base,
+            ignores=ignores if use_ignore else None,
+            exclude=excluded,
+            limit=max_files,
+        )
+    return [root / rel for rel in rels]
+
+
+def _detect_language(path: Path) -> Optional[str]:
+    return EXT_LANGUAGE.get(path.suffix.lower())
+
+
+def _scan_file(
+    path: Path,
+    root: Path,
+    max_bytes: int,
+    max_symbols: int,
+    max_imports: int,
+) -> Tuple[List[Dict], List[Dict], int]:
+    symbols: List[Dict] = []
+    imports: List[Dict] = []
+    bytes_read = 0
+    language = _detect_language(path)
+    if not language:
+        return symbols, imports, bytes_read
+
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return symbols, imports, bytes_read
+
+    if size > max_bytes:
+        return symbols, imports, bytes_read
+
+    patterns = IMPORT_PATTERNS.get(language, [])
+    rel_path = str(path.relative_to(root))
+
+    try:
+        with path.open("r", encoding="utf-8", errors="replace") as handle:
+            for idx, raw in enumerate(handle, start=1):
+                bytes_read += len(raw)
+                line = raw.rstrip("\n")
+                for kind, regex in SYMBOL_PATTERNS:
+                    match = regex.search(line)
+                    if match:
+                        symbols.append(
+                            {
+                                "kind": kind,
+                                "name": match.group(1),
+                                "path": rel_path,
+                                "line": idx,
+                                "language": language,
+                            }
+                        )
+                        if len(symbols) >= max_symbols:
+                            break
+                for regex in patterns:
+                    match = regex.search(line)
+                    if match:
+                        imports.append(
+                            {
+                                "module": match.group(1).strip(),
+                                "path": rel_path,
+                                "line": idx,
+                                "language": language,
+                                "raw": line.strip(),
+                            }
+                        )
+                        if len(imports) >= max_imports:
+                            break
+                if len(symbols) >= max_symbols and len(imports) >= max_imports:
+                    break
+    except OSError:
+        return symbols, imports, bytes_read
+
+    return symbols, imports, bytes_read
+
+
+def _file_trigrams(data: bytes) -> Iterable[bytes]:
+    lowered = data.lower()
+    grams = {lowered[idx : idx + 3] for idx in range(len(lowered) - 2)}
+    return [gram for gram in grams if b"\n" not in gram]
+
+
+def _build_trigram_index(root: Path, files: List[Path], max_bytes: int, out_path: Path) -> None:
+    """Write a Code Search style trigram index over (ASCII-lowercased) file bytes.
+
+    Files larger than `max_bytes` or unreadable are left out; the server
+    always scans files that are missing from the index or changed since.
+    """
+    entries: List[List] = []
+    postings: Dict[bytes, List[int]] = {}
+    bytes_read = 0
+    for path in files:
+        try:
+            st = path.stat()
+            if st.st_size > max_bytes:
+                continue
+            data = path.read_bytes()
+        except OSError:
+            continue
+        bytes_read += len(data)
+        file_id = len(entries)
+        entries.append([str(path.relative_to(root)), st.st_size, st.st_mtime_ns])
+        for gram in _file_trigrams(data):
+            postings.setdefault(gram, []).append(file_id)
+
+    dense_limit = max(1, int(len(entries) * TRIGRAM_DENSE_RATIO))
+    dense = [gram for gram, ids in postings.items() if len(ids) > dense_limit]
+    for gram in dense:
+        del postings[gram]
+
+    stats = {
+        "files": len(entries),
+        "trigrams": len(postings),
+        "dense": len(dense),
+        "postings": sum(len(ids) for ids in postings.values()),
+        "bytes_read": bytes_read,
+    }
+    meta = {"root": str(root), "generated_at": _utc_ts(), "files": entries, "stats": stats}
+    write_index(str(out_path), meta, postings, dense)
+
+
+def _write_output(out_path: Optional[Path], payload: Dict, fmt: str) -> None:
+    text = ""
+    if fmt == "jsonl":
+        lines: List[str] = []
+        for symbol in payload.get("symbols", []):
+            lines.append(json.dumps({"type": "symbol", **symbol}, ensure_ascii=True))
+        for imp in payload.get("imports", []):
+            lines.append(json.dumps({"type": "import", **imp}, ensure_ascii=True))
+        text = "\n".join(lines) + ("\n" if lines else "")
+    else:
+        text = json.dumps(payload, indent=2, ensure_ascii=True) + "\n"
+
+    if out_path:
+        out_path.write_text(text, encoding="utf-8")
+    else:
+        print(text, end="")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Zeno symbol + dependency indexer")
+    parser.add_argument("--root", required=True, help="Root directory to index")
+    parser.add_argument("--out", help="Output file path (JSON or JSONL)")
+    parser.add_argument("--format", choices=["json", "jsonl"], default="json")
+    parser.add_argument("--include-hidden", action="store_true")
+    parser.add_argument("--max-files", type=int, default=20000)
+    parser.add_argument("--no-ignore", action="store_true", help="Do not apply .gitignore/.zenoignore rules")
+    parser.add_argument(
+        "--git",
+        choices=["auto", "tracked", "off"],
+        default="auto",
+        help="In a git work tree, list files with git ls-files (tracked = index only, off = walk)",
+    )
+    parser.add_argument("--max-bytes", type=int, default=2_000_000)
+    parser.add_argument("--max-symbols", type=int, default=10000)
+    parser.add_argument("--max-imports", type=int, default=10000)
+    parser.add_argument(
+        "--trigrams",
+        action="store_true",
+        help="Also write a trigram index for zeno_server.py --trigram-index (next to --out)",
+    )
+    parser.add_argument("--trigram-out", help="Trigram index path (default: <out>.trigrams)")
+    args = parser.parse_args()
+
+    root = Path(args.root).resolve()
+    files = _iter_files(
+        root,
+        args.include_hidden,
+        DEFAULT_EXCLUDE_DIRS,
+        DEFAULT_EXCLUDE_GLOBS,
+        args.max_files,
+        use_ignore=not args.no_ignore,
+        git=args.git,
+    )
+
+    symbols: List[Dict] = []
+    imports: List[Dict] = []
+    bytes_read = 0
+
+    for path in files:
+        file_symbols, file_imports, file_bytes = _scan_file(
+            path,
+            root,
+            args.max_bytes,
+            args.max_symbols - len(symbols),
+            args.max_imports - len(imports),
+        )
+        symbols.extend(file_symbols)
+        imports.extend(file_imports)
+        bytes_read += file_bytes
+        if len(symbols) >= args.max_symbols and len(imports) >= args.max_imports:
+            break
+
+    payload = {
+        "root": str(root),
+        "generated_at": _utc_ts(),
+        "files_scanned": len(files),
+        "symbols": symbols,
+        "imports": imports,
+        "stats": {
+            "symbols": len(symbols),
+            "imports": len(imports),
+            "bytes_read": bytes_read,
+        },
+    }
+
+    out_path = Path(args.out).resolve() if args.out else None
+    _write_output(out_path, payload, args.format)
+
+    if args.trigrams or args.trigram_out:
+        if args.trigram_out:
+            trigram_path = Path(args.trigram_out).resolve()
+        elif out_path:
+            trigram_path = out_path.with_name(out_path.name + ".trigrams")
+        else:
+            raise SystemExit("--trigrams requires --out or --trigram-out")
+        _build_trigram_index(root, files, args.max_bytes, trigram_path)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -92,6 +92,20 @@ def _build_ops(mode: str, args: argparse.Namespace) -> List[Dict]:
         if args.max_patterns:
             patterns = patterns[: args.max_patterns]
         ops = [{"id": "sec-1", "op": "list_files", "args": {"glob": globs[0], "max": 400}, "purpose": "scope files"}]
+        if args.multi:
+            entries = []
+            for item in patterns:
+                entry = {"id": item.get("id", ""), "pattern": item.get("pattern", ""), "globs": item.get("globs") or globs}
+                if item.get("regex"):
+                    entry["regex"] = True
+                entries.append(entry)
+            ops.append({
+                "id": "sec-2",
+                "op": "grep_multi",
+                "args": {"patterns": entries, "max_hits": 50},
+                "purpose": f"security pattern pack ({len(entries)} patterns, single pass)",
+            })
+            return ops
         for idx, item in enumerate(patterns, start=2):
             paths = item.get("globs") or globs
             op_args = {"pattern": item.get("pattern", ""), "paths": paths, "max_hits": 50}
@@ -190,6 +204,7 @@ def main() -> int:
     plan.add_argument("--head", help="Head ref for git diff")
     plan.add_argument("--pack", help="Security pattern pack JSON path")
     plan.add_argument("--max-patterns", type=int, help="Limit number of security patterns")
+    plan.add_argument("--multi", action="store_true", help="Emit one grep_multi op for the security pack")
 
     args = parser.parse_args()
 
@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+"""Compiled glob matching shared by zeno_server.py and zeno_index.py.
+
+Globs match relative POSIX paths in one of two syntaxes:
+- "fnmatch" (the default): `fnmatch.fnmatchcase` rules, so `*` also matches
+  `/` and a pattern is matched against the whole path. A pattern also
+  matches the identical path.
+- "path": `*` and `?` match within one path segment and `[...]` is a
+  character class; `**` matches across segments and `**/` matches zero or
+  more directories, so `**/*.py` also matches `setup.py` at the root; a
+  pattern without `/` matches the file name at any depth (`*.min.js`).
+In both, `{a,b}` alternatives are expanded first and may nest (`**/*.{py,js}`).
+
+Ignore files (`.gitignore`, `.zenoignore`) use gitignore rules: `!` negates,
+a trailing `/` matches directories only, a pattern containing `/` is anchored
+to the ignore file's directory, and deeper files override shallower ones.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import Executor, Future, wait
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+GLOB_CACHE_SIZE = 512
+MAX_BRACE_EXPANSIONS = 1024
+_GLOB_META = re.compile(r"[*?\[{]")
+IGNORE_FILES = (".gitignore", ".zenoignore")
+GLOB_SYNTAXES = ("fnmatch", "path")
+WALK_WORKERS = 8
+
+
+def expand_braces(pattern: str) -> List[str]:
+    """Expand `{a,b}` alternatives; braces without a top-level comma stay literal."""
+    out = list(dict.fromkeys(_expand(pattern)))
+    if len(out) > MAX_BRACE_EXPANSIONS:
+        raise ValueError(f"glob expands to more than {MAX_BRACE_EXPANSIONS} patterns: {pattern}")
+    return out
+
+
+def _expand(pattern: str) -> List[str]:
+    search_from = 0
+    while True:
+        start = pattern.find("{", search_from)
+        if start < 0:
+            return [pattern]
+        depth = 0
+        commas: List[int] = []
+        for end in range(start, len(pattern)):
+            ch = pattern[end]
+            if ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    break
+            elif ch == "," and depth == 1:
+                commas.append(end)
+        else:
+            return [pattern]
+        if not commas:
+            search_from = start + 1
+            continue
+        head, tail = pattern[:start], pattern[end + 1 :]
+        bounds = [start] + commas + [end]
+        out: List[str] = []
+        for left, right in zip(bounds, bounds[1:]):
+            out.extend(_expand(head + pattern[left + 1 : right] + tail))
+            if len(out) > MAX_BRACE_EXPANSIONS:
+                break
+        return out
+
+
+def literal_prefix(pattern: str) -> Optional[str]:
+    """Return the leading wildcard-free directory of a brace-free glob, if any.
+
+    `src/**/*.py` -> `src`; `docs/api/index.md` -> `docs/api`; `*.py` -> None,
+    because a slash-less pattern matches at any depth.
+    """
+    segments = pattern.split("/")
+    prefix: List[str] = []
+    for segment in segments[:-1]:
+        if _GLOB_META.search(segment):
+            break
+        prefix.append(segment)
+    if not prefix or any(segment in ("", ".", "..") for segment in prefix):
+        return None
+    return "/".join(prefix)
+
+
+def fnmatch_to_regex(pattern: str) -> str:
+    """Translate one fnmatch-syntax glob into a regex source matching it or the identical path."""
+    return f"{fnmatch.translate(pattern)}|{re.escape(pattern)}"
+
+
+def glob_to_regex(pattern: str, any_depth: Optional[bool] = None) -> str:
+    """Translate one path-syntax glob into an anchored-by-caller regex source.
+
+    `any_depth` lets the pattern match below any directory; by default that
+    applies to patterns without `/`.
+    """
+    out: List[str] = []
+    i = 0
+    n = len(pattern)
+    if any_depth if any_depth is not None else "/" not in pattern:
+        out.append("(?:.*/)?")
+    while i < n:
+        ch = pattern[i]
+        if ch == "*":
+            if pattern.startswith("**", i):
+                i += 2
+                if pattern.startswith("/", i):
+                    i += 1
+                    out.append("(?:.*/)?")
+                else:
+                    out.append(".*")
+                continue
+            out.append("[^/]*")
+        elif ch == "?":
+            out.append("[^/]")
+        elif ch == "[":
+            end = pattern.find("]", i + 2 if pattern.startswith(("[!", "[^"), i) else i + 1)
+            if end < 0:
+                out.append(re.escape(ch))
+            else:
+                body = pattern[i + 1 : end]
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        else:
+            out.append(re.escape(ch))
+        i += 1
+    return "".join(out)
+
+
+class GlobSet:
+    """A set of globs compiled into one regex; use `compile_globs` to share instances."""
+
+    def __init__(self, patterns: Sequence[str], syntax: str = "fnmatch") -> None:
+        if syntax not in GLOB_SYNTAXES:
+            raise ValueError(f"unknown glob_syntax: {syntax} (expected one of {', '.join(GLOB_SYNTAXES)})")
+        self.patterns = tuple(patterns)
+        self.syntax = syntax
+        translate = glob_to_regex if syntax == "path" else fnmatch_to_regex
+        expanded = [p for pattern in self.patterns for p in expand_braces(pattern)]
+        sources = [translate(p) for p in dict.fromkeys(expanded)]
+        self._regex = re.compile("|".join(f"(?:{src})" for src in sources)) if sources else None
+        self.prefixes = _minimal_prefixes(expanded)
+
+    def __bool__(self) -> bool:
+        return self._regex is not None
+
+    def match(self, path: str) -> bool:
+        return self._regex is not None and self._regex.fullmatch(path) is not None
+
+    def filter(self, paths: Iterable[str]) -> List[str]:
+        if self._regex is None:
+            return []
+        fullmatch = self._regex.fullmatch
+        return [path for path in paths if fullmatch(path)]
+
+
+def _minimal_prefixes(patterns: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """Directories that contain every possible match, or None when that is the root."""
+    prefixes = []
+    for pattern in patterns:
+        prefix = literal_prefix(pattern)
+        if prefix is None:
+            return None
+        prefixes.append(prefix)
+    if not prefixes:
+        return None
+    kept: List[str] = []
+    for prefix in sorted(set(prefixes), key=len):
+        if not any(prefix.startswith(parent + "/") for parent in kept):
+            kept.append(prefix)
+    kept.sort()
+    return tuple(kept)
+
+
+@lru_cache(maxsize=GLOB_CACHE_SIZE)
+def _compile(patterns: Tuple[str, ...], syntax: str) -> GlobSet:
+    return GlobSet(patterns, syntax)
+
+
+def compile_globs(patterns: Optional[Iterable[str]], syntax: str = "fnmatch") -> GlobSet:
+    """Return the cached GlobSet for `patterns` (order-insensitive) in `syntax`."""
+    return _compile(tuple(sorted(set(patterns or ()))), syntax)
+
+
+class IgnoreRules:
+    """Compiled rules of one ignore file, matched relative to its directory."""
+
+    def __init__(self, base: str, lines: Iterable[str]) -> None:
+        self.base = base
+        self._rules: List[Tuple[Pattern[str], bool, bool]] = []
+        for raw in lines:
+            line = raw.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            if not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            if line.startswith("\\"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            regex = re.compile(glob_to_regex(line.lstrip("/"), any_depth=not anchored))
+            self._rules.append((regex, negate, dir_only))
+        self._negates = any(negate for _, negate, _ in self._rules)
+        if not self._negates:
+            # Without negations the first match decides, so each kind is one regex.
+            self._any_dir = _join([regex for regex, _, _ in self._rules])
+            self._any_file = _join([regex for regex, _, dir_only in self._rules if not dir_only])
+
+    def __bool__(self) -> bool:
+        return bool(self._rules)
+
+    def match(self, rel: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included by `!`, None if no rule applies."""
+        path = rel[len(self.base) + 1 :] if self.base else rel
+        if not self._negates:
+            regex = self._any_dir if is_dir else self._any_file
+            return True if regex is not None and regex.fullmatch(path) else None
+        for regex, negate, dir_only in reversed(self._rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path):
+                return not negate
+        return None
+
+
+def _join(regexes: List[Pattern[str]]) -> Optional[Pattern[str]]:
+    return re.compile("|".join(f"(?:{r.pattern})" for r in regexes)) if regexes else None
+
+
+def is_ignored(chain: Sequence[IgnoreRules], rel: str, is_dir: bool) -> bool:
+    """Apply a root-to-leaf chain of ignore files to a root-relative path."""
+    for rules in reversed(chain):
+        decision = rules.match(rel, is_dir)
+        if decision is not None:
+            return decision
+    return False
+
+
+class IgnoreCache:
+    """Parsed ignore files, revalidated by (mtime_ns, size) on each load."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, Tuple[Tuple[int, int], IgnoreRules]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, path: str, base: str) -> Tuple[Optional[IgnoreRules], Optional[Tuple[int, int]]]:
+        """Return (rules or None when empty/missing, (mtime_ns, size) or None when missing)."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None, None
+        sig = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached is None or cached[0] != sig or cached[1].base != base:
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as handle:
+                    rules = IgnoreRules(base, handle)
+            except OSError:
+                return None, sig
+            cached = (sig, rules)
+            with self._lock:
+                self._entries[path] = cached
+        return (cached[1] or None), sig
+
+    def extend(
+        self,
+        chain: Tuple[IgnoreRules, ...],
+        full_dir: str,
+        rel_dir: str,
+        names: Iterable[str] = IGNORE_FILES,
+    ) -> Tuple[Tuple[IgnoreRules, ...], List[Tuple[str, Tuple[int, int]]]]:
+        """Append the ignore files in one directory to `chain`.
+
+        Returns the new chain and (root-relative path, (mtime_ns, size)) of each file read.
+        """
+        seen: List[Tuple[str, Tuple[int, int]]] = []
+        for name in names:
+            rules, sig = self.load(os.path.join(full_dir, name), rel_dir)
+            if sig is not None:
+                seen.append((f"{rel_dir}/{name}" if rel_dir else name, sig))
+            if rules is not None:
+                chain = chain + (rules,)
+        return chain, seen
+
+
+def git_list_files(
+    root: str,
+    prefixes: Optional[Sequence[str]] = None,
+    untracked: bool = True,
+) -> Optional[List[str]]:
+    """List files under `root` from the git index, or None outside a git work tree.
+
+    Tracked files still present on disk are returned, including unmerged
+    (conflicted) ones, plus untracked files not excluded by
+    `.gitignore`/`.git/info/exclude` when `untracked` is set. Checked-out
+    submodules, and untracked nested repositories when `untracked` is set,
+    are listed by running git inside them. Skip-worktree entries are left
+    out. git records symlinks as blobs, so a symlink is kept only when it
+    resolves to a regular file under `root`. Paths are relative to `root`,
+    use `/`, and are sorted.
+    """
+    cmd = ["git", "-C", root, "ls-files", "-z", "-t", "--stage", "--deleted"]
+    if untracked:
+        cmd += ["--others", "--exclude-standard"]
+    if prefixes:
+        cmd += ["--"] + [f":(literal){prefix}" for prefix in prefixes]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, check=False)
+    except OSError:
+        return None
+    if proc.returncode != 0:
+        return None
+    real_root = os.path.realpath(root)
+    present: Dict[str, None] = {}
+    deleted = set()
+    nested: List[str] = []
+    for record in proc.stdout.split(b"\0"):
+        if not record:
+            continue
+        tag, _, rest = record.partition(b" ")
+        if tag == b"?":
+            path = rest
+            link = None
+            if path.endswith(b"/"):
+                # git shows an untracked nested repository as one "dir/" entry.
+                nested.append(os.fsdecode(path[:-1]))
+                continue
+        else:
+            meta, _, path = rest.partition(b"\t")
+            if tag == b"R":
+                deleted.add(path)
+                continue
+            # H: cached; M: unmerged, listed once per conflict stage.
+            if tag not in (b"H", b"M"):
+                continue
+            if meta.startswith(b"160000"):
+                nested.append(os.fsdecode(path))
+                continue
+            link = meta.startswith(b"120000")
+        rel = os.fsdecode(path)
+        if rel in present:
+            continue
+        if link or (link is None and os.path.islink(os.path.join(root, rel))):
+            if not _file_under(real_root, os.path.join(root, rel)):
+                continue
+        present[rel] = None
+    for sub in nested:
+        inner = _nested_prefixes(prefixes, sub)
+        if inner == [] or not os.path.exists(os.path.join(root, sub, ".git")):
+            # Not under a requested prefix, or a submodule that is not checked out.
+            continue
+        for rel in git_list_files(os.path.join(root, sub), inner, untracked) or ():
+            present[f"{sub}/{rel}"] = None
+    gone = {os.fsdecode(path) for path in deleted}
+    return sorted(path for path in present if path not in gone)
+
+
+def _nested_prefixes(prefixes: Optional[Sequence[str]], sub: str) -> Optional[List[str]]:
+    """Translate `prefixes` into ones relative to the nested repository `sub`; None lists all of it."""
+    if not prefixes:
+        return None
+    inner: List[str] = []
+    for prefix in prefixes:
+        if not prefix or prefix == sub or sub.startswith(prefix + "/"):
+            return None
+        if prefix.startswith(sub + "/"):
+            inner.append(prefix[len(sub) + 1 :])
+    return inner
+
+
+def _file_under(real_root: str, path: str) -> bool:
+    """True if `path` resolves to a regular file inside `real_root`."""
+    target = os.path.realpath(path)
+    return target.startswith(real_root + os.sep) and os.path.isfile(target)
+
+
+def filter_listing(paths: Iterable[str], include_hidden: bool, exclude_dirs: Iterable[str]) -> List[str]:
+    """Drop paths with a hidden segment (unless `include_hidden`) or an excluded directory."""
+    exclude_dir_set = frozenset(exclude_dirs)
+    kept: List[str] = []
+    for path in paths:
+        segments = path.split("/")
+        if not include_hidden and any(segment.startswith(".") for segment in segments):
+            continue
+        if exclude_dir_set and not exclude_dir_set.isdisjoint(segments[:-1]):
+            continue
+        kept.append(path)
+    return kept
+
+
+def apply_ignore_files(
+    root: str,
+    paths: Sequence[str],
+    cache: IgnoreCache,
+    rule_dirs: Iterable[str],
+    names: Sequence[str] = (".zenoignore",),
+) -> Tuple[List[str], List[Tuple[str, Tuple[int, int]]]]:
+    """Filter a flat listing through ignore files found in `rule_dirs`.
+
+    Returns the kept paths and (root-relative path, (mtime_ns, size)) of each
+    ignore file read.
+    """
+    seen: List[Tuple[str, Tuple[int, int]]] = []
+    rules_by_dir: Dict[str, Tuple[IgnoreRules, ...]] = {}
+    for rel_dir in sorted(set(rule_dirs)):
+        chain, files = cache.extend((), os.path.join(root, rel_dir) if rel_dir else root, rel_dir, names)
+        seen.extend(files)
+        if chain:
+            rules_by_dir[rel_dir] = chain
+    if not rules_by_dir:
+        return list(paths), seen
+
+    # Per directory: (ignored, chain of rules from the root down to it).
+    states: Dict[str, Tuple[bool, Tuple[IgnoreRules, ...]]] = {"": (False, rules_by_dir.get("", ()))}
+
+    def state(rel_dir: str) -> Tuple[bool, Tuple[IgnoreRules, ...]]:
+        cached = states.get(rel_dir)
+        if cached is None:
+            parent_ignored, chain = state(rel_dir.rpartition("/")[0])
+            ignored = parent_ignored or (bool(chain) and is_ignored(chain, rel_dir, True))
+            cached = (ignored, chain + rules_by_dir.get(rel_dir, ()))
+            states[rel_dir] = cached
+        return cached
+
+    kept: List[str] = []
+    for path in paths:
+        ignored, chain = state(path.rpartition("/")[0])
+        if not ignored and not (chain and is_ignored(chain, path, False)):
+            kept.append(path)
+    return kept, seen
+
+
+def _path_key(entry: Tuple[str, bool]) -> str:
+    return entry[0] + "/" if entry[1] else entry[0]
+
+
+def path_order(entries: Iterable[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+    """Sort (name, is_dir) entries so a depth-first walk yields sorted paths.
+
+    A directory sorts as `name/`, so `a-b` and `a.txt` come before `a/x`.
+    """
+    return sorted(entries, key=_path_key)
+
+
+def scandir_entries(path: str) -> Optional[List[Tuple[str, bool]]]:
+    """List a directory as path-ordered (name, is_dir) pairs, or None if it is gone.
+
+    Type information comes from the `DirEntry`, so no extra stat is needed for
+    plain files and directories. As with `os.walk`, symlinks to directories
+    are skipped: they are neither followed nor listed as files.
+    """
+    entries: List[Tuple[str, bool]] = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    if is_dir and entry.is_symlink():
+                        continue
+                except OSError:
+                    is_dir = False
+                entries.append((entry.name, is_dir))
+    except FileNotFoundError:
+        return None
+    except OSError:
+        return []
+    return path_order(entries)
+
+
+def walk_files(
+    starts: Sequence[Tuple[str, Tuple[IgnoreRules, ...]]],
+    list_dir: Callable[[str], Optional[Sequence[Tuple[str, bool]]]],
+    executor: Executor,
+    include_hidden: bool,
+    exclude_dirs: Iterable[str],
+    root: str,
+    ignores: Optional[IgnoreCache] = None,
+    exclude: Optional[GlobSet] = None,
+    limit: Optional[int] = None,
+    seen: Optional[List[Tuple[str, Tuple[int, int]]]] = None,
+    stop: Optional[Callable[[], object]] = None,
+    visit: Optional[Callable[[str], None]] = None,
+) -> List[str]:
+    """Walk from each (root-relative dir, inherited ignore chain) and return sorted file paths.
+
+    `list_dir(rel_dir)` runs on `executor` and returns path-ordered entries
+    (see `path_order`) or None for a missing directory. Each subdirectory is
+    submitted as soon as its parent is visited, so slow readdir calls overlap
+    across the pool, while this thread consumes listings depth-first in path
+    order. The result is deterministic and the walk stops after `limit` files,
+    or before the next directory once `stop()` returns a true value. Ignore
+    files read along the way are appended to `seen`, and `visit(rel)` is
+    called for each file as soon as it is found.
+    """
+    exclude_dir_set = frozenset(exclude_dirs)
+    pending: Dict[str, Future] = {}
+    stack: List[Tuple[bool, str, Tuple[IgnoreRules, ...]]] = []
+    for rel_dir, chain in sorted(starts, key=lambda start: start[0] + "/", reverse=True):
+        pending[rel_dir] = executor.submit(list_dir, rel_dir)
+        stack.append((True, rel_dir, chain))
+
+    files: List[str] = []
+    try:
+        while stack:
+            is_dir, rel, chain = stack.pop()
+            if not is_dir:
+                files.append(rel)
+                if visit is not None:
+                    visit(rel)
+                if limit is not None and len(files) >= limit:
+                    break
+                continue
+            if stop is not None and stop():
+                break
+            entries = pending.pop(rel).result()
+            if not entries:
+                continue
+            if ignores is not None:
+                names = [name for name, child_is_dir in entries if not child_is_dir and name in IGNORE_FILES]
+                if names:
+                    chain, found = ignores.extend(chain, os.path.join(root, rel) if rel else root, rel, names)
+                    if seen is not None:
+                        seen.extend(found)
+            prefix = rel + "/" if rel else ""
+            children: List[Tuple[bool, str, Tuple[IgnoreRules, ...]]] = []
+            for name, child_is_dir in entries:
+                if not include_hidden and name.startswith("."):
+                    continue
+                child = prefix + name
+                if child_is_dir:
+                    if name in exclude_dir_set or (chain and is_ignored(chain, child, True)):
+                        continue
+                    pending[child] = executor.submit(list_dir, child)
+                elif (chain and is_ignored(chain, child, False)) or (exclude and exclude.match(child)):
+                    continue
+                children.append((child_is_dir, child, chain))
+            stack.extend(reversed(children))
+    finally:
+        for future in pending.values():
+            future.cancel()
+        wait(list(pending.values()))
+    return files
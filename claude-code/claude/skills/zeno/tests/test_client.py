@@ -0,0 +1,34 @@
+import json
+import subprocess
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SCRIPT = str(ROOT / "scripts" / "zeno_client.py")
+
+
+def test_run_plan_answers_in_plan_order():
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as plandir:
+        base = Path(tmpdir)
+        (base / "app.py").write_text("def run():\n    return 1\n", encoding="utf-8")
+        (base / "util.py").write_text("def helper():\n    pass\n", encoding="utf-8")
+        plan = [
+            {"id": "p1", "op": "grep", "args": {"pattern": "def ", "stream": True}, "purpose": "defs"},
+            {"id": "p2", "op": "list_files", "args": {}},
+            {"id": "p3", "op": "read_file", "args": {"path": "missing.py"}},
+            {"id": "p4", "op": "extract_symbols", "args": {"path": "app.py"}},
+        ]
+        plan_path = Path(plandir) / "plan.jsonl"
+        plan_path.write_text("".join(json.dumps(op) + "\n" for op in plan), encoding="utf-8")
+        result = subprocess.run(
+            ["python3", SCRIPT, "run", "--plan", str(plan_path), "--root", str(base), "--spawn", "--depth", "2"],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 1
+        responses = [json.loads(line) for line in result.stdout.splitlines()]
+        assert [r["id"] for r in responses] == ["p1", "p2", "p3", "p4"]
+        assert len(responses[0]["result"]["hits"]) == 2
+        assert responses[2]["ok"] is False
+        assert "4 ops, 1 errors" in result.stderr
+        assert "extract_symbols" in result.stderr
@@ -0,0 +1,41 @@
+import json
+import subprocess
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SCRIPT = str(ROOT / "scripts" / "zeno_index.py")
+
+
+def test_index_basic():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        src = base / "src"
+        src.mkdir()
+        (src / "app.py").write_text("""\nimport os\n\nclass Demo:\n    pass\n\n\ndef run():\n    return 1\n""", encoding="utf-8")
+        out_path = base / "index.json"
+        result = subprocess.run(
+            ["python3", SCRIPT, "--root", str(base), "--out", str(out_path)],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0
+        data = json.loads(out_path.read_text(encoding="utf-8"))
+        assert data["stats"]["symbols"] >= 2
+        assert data["stats"]["imports"] >= 1
+
+
+def test_index_honors_gitignore():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        (base / "gen").mkdir()
+        (base / "gen" / "api.py").write_text("def generated():\n    pass\n", encoding="utf-8")
+        (base / "app.py").write_text("def run():\n    pass\n", encoding="utf-8")
+        (base / ".gitignore").write_text("gen/\n", encoding="utf-8")
+        paths = {}
+        for flag in ([], ["--no-ignore"]):
+            result = subprocess.run(["python3", SCRIPT, "--root", str(base)] + flag, capture_output=True, text=True)
+            assert result.returncode == 0, result.stderr
+            paths[bool(flag)] = {sym["path"] for sym in json.loads(result.stdout)["symbols"]}
+        assert paths[False] == {"app.py"}
+        assert paths[True] == {"app.py", "gen/api.py"}
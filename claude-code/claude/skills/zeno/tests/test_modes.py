@@ -1,5 +1,6 @@
 import json
 import subprocess
+import tempfile
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -27,3 +28,23 @@ def test_modes_plan_jsonl():
     payload = json.loads(lines[0])
     assert "op" in payload
     assert "args" in payload
+
+
+def test_modes_security_plan_multi():
+    # This skill ships no default security pack, so pass one explicitly.
+    patterns = [
+        {"id": "py-eval", "pattern": "eval(", "regex": False, "globs": ["**/*.py"]},
+        {"id": "js-eval", "pattern": "eval(", "regex": False, "globs": ["**/*.js"]},
+    ]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pack = Path(tmpdir) / "pack.json"
+        pack.write_text(json.dumps({"version": "1.0", "patterns": patterns}), encoding="utf-8")
+        result = subprocess.run(
+            ["python3", SCRIPT, "plan", "--mode", "security-audit", "--multi", "--pack", str(pack), "--format", "jsonl"],
+            capture_output=True,
+            text=True,
+        )
+    assert result.returncode == 0
+    ops = [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+    assert [op["op"] for op in ops] == ["list_files", "grep_multi"]
+    assert len(ops[1]["args"]["patterns"]) > 1
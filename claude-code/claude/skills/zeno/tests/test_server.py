@@ -0,0 +1,1135 @@
+import json
+import os
+import pstats
+import stat
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SCRIPT = str(ROOT / "scripts" / "zeno_server.py")
+
+
+def _run(root: Path, requests, extra_args=None):
+    payload = "".join(json.dumps(req) + "\n" for req in requests)
+    cmd = ["python3", SCRIPT, "--root", str(root)] + list(extra_args or [])
+    result = subprocess.run(cmd, input=payload, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+
+
+class _Session:
+    def __init__(self, root: Path, extra_args=None) -> None:
+        cmd = ["python3", SCRIPT, "--root", str(root)] + list(extra_args or [])
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+    def request(self, req):
+        self.proc.stdin.write(json.dumps(req) + "\n")
+        self.proc.stdin.flush()
+        return json.loads(self.proc.stdout.readline())
+
+    def close(self) -> None:
+        self.proc.stdin.close()
+        self.proc.wait(timeout=10)
+
+
+def _make_tree(base: Path) -> None:
+    (base / "src" / "pkg").mkdir(parents=True)
+    (base / "node_modules").mkdir()
+    (base / "src" / "app.py").write_text("import os\n\ndef run():\n    return os.getcwd()\n", encoding="utf-8")
+    (base / "src" / "pkg" / "util.py").write_text("def helper():\n    return 1\n", encoding="utf-8")
+    (base / "README.md").write_text("# Demo\n", encoding="utf-8")
+    (base / ".hidden").write_text("secret\n", encoding="utf-8")
+    (base / "node_modules" / "dep.js").write_text("module.exports = {}\n", encoding="utf-8")
+
+
+def test_list_files_reuses_inventory():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        first, second = _run(
+            base,
+            [
+                {"id": "r1", "op": "list_files", "args": {}},
+                {"id": "r2", "op": "list_files", "args": {}},
+            ],
+        )
+        assert first["result"]["files"] == ["README.md", "src/app.py", "src/pkg/util.py"]
+        assert first["result"]["metrics"]["files_scanned"] > 0
+        assert second["result"]["files"] == first["result"]["files"]
+        assert second["result"]["metrics"]["files_scanned"] == 0
+
+
+def test_inventory_picks_up_new_files():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        session = _Session(base)
+        try:
+            first = session.request({"id": "r1", "op": "list_files", "args": {"glob": "src/*"}})
+            assert "src/new.py" not in first["result"]["files"]
+            (base / "src" / "new.py").write_text("x = 1\n", encoding="utf-8")
+            second = session.request({"id": "r2", "op": "list_files", "args": {"glob": "src/*"}})
+            assert "src/new.py" in second["result"]["files"]
+        finally:
+            session.close()
+
+
+def test_read_file_slices_with_line_index():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        lines = [f"line {idx}" for idx in range(1, 101)]
+        (base / "big.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        (base / "crlf.txt").write_bytes(b"a\r\nb\r\nc")
+        first, second, crlf, past_end = _run(
+            base,
+            [
+                {"id": "r1", "op": "read_file", "args": {"path": "big.txt", "start_line": 10, "end_line": 12}},
+                {"id": "r2", "op": "read_file", "args": {"path": "big.txt", "start_line": 99, "end_line": 150}},
+                {"id": "r3", "op": "read_file", "args": {"path": "crlf.txt", "start_line": 1, "end_line": 3}},
+                {"id": "r4", "op": "read_file", "args": {"path": "big.txt", "start_line": 200}},
+            ],
+        )
+        assert first["result"]["text"] == "line 10\nline 11\nline 12"
+        assert first["result"]["total_lines"] == 100
+        assert second["result"]["text"] == "line 99\nline 100"
+        assert second["result"]["end_line"] == 100
+        assert second["result"]["metrics"]["bytes_read"] < first["result"]["metrics"]["bytes_read"]
+        assert crlf["result"]["text"] == "a\nb\nc"
+        assert crlf["result"]["total_lines"] == 3
+        assert past_end["result"]["text"] == ""
+        assert past_end["result"]["end_line"] == 100
+
+
+def test_peek_reads_head_and_tail():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        lines = [f"row {idx}" for idx in range(1, 20001)]
+        (base / "log.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        (base / "short.txt").write_text("one\ntwo\nthree", encoding="utf-8")
+        (base / "empty.txt").write_text("", encoding="utf-8")
+        lazy, full, short, empty, no_head, _, indexed = _run(
+            base,
+            [
+                {
+                    "id": "p1",
+                    "op": "peek",
+                    "args": {"path": "log.txt", "head_lines": 2, "tail_lines": 3, "count_lines": False},
+                },
+                {"id": "p2", "op": "peek", "args": {"path": "log.txt", "head_lines": 2, "tail_lines": 3}},
+                {"id": "p3", "op": "peek", "args": {"path": "short.txt", "head_lines": 2, "tail_lines": 2}},
+                {"id": "p4", "op": "peek", "args": {"path": "empty.txt"}},
+                {"id": "p5", "op": "peek", "args": {"path": "short.txt", "head_lines": 0, "tail_lines": 0}},
+                {"id": "r1", "op": "read_file", "args": {"path": "log.txt"}},
+                {"id": "p6", "op": "peek", "args": {"path": "log.txt", "head_lines": 1, "tail_lines": 1}},
+            ],
+        )
+        result = full["result"]
+        assert result["total_lines"] == 20000
+        assert result["head"]["text"] == "row 1\nrow 2"
+        assert result["tail"] == {"start_line": 19998, "end_line": 20000, "text": "row 19998\nrow 19999\nrow 20000"}
+        assert lazy["result"]["total_lines"] is None
+        assert lazy["result"]["tail"]["text"] == "row 19998\nrow 19999\nrow 20000"
+        assert lazy["result"]["metrics"]["bytes_read"] < 100_000
+        assert short["result"]["total_lines"] == 3
+        assert short["result"]["tail"] == {"start_line": 2, "end_line": 3, "text": "two\nthree"}
+        empty_result = empty["result"]
+        assert empty_result["total_lines"] == 0
+        assert empty_result["head"] == empty_result["tail"] == {"start_line": 0, "end_line": 0, "text": ""}
+        assert no_head["result"]["head"] == no_head["result"]["tail"] == {"start_line": 0, "end_line": 0, "text": ""}
+        assert no_head["result"]["total_lines"] == 3
+        assert indexed["result"]["total_lines"] == 20000
+        assert indexed["result"]["tail"] == {"start_line": 20000, "end_line": 20000, "text": "row 20000"}
+
+
+def test_parallel_grep_matches_sequential():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for idx in range(120):
+            body = "".join(f"value {idx}-{n}\n" for n in range(5))
+            if idx % 7 == 0:
+                body += "TODO: fix me\n"
+            (base / f"file_{idx:03d}.txt").write_text(body, encoding="utf-8")
+        args = {"pattern": "TODO", "context": 1, "max_hits": 10}
+        sequential, parallel = _run(
+            base,
+            [
+                {"id": "g1", "op": "grep", "args": args},
+                {"id": "g2", "op": "grep", "args": dict(args, parallel=True)},
+            ],
+            ["--workers", "3"],
+        )
+        assert parallel["result"]["hits"] == sequential["result"]["hits"]
+        assert parallel["result"]["truncated"] is True
+        assert parallel["result"]["metrics"]["files_scanned"] == sequential["result"]["metrics"]["files_scanned"]
+        workers = parallel["result"]["metrics"]["workers"]
+        assert workers and all("bytes_read" in item and "time_ms" in item for item in workers)
+
+
+def test_grep_byte_prefilter_semantics():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        (base / "a.py").write_bytes(b"first\r\nToken = 1\r\nlast token\r\n")
+        (base / "b.py").write_text("nothing here\n", encoding="utf-8")
+        (base / "c.py").write_text("x = 1\n\ndef handler():\n    pass\n", encoding="utf-8")
+        insensitive, anchored, context, empty = _run(
+            base,
+            [
+                {"id": "g1", "op": "grep", "args": {"pattern": "TOKEN", "case_sensitive": False}},
+                {"id": "g2", "op": "grep", "args": {"pattern": "token$", "regex": True}},
+                {"id": "g3", "op": "grep", "args": {"pattern": r"def \w+\(", "regex": True, "context": 1}},
+                {"id": "g4", "op": "grep", "args": {"pattern": "^$", "regex": True, "paths": ["a.py", "c.py"]}},
+            ],
+        )
+        assert [(h["path"], h["line"], h["text"]) for h in insensitive["result"]["hits"]] == [
+            ("a.py", 2, "Token = 1"),
+            ("a.py", 3, "last token"),
+        ]
+        assert [(h["path"], h["line"]) for h in anchored["result"]["hits"]] == [("a.py", 3)]
+        hit = context["result"]["hits"][0]
+        assert (hit["path"], hit["line"]) == ("c.py", 3)
+        assert hit["context"] == [
+            {"line": 2, "text": ""},
+            {"line": 3, "text": "def handler():"},
+            {"line": 4, "text": "    pass"},
+        ]
+        assert [(h["path"], h["line"]) for h in empty["result"]["hits"]] == [("c.py", 2)]
+
+
+def test_grep_narrows_candidates_with_trigram_index():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        repo = base / "repo"
+        repo.mkdir()
+        for idx in range(10):
+            (repo / f"mod_{idx}.py").write_text(f"def func_{idx}():\n    return {idx}\n", encoding="utf-8")
+        (repo / "target.py").write_text("SECRET_TOKEN = 'x'\n", encoding="utf-8")
+        out_path = base / "index.json"
+        index_script = str(ROOT / "scripts" / "zeno_index.py")
+        built = subprocess.run(
+            ["python3", index_script, "--root", str(repo), "--out", str(out_path), "--trigrams"],
+            capture_output=True,
+            text=True,
+        )
+        assert built.returncode == 0, built.stderr
+        trigram_path = base / "index.json.trigrams"
+        assert trigram_path.exists()
+
+        (repo / "mod_3.py").write_text("secret_token = None\n", encoding="utf-8")
+        narrowed, short = _run(
+            repo,
+            [
+                {"id": "g1", "op": "grep", "args": {"pattern": "secret_token", "case_sensitive": False}},
+                {"id": "g2", "op": "grep", "args": {"pattern": "re"}},
+            ],
+            ["--trigram-index", str(trigram_path)],
+        )
+        metrics = narrowed["result"]["metrics"]
+        assert [h["path"] for h in narrowed["result"]["hits"]] == ["mod_3.py", "target.py"]
+        assert metrics["index_used"] is True
+        assert metrics["candidates"] == 2
+        assert metrics["files_scanned"] == 2
+        assert short["result"]["metrics"]["index_used"] is False
+        assert short["result"]["metrics"]["candidates"] == 11
+
+
+def test_grep_multi_tags_hits_and_caps_per_pattern():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        (base / "src").mkdir()
+        (base / "src" / "run.py").write_text(
+            "import subprocess\nresult = eval(data)\nexec(code); eval(more)\n",
+            encoding="utf-8",
+        )
+        (base / "src" / "web.js").write_text("el.innerHTML = html;\neval(x)\n", encoding="utf-8")
+        (response,) = _run(
+            base,
+            [
+                {
+                    "id": "m1",
+                    "op": "grep_multi",
+                    "args": {
+                        "patterns": [
+                            {"id": "py-eval", "pattern": "eval(", "globs": ["**/*.py"], "max_hits": 1},
+                            {"id": "py-exec", "pattern": r"\bexec\(", "regex": True, "globs": ["**/*.py"]},
+                            {"id": "js-html", "pattern": "innerhtml", "case_sensitive": False, "globs": ["**/*.js"]},
+                        ]
+                    },
+                }
+            ],
+        )
+        result = response["result"]
+        assert [(h["pattern_id"], h["path"], h["line"]) for h in result["hits"]] == [
+            ("py-eval", "src/run.py", 2),
+            ("py-exec", "src/run.py", 3),
+            ("js-html", "src/web.js", 1),
+        ]
+        assert result["patterns"][0] == {"id": "py-eval", "hits": 1, "truncated": True}
+        assert result["truncated"] is True
+        assert result["metrics"]["files_scanned"] == 2
+
+
+def test_concurrent_mode_answers_out_of_order_and_ordered():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        (base / "data").mkdir()
+        chunk = "".join(f"entry {n} value\n" for n in range(4000))
+        for idx in range(60):
+            (base / "data" / f"part_{idx:02d}.log").write_text(chunk, encoding="utf-8")
+        (base / "small.txt").write_text("hello\n", encoding="utf-8")
+        requests = [
+            {"id": "slow", "op": "grep", "args": {"pattern": r"[xyz]{3}\d", "regex": True}},
+            {"id": "fast", "op": "stat", "args": {"path": "small.txt"}},
+            "not json",
+        ]
+        payload = "".join((req if isinstance(req, str) else json.dumps(req)) + "\n" for req in requests)
+
+        def run(extra):
+            cmd = ["python3", SCRIPT, "--root", str(base), "--concurrency", "4"] + extra
+            result = subprocess.run(cmd, input=payload, capture_output=True, text=True)
+            assert result.returncode == 0, result.stderr
+            return [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+
+        unordered = run([])
+        assert {resp["id"] for resp in unordered} == {"slow", "fast", None}
+        assert [resp["id"] for resp in unordered].index("fast") < [resp["id"] for resp in unordered].index("slow")
+        ordered = run(["--ordered"])
+        assert [resp["id"] for resp in ordered] == ["slow", "fast", None]
+        assert ordered[0]["ok"] and ordered[1]["ok"] and not ordered[2]["ok"]
+
+
+def test_batch_runs_sub_requests_in_one_round_trip():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        sub_requests = [
+            {"id": "b1", "op": "read_file", "args": {"path": "src/app.py", "start_line": 1, "end_line": 1}},
+            {"id": "b2", "op": "read_file", "args": {"path": "src/app.py", "start_line": 3, "end_line": 4}},
+            {"id": "b3", "op": "stat", "args": {"path": "README.md"}},
+            {"id": "b4", "op": "peek", "args": {"path": "src/pkg/util.py", "head_lines": 1, "tail_lines": 1}},
+            {"id": "b5", "op": "list_files", "args": {"glob": "src/*"}},
+            {"id": "b6", "op": "grep", "args": {"pattern": "helper"}},
+            {"id": "b7", "op": "nope"},
+        ]
+        (response,) = _run(base, [{"id": "batch-1", "op": "batch", "args": {"requests": sub_requests}}])
+        result = response["result"]
+        assert [item["id"] for item in result["results"]] == ["b1", "b2", "b3", "b4", "b5", "b6", "b7"]
+        by_id = {item["id"]: item for item in result["results"]}
+        assert by_id["b1"]["result"]["text"] == "import os"
+        assert by_id["b2"]["result"]["text"] == "def run():\n    return os.getcwd()"
+        assert by_id["b4"]["result"]["tail"]["text"] == "    return 1"
+        assert by_id["b6"]["result"]["metrics"]["hits"] == 1
+        assert by_id["b7"]["ok"] is False
+        assert result["metrics"]["requests"] == 7
+        assert result["metrics"]["errors"] == 1
+
+
+def test_streaming_grep_emits_partial_frames():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for idx in range(3):
+            (base / f"f{idx}.txt").write_text("alpha\nneedle here\nomega needle\n", encoding="utf-8")
+        frames = _run(
+            base,
+            [
+                {"id": "s1", "op": "grep", "args": {"pattern": "needle", "stream": True, "max_hits": 5}},
+                {"id": "s2", "op": "list_files", "args": {"stream": True}},
+            ],
+        )
+        grep_frames = [frame for frame in frames if frame["id"] == "s1"]
+        partials = [frame for frame in grep_frames if frame.get("partial")]
+        final = grep_frames[-1]
+        assert [len(frame["hits"]) for frame in partials] == [2, 2, 1]
+        assert final["ok"] is True and "partial" not in final
+        assert final["result"]["truncated"] is True
+        assert final["result"]["streamed"] is True
+        assert final["result"]["metrics"]["hits"] == 5
+        list_frames = [frame for frame in frames if frame["id"] == "s2"]
+        assert list_frames[0] == {"id": "s2", "partial": True, "files": ["f0.txt", "f1.txt", "f2.txt"]}
+        assert list_frames[-1]["result"]["metrics"]["files"] == 3
+
+
+def test_result_cache_hits_until_files_change():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        past = time.time() - 60
+        for path in [base, *base.rglob("*")]:
+            os.utime(path, (past, past))
+        session = _Session(base)
+        try:
+            req = {"op": "grep", "args": {"pattern": "def "}}
+            first = session.request({"id": "r1", **req})
+            second = session.request({"id": "r2", **req})
+            assert first["result"]["metrics"]["cache_hit"] is False
+            assert second["result"]["metrics"]["cache_hit"] is True
+            assert second["result"]["hits"] == first["result"]["hits"]
+            assert second["result"]["metrics"]["bytes_read"] == 0
+
+            (base / "src" / "pkg" / "util.py").write_text("def helper():\n    return 2\ndef other():\n", encoding="utf-8")
+            third = session.request({"id": "r3", **req})
+            assert third["result"]["metrics"]["cache_hit"] is False
+            assert len(third["result"]["hits"]) == len(first["result"]["hits"]) + 1
+        finally:
+            session.close()
+
+
+def test_daemon_serves_client_connections():
+    client = str(ROOT / "scripts" / "zeno_client.py")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir) / "root"
+        base.mkdir()
+        _make_tree(base)
+        sock_path = Path(tmpdir) / "zeno.sock"
+        daemon = subprocess.Popen(
+            ["python3", SCRIPT, "--root", str(base), "--listen", f"unix:{sock_path}"],
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            assert "listening" in daemon.stderr.readline()
+            send = ["python3", client, "send", "--root", str(base), "--connect", f"unix:{sock_path}"]
+            responses = []
+            for idx in range(2):
+                result = subprocess.run(
+                    send + ["--id", f"r{idx}", "--op", "grep", "--args", '{"pattern": "def "}'],
+                    capture_output=True,
+                    text=True,
+                )
+                assert result.returncode == 0, result.stderr
+                responses.append(json.loads(result.stdout))
+            assert [r["id"] for r in responses] == ["r0", "r1"]
+            assert responses[0]["result"]["hits"] == responses[1]["result"]["hits"]
+            assert len(responses[0]["result"]["hits"]) == 2
+
+            other = Path(tmpdir) / "other"
+            other.mkdir()
+            (other / "notes.py").write_text("def other():\n    pass\n", encoding="utf-8")
+            grep = ["--op", "grep", "--args", '{"pattern": "def "}']
+            wrong = subprocess.run(
+                ["python3", client, "send", "--root", str(other), "--connect", f"unix:{sock_path}"] + grep,
+                capture_output=True,
+                text=True,
+            )
+            assert wrong.returncode != 0 and "serves" in wrong.stderr
+            local = subprocess.run(
+                ["python3", client, "send", "--root", str(other)] + grep,
+                capture_output=True,
+                text=True,
+                env={**os.environ, "ZENO_SERVER": f"unix:{sock_path}"},
+            )
+            assert local.returncode == 0, local.stderr
+            assert [hit["path"] for hit in json.loads(local.stdout)["result"]["hits"]] == ["notes.py"]
+        finally:
+            daemon.terminate()
+            daemon.wait(timeout=10)
+        assert not sock_path.exists()
+
+        fallback = subprocess.run(
+            ["python3", client, "send", "--root", str(base), "--spawn", "--op", "stat", "--args", '{"path": "README.md"}'],
+            capture_output=True,
+            text=True,
+        )
+        assert fallback.returncode == 0, fallback.stderr
+        assert json.loads(fallback.stdout)["ok"] is True
+
+
+def test_list_files_filters_by_regex():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        (response,) = _run(base, [{"id": "r1", "op": "list_files", "args": {"regex": r"\.py$"}}])
+        assert response["ok"], response
+        assert response["result"]["files"] == ["src/app.py", "src/pkg/util.py"]
+
+
+def test_glob_semantics_for_paths_and_excludes():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        (base / "setup.py").write_text("def setup():\n    pass\n", encoding="utf-8")
+        path = {"glob_syntax": "path"}
+        responses = _run(
+            base,
+            [
+                {"id": "r1", "op": "grep", "args": {"pattern": "def ", "paths": ["**/*.py"], **path}},
+                {"id": "r2", "op": "list_files", "args": {"glob": "src/*", **path}},
+                {"id": "r3", "op": "list_files", "args": {"exclude_globs": ["*.py"], **path}},
+                {"id": "r4", "op": "list_files", "args": {"glob": "app.py", **path}},
+                {"id": "f1", "op": "grep", "args": {"pattern": "def ", "paths": ["**/*.py"]}},
+                {"id": "f2", "op": "list_files", "args": {"glob": "src/*"}},
+                {"id": "f3", "op": "list_files", "args": {"exclude_globs": ["*.py"]}},
+                {"id": "f4", "op": "list_files", "args": {"glob": "app.py"}},
+                {"id": "f5", "op": "grep_multi", "args": {"patterns": [{"pattern": "def ", "globs": ["src/*.py"]}]}},
+                {"id": "e1", "op": "list_files", "args": {"glob_syntax": "regex"}},
+            ],
+        )
+        star, one_level, excluded, name_only = (response["result"] for response in responses[:4])
+        assert sorted({hit["path"] for hit in star["hits"]}) == ["setup.py", "src/app.py", "src/pkg/util.py"]
+        assert one_level["files"] == ["src/app.py"]
+        assert excluded["files"] == ["README.md"]
+        assert name_only["files"] == ["src/app.py"]
+        # The default fnmatch syntax: `*` crosses `/` and patterns match the whole path.
+        star, one_level, excluded, name_only, multi = (response["result"] for response in responses[4:9])
+        assert sorted({hit["path"] for hit in star["hits"]}) == ["src/app.py", "src/pkg/util.py"]
+        assert one_level["files"] == ["src/app.py", "src/pkg/util.py"]
+        assert excluded["files"] == ["README.md"]
+        assert name_only["files"] == []
+        assert [hit["path"] for hit in multi["hits"]] == ["src/app.py", "src/pkg/util.py"]
+        assert not responses[9]["ok"] and "glob_syntax" in responses[9]["error"]["message"]
+
+
+def test_brace_globs_and_prefix_pruned_walk():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        (base / "src" / "notes.md").write_text("# Notes\n", encoding="utf-8")
+        pruned, braces = _run(
+            base,
+            [
+                {"id": "r1", "op": "list_files", "args": {"glob": "src/**/*.{py,md}", "glob_syntax": "path"}},
+                {"id": "r2", "op": "grep", "args": {"pattern": "#", "paths": ["**/*.{md,txt}"], "glob_syntax": "path"}},
+            ],
+        )
+        assert pruned["result"]["files"] == ["src/app.py", "src/notes.md", "src/pkg/util.py"]
+        # Only the src subtree was listed: three files, not README.md or .hidden.
+        assert pruned["result"]["metrics"]["files_scanned"] == 3
+        assert [hit["path"] for hit in braces["result"]["hits"]] == ["README.md", "src/notes.md"]
+
+
+def test_walk_honors_gitignore_and_zenoignore():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        (base / ".gitignore").write_text("gen/\n*.log\n!keep.log\n", encoding="utf-8")
+        (base / "src" / ".zenoignore").write_text("generated.py\n", encoding="utf-8")
+        (base / "gen").mkdir()
+        (base / "gen" / "out.js").write_text("x\n", encoding="utf-8")
+        (base / "debug.log").write_text("x\n", encoding="utf-8")
+        (base / "keep.log").write_text("x\n", encoding="utf-8")
+        (base / "src" / "generated.py").write_text("x = 1\n", encoding="utf-8")
+        session = _Session(base)
+        try:
+            first = session.request({"id": "r1", "op": "list_files", "args": {}})
+            assert first["result"]["files"] == ["README.md", "keep.log", "src/app.py", "src/pkg/util.py"]
+            raw = session.request({"id": "r2", "op": "list_files", "args": {"no_ignore": True}})
+            assert "gen/out.js" in raw["result"]["files"]
+            assert "src/generated.py" in raw["result"]["files"]
+
+            (base / ".gitignore").write_text("gen/\n", encoding="utf-8")
+            edited = session.request({"id": "r3", "op": "list_files", "args": {"glob": "**/*.log", "glob_syntax": "path"}})
+            assert edited["result"]["files"] == ["debug.log", "keep.log"]
+        finally:
+            session.close()
+
+
+def test_git_inventory_matches_walker():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        (base / ".gitignore").write_text("*.log\n", encoding="utf-8")
+        (base / "gone.py").write_text("x = 1\n", encoding="utf-8")
+        git = ["git", "-C", str(base), "-c", "user.name=zeno", "-c", "user.email=zeno@example.com"]
+        subprocess.run(git + ["init", "-q"], check=True)
+        subprocess.run(git + ["add", "src", "gone.py", ".gitignore"], check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "init"], check=True)
+        (base / "gone.py").unlink()
+        (base / "debug.log").write_text("x\n", encoding="utf-8")
+        request = [{"id": "r1", "op": "list_files", "args": {}}]
+        expected = ["README.md", "src/app.py", "src/pkg/util.py"]
+        assert _run(base, request)[0]["result"]["files"] == expected
+        assert _run(base, request, ["--git", "off"])[0]["result"]["files"] == expected
+        assert _run(base, request, ["--git", "tracked"])[0]["result"]["files"] == ["src/app.py", "src/pkg/util.py"]
+
+
+def test_session_budget_cuts_scans_and_refuses_ops():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for name in "abcde":
+            (base / f"{name}.py").write_text("x = 1\nx = 2\n", encoding="utf-8")
+        grep = {"op": "grep", "args": {"pattern": "x ="}}
+        responses = _run(
+            base,
+            [
+                {"id": "s1", "op": "session", "args": {}},
+                dict(grep, id="g1"),
+                {"id": "r1", "op": "read_file", "args": {"path": "a.py"}},
+                {"id": "s2", "op": "session", "args": {"budget": {"ops": 3, "bytes": 30}}},
+                dict(grep, id="g2"),
+                {"id": "s3", "op": "session", "args": {"reset": True}},
+                {"id": "l1", "op": "list_files", "args": {}},
+                {"id": "l2", "op": "stat", "args": {"path": "a.py"}},
+                {"id": "l3", "op": "stat", "args": {"path": "b.py"}},
+                {"id": "l4", "op": "stat", "args": {"path": "c.py"}},
+            ],
+            ["--budget", "ops=5,lines=3"],
+        )
+        by_id = {response["id"]: response for response in responses}
+        assert by_id["s1"]["result"]["budget"]["lines"] == {"limit": 3, "used": 0, "remaining": 3}
+        # Two hits from a.py and one of b.py's fit in three lines.
+        cut = by_id["g1"]["result"]
+        assert [(hit["path"], hit["line"]) for hit in cut["hits"]] == [("a.py", 1), ("a.py", 2), ("b.py", 1)]
+        assert cut["budget_exhausted"] == "lines" and cut["truncated"] is True
+        assert by_id["r1"]["error"]["budget_exhausted"] == "lines"
+        # The byte budget stops the scan after the file that crosses it.
+        scanned = by_id["g2"]["result"]
+        assert scanned["budget_exhausted"] == "bytes"
+        assert scanned["metrics"]["files_scanned"] == 3 and scanned["metrics"]["cache_hit"] is False
+        assert [by_id[rid]["ok"] for rid in ("l1", "l2", "l3", "l4")] == [True, True, True, False]
+        assert by_id["l4"]["error"]["budget_exhausted"] == "ops"
+
+
+def test_walk_caps_max_files_in_path_order():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for rel in ["a/x.py", "a-b.py", "a.txt", "b/c/d.py", "b/e.py", "skip.py", "z.py"]:
+            (base / rel).parent.mkdir(parents=True, exist_ok=True)
+            (base / rel).write_text("x = 1\n", encoding="utf-8")
+        full, capped, excluded, regex = _run(
+            base,
+            [
+                {"id": "r1", "op": "list_files", "args": {}},
+                {"id": "r2", "op": "list_files", "args": {"max_files": 4}},
+                {"id": "r3", "op": "list_files", "args": {"max_files": 4, "exclude_globs": ["a-b.py", "skip.py"]}},
+                {"id": "r4", "op": "list_files", "args": {"regex": r"\.py$", "max_files": 3}},
+            ],
+        )
+        ordered = ["a-b.py", "a.txt", "a/x.py", "b/c/d.py", "b/e.py", "skip.py", "z.py"]
+        assert full["result"]["files"] == ordered
+        assert capped["result"]["files"] == ordered[:4]
+        # Excluded paths do not count toward the cap.
+        assert excluded["result"]["files"] == ["a.txt", "a/x.py", "b/c/d.py", "b/e.py"]
+        assert regex["result"]["files"] == ["a-b.py", "a/x.py"]
+
+
+def test_deadline_and_cancel_stop_scans():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        expired, full = _run(
+            base,
+            [
+                {"id": "r1", "op": "grep", "args": {"pattern": "def ", "deadline_ms": 0}},
+                {"id": "r2", "op": "grep", "args": {"pattern": "def "}},
+            ],
+        )
+        assert expired["result"]["timed_out"] is True and expired["result"]["truncated"] is True
+        assert expired["result"]["hits"] == []
+        # The timed-out result was not cached.
+        assert len(full["result"]["hits"]) == 2 and full["result"]["metrics"]["cache_hit"] is False
+
+        slow = base / "slow"
+        slow.mkdir()
+        for idx in range(100):
+            # Catastrophic backtracking makes each file take tens of milliseconds.
+            (slow / f"f{idx:03d}.txt").write_text("a" * 18 + "b\n", encoding="utf-8")
+        session = _Session(base, ["--concurrency", "2"])
+        try:
+            slow_grep = {"id": "g1", "op": "grep", "args": {"pattern": "(a+)+$", "regex": True, "paths": ["slow/*"]}}
+            session.proc.stdin.write(json.dumps(slow_grep) + "\n")
+            session.proc.stdin.flush()
+            time.sleep(0.3)
+            responses = [session.request({"id": "c1", "op": "cancel", "args": {"id": "g1"}})]
+            responses.append(json.loads(session.proc.stdout.readline()))
+        finally:
+            session.close()
+        by_id = {response["id"]: response for response in responses}
+        assert by_id["c1"]["result"]["found"] is True
+        cancelled = by_id["g1"]["result"]
+        assert cancelled["cancelled"] is True and cancelled["truncated"] is True
+        assert cancelled["metrics"]["files_scanned"] < 100
+
+
+
+def test_cancel_reaches_requests_beyond_the_concurrency_limit():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        slow = base / "slow"
+        slow.mkdir()
+        for idx in range(100):
+            (slow / f"f{idx:03d}.txt").write_text("a" * 18 + "b\n", encoding="utf-8")
+        session = _Session(base, ["--concurrency", "2"])
+        try:
+            slow_args = {"pattern": "(a+)+$", "regex": True, "paths": ["slow/*"]}
+            for req_id in ("g1", "g2", "g3"):
+                session.proc.stdin.write(json.dumps({"id": req_id, "op": "grep", "args": slow_args}) + "\n")
+            session.proc.stdin.flush()
+            time.sleep(0.3)
+            # Both slots are busy; stats and cancel are still read and answered at once.
+            session.proc.stdin.write(json.dumps({"id": "s1", "op": "stats", "args": {}}) + "\n")
+            for req_id in ("g3", "g1", "g2"):
+                cancel = {"id": f"c-{req_id}", "op": "cancel", "args": {"id": req_id}}
+                session.proc.stdin.write(json.dumps(cancel) + "\n")
+            session.proc.stdin.flush()
+            responses = [json.loads(session.proc.stdout.readline()) for _ in range(7)]
+        finally:
+            session.close()
+        by_id = {response["id"]: response for response in responses}
+        assert by_id["s1"]["ok"] is True
+        assert all(by_id[f"c-{req_id}"]["result"]["found"] for req_id in ("g1", "g2", "g3"))
+        assert by_id["g3"]["ok"] is False and by_id["g3"]["error"]["cancelled"] is True
+        for req_id in ("g1", "g2"):
+            assert by_id[req_id]["result"]["cancelled"] is True
+            assert by_id[req_id]["result"]["metrics"]["files_scanned"] < 100
+
+
+def test_hello_switches_codec_and_escaping():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        (base / "notes.txt").write_text("naïve ✓ \\xe9 \U0001f600\n", encoding="utf-8")
+        read = {"op": "read_file", "args": {"path": "notes.txt"}}
+        proc = subprocess.Popen(["python3", SCRIPT, "--root", str(base)], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+
+            def send_line(req):
+                proc.stdin.write(json.dumps(req).encode("utf-8") + b"\n")
+                proc.stdin.flush()
+                return proc.stdout.readline()
+
+            escaped = send_line(dict(read, id="r1"))
+            assert b"na\\u00efve \\u2713 \\\\xe9 \\ud83d\\ude00" in escaped
+            assert json.loads(escaped)["result"]["text"] == "naïve ✓ \\xe9 \U0001f600"
+            hello_args = {"codec": ["msgpack", "json"], "ascii": False}
+            hello = json.loads(send_line({"id": "h1", "op": "hello", "args": hello_args}))
+            codec = hello["result"]["codec"]
+            assert codec == ("msgpack" if "msgpack" in hello["result"]["codecs"] else "json")
+            if codec == "msgpack":
+                import msgpack
+
+                payload = msgpack.packb(dict(read, id="r2"))
+                proc.stdin.write(len(payload).to_bytes(4, "big") + payload)
+                proc.stdin.flush()
+                size = int.from_bytes(proc.stdout.read(4), "big")
+                response = msgpack.unpackb(proc.stdout.read(size))
+                assert response["result"]["text"] == "naïve ✓ \\xe9 \U0001f600"
+            else:
+                assert "naïve ✓".encode("utf-8") in send_line(dict(read, id="r2"))
+        finally:
+            proc.stdin.close()
+            proc.wait(timeout=10)
+
+
+def test_log_writer_batches_and_rotates():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        log = base / "trace.jsonl"
+        requests = [{"id": f"r{idx}", "op": "stat", "args": {"path": "README.md"}} for idx in range(40)]
+        responses = _run(base, requests, ["--log", str(log), "--log-max-bytes", "2000", "--log-backups", "2"])
+        assert len(responses) == 40
+        assert not Path(f"{log}.3").exists()
+        events = []
+        for path in (Path(f"{log}.2"), Path(f"{log}.1"), log):
+            assert path.stat().st_size <= 2000
+            events.extend(json.loads(line) for line in path.read_text(encoding="utf-8").splitlines())
+        # Rotation kept the newest events in order, with the original schema.
+        assert events[-1]["event"] == "response" and events[-1]["id"] == "r39"
+        assert set(events[-2]) == {"ts", "event", "id", "op", "args"}
+        ids = [event["id"] for event in events if event["event"] == "response"]
+        assert ids == sorted(ids, key=lambda rid: int(rid[1:]))
+
+
+def test_stats_op_aggregates_per_op_latency_and_counters():
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as outdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        old = time.time() - 60
+        for path in base.rglob("*"):
+            os.utime(path, (old, old))
+        os.utime(base, (old, old))
+        stats_file = Path(outdir) / "stats.jsonl"
+        responses = _run(
+            base,
+            [
+                {"id": "r1", "op": "list_files", "args": {}},
+                {"id": "r2", "op": "list_files", "args": {}},
+                {"id": "r3", "op": "grep", "args": {"pattern": "def "}},
+                {"id": "r4", "op": "read_file", "args": {"path": "missing.py"}},
+                {"id": "s1", "op": "stats", "args": {"reset": True}},
+                {"id": "s2", "op": "stats", "args": {}},
+            ],
+            ["--stats-file", str(stats_file)],
+        )
+        stats = responses[4]["result"]
+        assert stats["requests"] == 4
+        listing = stats["ops"]["list_files"]
+        assert listing["count"] == 2 and listing["cache"] == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+        assert sum(bucket["count"] for bucket in listing["histogram"]) == 2
+        assert listing["time_ms"]["p50"] is not None and listing["time_ms"]["p99"] <= listing["time_ms"]["max"]
+        assert stats["ops"]["grep"]["bytes_read"] > 0 and stats["ops"]["grep"]["files_scanned"] == 3
+        assert stats["ops"]["read_file"]["errors"] == 1
+        # reset cleared the counters; only the first stats call has been recorded since.
+        assert list(responses[5]["result"]["ops"]) == ["stats"]
+        dumps = [json.loads(line) for line in stats_file.read_text(encoding="utf-8").splitlines()]
+        assert dumps[-1]["event"] == "stats" and dumps[-1]["ops"]["stats"]["count"] == 2
+
+
+def test_timings_break_metrics_into_phases():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        (base / "src" / "blob.bin").write_bytes(b"def \x00\x01\x02")
+        (base / "src" / "big.py").write_text("def big():\n" + "x = 1\n" * 400, encoding="utf-8")
+        phases = {"walk_ms", "filter_ms", "io_ms", "match_ms", "encode_ms"}
+        responses = _run(
+            base,
+            [
+                {"id": "g1", "op": "grep", "args": {"pattern": "def ", "max_bytes": 1024, "timings": True}},
+                {"id": "g2", "op": "grep", "args": {"pattern": "def ", "max_bytes": 1024}},
+                {"id": "r1", "op": "read_file", "args": {"path": "src/app.py", "timings": True}},
+                {"id": "l1", "op": "list_files", "args": {"glob": "src/**", "timings": True}},
+                {
+                    "id": "g3",
+                    "op": "grep",
+                    "args": {"pattern": "def ", "max_bytes": 1024, "skip_binary": True, "timings": True},
+                },
+                {"id": "s1", "op": "extract_symbols", "args": {"path": "src/big.py", "timings": True}},
+                {
+                    "id": "b1",
+                    "op": "batch",
+                    "args": {"requests": [{"id": "b1.1", "op": "peek", "args": {"path": "src/app.py", "timings": True}}]},
+                },
+            ],
+        )
+        timed = responses[0]["result"]
+        assert {hit["path"] for hit in timed["hits"]} == {"src/app.py", "src/blob.bin", "src/pkg/util.py"}
+        assert phases <= set(timed["metrics"])
+        assert timed["metrics"]["files_skipped_size"] == 1
+        assert timed["metrics"]["files_skipped_binary"] == 0
+        assert all(timed["metrics"][name] >= 0 for name in phases)
+        assert responses[1]["result"]["hits"] == timed["hits"]
+        assert "walk_ms" not in responses[1]["result"]["metrics"]
+        assert responses[2]["result"]["metrics"]["io_ms"] > 0
+        assert phases <= set(responses[3]["result"]["metrics"])
+        skipping = responses[4]["result"]
+        assert {hit["path"] for hit in skipping["hits"]} == {"src/app.py", "src/pkg/util.py"}
+        assert skipping["metrics"]["files_skipped_binary"] == 1
+        symbols = responses[5]["result"]
+        assert [item["name"] for item in symbols["symbols"]] == ["big"]
+        assert symbols["metrics"]["io_ms"] > 0 and symbols["metrics"]["encode_ms"] >= 0
+        sub_metrics = responses[6]["result"]["results"][0]["result"]["metrics"]
+        assert "io_ms" in sub_metrics and "encode_ms" not in sub_metrics
+
+
+def test_profile_writes_pstats_and_trace_per_request():
+    with tempfile.TemporaryDirectory() as tmpdir, tempfile.TemporaryDirectory() as outdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        profile_dir = Path(outdir) / "profiles"
+        responses = _run(
+            base,
+            [
+                {"id": "g/1", "op": "grep", "args": {"pattern": "def ", "profile": True, "timings": True}},
+                {"id": "g2", "op": "grep", "args": {"pattern": "def "}},
+            ],
+            ["--profile-dir", str(profile_dir)],
+        )
+        profiled = responses[0]["result"]
+        assert len(profiled["hits"]) == 2 and "match_ms" in profiled["metrics"]
+        profile = profiled["profile"]
+        assert profile["pstats"] == str(profile_dir / "g_1.pstats")
+        assert profile["trace"] == str(profile_dir / "g_1.trace.json")
+        stats = pstats.Stats(profile["pstats"])
+        assert any(func[2] == "grep" for func in stats.stats)
+        trace = json.loads(Path(profile["trace"]).read_text(encoding="utf-8"))
+        names = {event["name"] for event in trace["traceEvents"]}
+        assert {"grep", "_grep_file"} <= names
+        assert all(event["ph"] == "X" and event["dur"] >= 0 for event in trace["traceEvents"])
+        assert "profile" not in responses[1]["result"]
+
+        disabled = _run(base, [{"id": "p1", "op": "list_files", "args": {"profile": True}}])[0]
+        assert not disabled["ok"] and "--profile-dir" in disabled["error"]["message"]
+
+
+def test_symlinks_escaping_root_are_skipped():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir) / "root"
+        outside = Path(tmpdir) / "outside"
+        base.mkdir()
+        outside.mkdir()
+        _make_tree(base)
+        (outside / "secret.py").write_text("def leaked():\n    pass\n", encoding="utf-8")
+        (base / "link").symlink_to(outside, target_is_directory=True)
+        (base / "src" / "leak.py").symlink_to(outside / "secret.py")
+        listing, grep, multi = _run(
+            base,
+            [
+                {"id": "r1", "op": "list_files", "args": {}},
+                {"id": "r2", "op": "grep", "args": {"pattern": "def "}},
+                {"id": "r3", "op": "grep_multi", "args": {"patterns": [{"pattern": "def "}]}},
+            ],
+            ["--git", "off"],
+        )
+        assert listing["result"]["files"] == ["README.md", "src/app.py", "src/leak.py", "src/pkg/util.py"]
+        assert grep["ok"] and multi["ok"]
+        assert [hit["path"] for hit in grep["result"]["hits"]] == ["src/app.py", "src/pkg/util.py"]
+        assert [hit["path"] for hit in multi["result"]["hits"]] == ["src/app.py", "src/pkg/util.py"]
+
+
+def test_non_object_args_are_rejected_per_request():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        requests = [
+            {"id": 1, "op": "peek", "args": [1]},
+            {
+                "id": 2,
+                "op": "batch",
+                "args": {"requests": [{"id": "b1", "op": "grep", "args": "def"}, {"id": "b2", "op": "list_files"}]},
+            },
+            {"id": 3, "op": "list_files", "args": {}},
+        ]
+        for extra in ([], ["--concurrency", "4"]):
+            responses = sorted(_run(base, requests, extra), key=lambda response: response["id"])
+            assert [response["id"] for response in responses] == [1, 2, 3]
+            assert not responses[0]["ok"] and responses[0]["error"]["message"] == "args must be an object"
+            bad, good = responses[1]["result"]["results"]
+            assert not bad["ok"] and good["ok"]
+            assert responses[2]["ok"]
+
+
+def test_git_inventory_keeps_conflicted_files_and_resolves_symlinks():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir) / "root"
+        outside = Path(tmpdir) / "outside"
+        base.mkdir()
+        outside.mkdir()
+        (outside / "secret.py").write_text("def leaked():\n    pass\n", encoding="utf-8")
+        _make_tree(base)
+        git = ["git", "-C", str(base), "-c", "user.name=zeno", "-c", "user.email=zeno@example.com"]
+        subprocess.run(git + ["init", "-q", "-b", "main"], check=True)
+        (base / "src" / "alias.py").symlink_to("app.py")
+        (base / "src" / "leak.py").symlink_to(outside / "secret.py")
+        (base / "linkdir").symlink_to("src", target_is_directory=True)
+        subprocess.run(git + ["add", "src", "linkdir"], check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "init"], check=True)
+        subprocess.run(git + ["checkout", "-q", "-b", "other"], check=True)
+        (base / "src" / "app.py").write_text("def other():\n    pass\n", encoding="utf-8")
+        subprocess.run(git + ["commit", "-q", "-am", "other"], check=True)
+        subprocess.run(git + ["checkout", "-q", "main"], check=True)
+        (base / "src" / "app.py").write_text("def mine():\n    pass\n", encoding="utf-8")
+        subprocess.run(git + ["commit", "-q", "-am", "mine"], check=True)
+        merge = subprocess.run(git + ["merge", "-q", "other"], capture_output=True)
+        assert merge.returncode != 0
+        (base / "src" / "untracked_link.py").symlink_to(outside / "secret.py")
+
+        request = [{"id": "r1", "op": "list_files", "args": {}}]
+        expected = ["README.md", "src/alias.py", "src/app.py", "src/pkg/util.py"]
+        assert _run(base, request)[0]["result"]["files"] == expected
+        tracked = _run(base, request, ["--git", "tracked"])[0]["result"]["files"]
+        assert tracked == ["src/alias.py", "src/app.py", "src/pkg/util.py"]
+
+
+def test_log_write_failure_drops_events_without_blocking():
+    if not Path("/dev/full").exists():
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        requests = [{"id": f"r{idx}", "op": "stat", "args": {"path": "README.md"}} for idx in range(50)]
+        payload = "".join(json.dumps(req) + "\n" for req in requests)
+        cmd = ["python3", SCRIPT, "--root", str(base), "--log", "/dev/full", "--log-overflow", "block"]
+        result = subprocess.run(cmd, input=payload, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+        assert len(result.stdout.splitlines()) == 50
+        assert "log writer failed" in result.stderr
+
+
+def test_grep_keeps_per_line_anchors_lookarounds_and_unicode_folds():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        (base / "mod.py").write_text("import os\nimport sys\n", encoding="utf-8")
+        (base / "units.txt").write_text("\u212aelvin scale\n", encoding="utf-8")
+        patterns = {"start": r"\Aimport", "end": r"sys\Z", "ahead": r"os(?!\n)", "behind": r"(?<!\n)import"}
+        requests = [
+            {"id": name, "op": "grep", "args": {"pattern": pattern, "regex": True, "paths": ["mod.py"]}}
+            for name, pattern in patterns.items()
+        ]
+        requests.append(
+            {
+                "id": "multi",
+                "op": "grep_multi",
+                "args": {"patterns": [{"pattern": r"\Aimport", "regex": True}], "paths": ["mod.py"]},
+            }
+        )
+        requests.append({"id": "fold", "op": "grep", "args": {"pattern": "kelvin", "case_sensitive": False}})
+        requests.append(
+            {"id": "fold_re", "op": "grep", "args": {"pattern": "kel+vin", "regex": True, "case_sensitive": False}}
+        )
+        responses = {response["id"]: response["result"] for response in _run(base, requests)}
+        lines = {name: [hit["line"] for hit in responses[name]["hits"]] for name in [*patterns, "multi"]}
+        assert lines == {"start": [1, 2], "end": [2], "ahead": [1], "behind": [1, 2], "multi": [1, 2]}
+        assert [hit["path"] for hit in responses["fold"]["hits"]] == ["units.txt"]
+        assert [hit["path"] for hit in responses["fold_re"]["hits"]] == ["units.txt"]
+
+
+def test_lone_carriage_returns_end_lines_like_universal_newlines():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        (base / "mac.txt").write_bytes(b"one\rtwo\rthree\r")
+        (base / "mixed.txt").write_bytes(b"a\r\nb\rc\nd")
+        read, mixed, peek, grep = _run(
+            base,
+            [
+                {"id": "r1", "op": "read_file", "args": {"path": "mac.txt", "start_line": 2, "end_line": 3}},
+                {"id": "r2", "op": "read_file", "args": {"path": "mixed.txt", "start_line": 1, "end_line": 4}},
+                {"id": "p1", "op": "peek", "args": {"path": "mac.txt", "head_lines": 1, "tail_lines": 1}},
+                {"id": "g1", "op": "grep", "args": {"pattern": "t", "paths": ["mac.txt"]}},
+            ],
+        )
+        assert read["result"]["total_lines"] == 3 and read["result"]["text"] == "two\nthree"
+        assert mixed["result"]["total_lines"] == 4 and mixed["result"]["text"] == "a\nb\nc\nd"
+        assert peek["result"]["total_lines"] == 3
+        assert peek["result"]["head"]["text"] == "one" and peek["result"]["tail"]["text"] == "three"
+        assert [(hit["line"], hit["text"]) for hit in grep["result"]["hits"]] == [(2, "two"), (3, "three")]
+
+
+def test_auto_socket_lives_in_a_private_dir_and_client_checks_owners():
+    client = str(ROOT / "scripts" / "zeno_client.py")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir) / "root"
+        base.mkdir()
+        _make_tree(base)
+        env = {**os.environ, "XDG_RUNTIME_DIR": str(Path(tmpdir) / "run")}
+        env.pop("ZENO_SERVER", None)
+        (Path(tmpdir) / "run").mkdir()
+        daemon = subprocess.Popen(
+            ["python3", SCRIPT, "--root", str(base), "--listen", "auto"],
+            stderr=subprocess.PIPE,
+            text=True,
+            env=env,
+        )
+        send = ["python3", client, "send", "--root", str(base)]
+        try:
+            assert "listening" in daemon.stderr.readline()
+            sock_dir = Path(tmpdir) / "run" / "zeno"
+            assert stat.S_IMODE(sock_dir.stat().st_mode) == 0o700
+            for op in ("stat", "stats"):
+                result = subprocess.run(
+                    send + ["--op", op, "--args", '{"path": "README.md"}'], capture_output=True, text=True, env=env
+                )
+                assert result.returncode == 0, result.stderr
+            # The daemon answered both requests, so its counters include the stat.
+            assert json.loads(result.stdout)["result"]["ops"]["stat"]["count"] == 1
+            logged = subprocess.run(
+                send + ["--log", str(Path(tmpdir) / "trace.jsonl"), "--op", "stat", "--args", '{"path": "README.md"}'],
+                capture_output=True,
+                text=True,
+                env=env,
+            )
+            assert logged.returncode == 0, logged.stderr
+            assert (Path(tmpdir) / "trace.jsonl").stat().st_size > 0
+            refused = subprocess.run(
+                send + ["--connect", f"unix:{next(sock_dir.iterdir())}", "--log", "x.jsonl", "--op", "stats"],
+                capture_output=True,
+                text=True,
+                env=env,
+            )
+            assert refused.returncode != 0 and "--log" in refused.stderr
+        finally:
+            daemon.terminate()
+            daemon.wait(timeout=10)
+
+        squat = Path(tmpdir) / "squat.sock"
+        squat.write_text("", encoding="utf-8")
+        spoofed = subprocess.run(
+            send + ["--op", "stats"], capture_output=True, text=True, env={**env, "ZENO_SERVER": f"unix:{squat}"}
+        )
+        assert spoofed.returncode != 0 and "Refusing to connect" in spoofed.stderr
+
+
+def test_git_inventory_lists_submodules_and_nested_repos():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        _make_tree(base)
+        ident = ["-c", "user.name=zeno", "-c", "user.email=zeno@example.com"]
+        lib = base / "vendor" / "lib"
+        scratch = base / "scratch"
+        for nested, name in ((lib, "lib.py"), (scratch, "notes.py")):
+            nested.mkdir(parents=True)
+            (nested / name).write_text("def nested():\n    pass\n", encoding="utf-8")
+            subprocess.run(["git", "-C", str(nested)] + ident + ["init", "-q"], check=True)
+        subprocess.run(["git", "-C", str(lib)] + ident + ["add", "lib.py"], check=True)
+        subprocess.run(["git", "-C", str(lib)] + ident + ["commit", "-q", "-m", "lib"], check=True)
+        git = ["git", "-C", str(base)] + ident
+        subprocess.run(git + ["init", "-q"], check=True)
+        # Adding an embedded repository records a gitlink, as a submodule does.
+        subprocess.run(git + ["add", "src", "vendor"], check=True, capture_output=True)
+        subprocess.run(git + ["commit", "-q", "-m", "init"], check=True)
+
+        requests = [
+            {"id": "r1", "op": "list_files", "args": {}},
+            {"id": "r2", "op": "grep", "args": {"pattern": "def nested", "paths": ["vendor/**"]}},
+        ]
+        expected = ["README.md", "scratch/notes.py", "src/app.py", "src/pkg/util.py", "vendor/lib/lib.py"]
+        listed, grepped = _run(base, requests)
+        assert listed["result"]["files"] == expected
+        assert [hit["path"] for hit in grepped["result"]["hits"]] == ["vendor/lib/lib.py"]
+        assert _run(base, requests[:1], ["--git", "off"])[0]["result"]["files"] == expected
+        tracked = _run(base, requests[:1], ["--git", "tracked"])[0]["result"]["files"]
+        assert tracked == ["src/app.py", "src/pkg/util.py", "vendor/lib/lib.py"]
+
+
+def test_trigram_index_is_binary_and_keeps_unicode_case_folds():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        repo = base / "repo"
+        repo.mkdir()
+        for idx in range(10):
+            (repo / f"mod_{idx}.py").write_text(f"def func_{idx}():\n    return {idx}\n", encoding="utf-8")
+        (repo / "units.py").write_text("TEMP = '\u212aelvin_scale'\n", encoding="utf-8")
+        trigram_path = base / "repo.trigrams"
+        index_script = str(ROOT / "scripts" / "zeno_index.py")
+        built = subprocess.run(
+            ["python3", index_script, "--root", str(repo), "--trigram-out", str(trigram_path)],
+            capture_output=True,
+            text=True,
+        )
+        assert built.returncode == 0, built.stderr
+        assert trigram_path.read_bytes()[:4] == b"ZTRI"
+
+        folded, exact = _run(
+            repo,
+            [
+                {"id": "g1", "op": "grep", "args": {"pattern": "kelvin_scale", "case_sensitive": False}},
+                {"id": "g2", "op": "grep", "args": {"pattern": "func_7"}},
+            ],
+            ["--trigram-index", str(trigram_path)],
+        )
+        assert [h["path"] for h in folded["result"]["hits"]] == ["units.py"]
+        assert folded["result"]["metrics"]["candidates"] == 1
+        assert [h["path"] for h in exact["result"]["hits"]] == ["mod_7.py"]
+        assert exact["result"]["metrics"]["candidates"] == 1
+
+
+def test_streaming_list_files_matches_the_unstreamed_listing():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        for group in range(5):
+            (base / f"d{group}").mkdir()
+            for idx in range(90):
+                suffix = "py" if idx % 3 else "txt"
+                (base / f"d{group}" / f"m{idx:02d}.{suffix}").write_text("x = 1\n", encoding="utf-8")
+        listing = {"glob": "**/*.py", "glob_syntax": "path", "max": 250}
+        requests = [
+            {"id": "w1", "op": "list_files", "args": dict(listing, stream=True)},
+            {"id": "w2", "op": "list_files", "args": dict(listing, stream=True)},
+            {"id": "r1", "op": "list_files", "args": {"regex": r"d[13]/m0", "stream": True}},
+            {"id": "p1", "op": "list_files", "args": listing},
+            {"id": "p2", "op": "list_files", "args": {"regex": r"d[13]/m0"}},
+        ]
+        frames = _run(base, requests, ["--git", "off"])
+        by_id = {}
+        for frame in frames:
+            by_id.setdefault(frame["id"], []).append(frame)
+        plain = by_id["p1"][0]["result"]
+        assert len(plain["files"]) == 250 and plain["truncated"] is True
+        for rid in ("w1", "w2"):
+            *partials, final = by_id[rid]
+            assert [len(frame["files"]) for frame in partials] == [200, 50]
+            assert [rel for frame in partials for rel in frame["files"]] == plain["files"]
+            assert final["result"]["truncated"] is True and final["result"]["metrics"]["files"] == 250
+        *partials, final = by_id["r1"]
+        assert [rel for frame in partials for rel in frame["files"]] == by_id["p2"][0]["result"]["files"]
+        assert final["result"]["truncated"] is False and final["result"]["metrics"]["files"] == 20
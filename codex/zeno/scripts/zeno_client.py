@@ -2,13 +2,20 @@
 """Tiny client CLI for the Zeno JSONL server."""
 
 import argparse
+import hashlib
 import json
 import os
+import socket
+import stat
 import subprocess
 import sys
+import tempfile
 import time
 from collections import deque
-from typing import Dict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+DEFAULT_PIPELINE_DEPTH = 8
 
 
 def _load_args(json_text: str | None) -> Dict:
@@ -35,34 +42,232 @@ def _send_request(args: argparse.Namespace) -> int:
             "args": _load_args(args.args),
         }
 
+    with _server_connection(args.root, args.connect, args.spawn, args.log) as (writer, reader):
+        writer.write(json.dumps(payload) + "\n")
+        writer.flush()
+        if writer is not reader:
+            writer.close()
+        return _print_responses(reader, args.pretty)
+
+
+@contextmanager
+def _server_connection(
+    root: str,
+    connect: Optional[str],
+    spawn: bool,
+    log: Optional[str],
+    server_args: Iterable[str] = (),
+) -> Iterator[Tuple[TextIO, TextIO]]:
+    """Yield (writer, reader) for a running daemon, else for a spawned server.
+
+    A daemon is only used when it serves `root`. On a mismatch an explicit
+    `--connect` fails; `$ZENO_SERVER` or the per-root socket fall back to a
+    spawned server. A daemon keeps its own log, so `log` always spawns.
+    """
+    if log and connect:
+        raise SystemExit("--log applies to a spawned server; a daemon writes its own --log")
+    if not spawn and not log:
+        address = connect or os.environ.get("ZENO_SERVER") or f"unix:{_default_socket_path(root)}"
+        sock = _connect(address)
+        if sock is not None:
+            wanted = os.path.realpath(root)
+            with sock, sock.makefile("rw", encoding="utf-8", newline="\n") as stream:
+                served = _daemon_root(stream)
+                if served == wanted:
+                    yield stream, stream
+                    return
+            if connect:
+                raise SystemExit(f"zeno_server on {address} serves {served}, not {wanted}")
+            print(f"zeno_server on {address} serves {served}, not {wanted}; spawning a server", file=sys.stderr)
+        elif connect:
+            raise SystemExit(f"No zeno_server listening on {address}")
+
     server_path = os.path.join(os.path.dirname(__file__), "zeno_server.py")
-    cmd = ["python3", server_path, "--root", args.root]
-    if args.log:
-        cmd += ["--log", args.log]
+    cmd = ["python3", server_path, "--root", root] + list(server_args)
+    if log:
+        cmd += ["--log", log]
 
     proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
     assert proc.stdin is not None
     assert proc.stdout is not None
+    try:
+        yield proc.stdin, proc.stdout
+    finally:
+        if not proc.stdin.closed:
+            proc.stdin.close()
+        proc.wait(timeout=30)
+
+
+def _default_socket_path(root: str) -> str:
+    # Must match default_socket_path() in zeno_server.py (`--listen auto`).
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    directory = os.path.join(runtime, "zeno") if runtime else os.path.join(tempfile.gettempdir(), f"zeno-{os.getuid()}")
+    digest = hashlib.sha1(os.path.realpath(root).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"{digest}.sock")
+
+
+def _check_socket_owner(path: str) -> None:
+    """Refuse a Unix socket, or socket directory, that another user could have put there."""
+    try:
+        sock_st = os.lstat(path)
+        dir_st = os.stat(os.path.dirname(os.path.abspath(path)))
+    except OSError:
+        return  # Nothing there: the connect fails and a server is spawned.
+    uid = os.getuid()
+    if not stat.S_ISSOCK(sock_st.st_mode) or sock_st.st_uid != uid or dir_st.st_uid != uid:
+        raise SystemExit(f"Refusing to connect to {path}: the socket and its directory must be owned by this user")
 
-    proc.stdin.write(json.dumps(payload) + "\n")
-    proc.stdin.flush()
-    proc.stdin.close()
 
-    response = proc.stdout.readline()
-    if not response:
-        return 1
+def _daemon_root(stream: TextIO) -> Optional[str]:
+    """Return the root a connected daemon serves, from its `hello` response."""
+    stream.write(json.dumps({"id": "zeno-client-hello", "op": "hello", "args": {}}) + "\n")
+    stream.flush()
+    try:
+        response = json.loads(stream.readline())
+    except json.JSONDecodeError:
+        return None
+    result = response.get("result") if isinstance(response, dict) and response.get("ok") else None
+    return result.get("root") if isinstance(result, dict) else None
 
-    if args.pretty:
+
+def _connect(address: str) -> Optional[socket.socket]:
+    """Connect to a zeno_server daemon, or return None when none is listening."""
+    kind, _, rest = address.partition(":")
+    host, _, port = rest.rpartition(":")
+    if kind == "unix" and rest:
+        _check_socket_owner(rest)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        target = rest
+    elif kind == "tcp" and host and port.isdigit():
+        sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+        target = (host, int(port))
+    else:
+        raise SystemExit(f"Invalid server address: {address} (expected unix:PATH or tcp:HOST:PORT)")
+    try:
+        sock.connect(target)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def _print_responses(lines: Iterable[str], pretty: bool) -> int:
+    """Print partial frames and the final response; 1 if the server sent none."""
+    for response in lines:
         try:
             data = json.loads(response)
         except json.JSONDecodeError:
             print(response.strip())
-        else:
-            print(json.dumps(data, indent=2))
+            return 0
+        print(json.dumps(data, indent=2) if pretty else response.strip())
+        if not data.get("partial"):
+            return 0
+    return 1
+
+
+def _load_plan(path: str) -> List[Dict]:
+    """Read a plan from zeno_modes.py (JSONL, or a JSON list); "-" reads stdin."""
+    if path == "-":
+        text = sys.stdin.read()
     else:
-        print(response.strip())
+        with open(path, "r", encoding="utf-8") as handle:
+            text = handle.read()
+    try:
+        if text.lstrip().startswith("["):
+            ops = json.loads(text)
+        else:
+            ops = [json.loads(line) for line in text.splitlines() if line.strip()]
+    except json.JSONDecodeError as exc:
+        raise SystemExit(f"Invalid plan JSON: {exc}")
+    for idx, op in enumerate(ops):
+        if not isinstance(op, dict) or not op.get("op"):
+            raise SystemExit(f"Plan entry {idx + 1} has no op")
+    return ops
 
-    return proc.wait(timeout=5)
+
+def _run_plan(args: argparse.Namespace) -> int:
+    """Pipeline every plan op through one server and print responses in plan order.
+
+    Up to `--depth` requests are in flight at once; each is sent with its plan
+    position as the wire id and answered with the plan's own id restored.
+    `stream` is dropped from args because responses are buffered anyway.
+    """
+    plan = _load_plan(args.plan)
+    depth = max(1, args.depth)
+    out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+    responses: List[Optional[Dict]] = [None] * len(plan)
+    sent_at = [0.0] * len(plan)
+    latency_ms = [0] * len(plan)
+    start = time.perf_counter()
+    sent = received = emitted = 0
+
+    server_args = ["--concurrency", str(depth)]
+    try:
+        with _server_connection(args.root, args.connect, args.spawn, args.log, server_args) as (writer, reader):
+            while received < len(plan):
+                while sent < len(plan) and sent - received < depth:
+                    entry = plan[sent]
+                    op_args = {k: v for k, v in (entry.get("args") or {}).items() if k != "stream"}
+                    writer.write(json.dumps({"id": sent, "op": entry["op"], "args": op_args}) + "\n")
+                    sent_at[sent] = time.perf_counter()
+                    sent += 1
+                writer.flush()
+                line = reader.readline()
+                if not line:
+                    raise SystemExit(f"zeno_server closed the connection after {received} of {len(plan)} responses")
+                response = json.loads(line)
+                if response.get("partial"):
+                    continue
+                idx = response.get("id")
+                if not isinstance(idx, int) or not 0 <= idx < len(plan) or responses[idx] is not None:
+                    raise SystemExit(f"Unexpected response id: {idx!r}")
+                latency_ms[idx] = int((time.perf_counter() - sent_at[idx]) * 1000)
+                response["id"] = plan[idx].get("id")
+                responses[idx] = response
+                received += 1
+                while emitted < len(plan) and responses[emitted] is not None:
+                    out.write(json.dumps(responses[emitted]) + "\n")
+                    emitted += 1
+                out.flush()
+            if writer is not reader:
+                writer.close()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    _print_plan_summary(plan, responses, latency_ms, int((time.perf_counter() - start) * 1000))
+    return 0 if all(r and r.get("ok") for r in responses) else 1
+
+
+def _print_plan_summary(
+    plan: List[Dict],
+    responses: List[Optional[Dict]],
+    latency_ms: List[int],
+    total_ms: int,
+) -> None:
+    by_op: Dict[str, Dict[str, int]] = {}
+    total_bytes = 0
+    errors = 0
+    for entry, response, elapsed in zip(plan, responses, latency_ms):
+        stats = by_op.setdefault(entry["op"], {"count": 0, "total_ms": 0, "max_ms": 0, "bytes_read": 0})
+        stats["count"] += 1
+        stats["total_ms"] += elapsed
+        stats["max_ms"] = max(stats["max_ms"], elapsed)
+        if response and response.get("ok"):
+            bytes_read = response["result"].get("metrics", {}).get("bytes_read", 0)
+            stats["bytes_read"] += bytes_read
+            total_bytes += bytes_read
+        else:
+            errors += 1
+
+    print(f"plan: {len(plan)} ops, {errors} errors, {total_ms} ms wall, {total_bytes} bytes read", file=sys.stderr)
+    print(f"{'op':<16} {'count':>5} {'mean_ms':>8} {'max_ms':>7} {'bytes_read':>11}", file=sys.stderr)
+    for op, stats in sorted(by_op.items()):
+        mean_ms = stats["total_ms"] // stats["count"]
+        print(
+            f"{op:<16} {stats['count']:>5} {mean_ms:>8} {stats['max_ms']:>7} {stats['bytes_read']:>11}",
+            file=sys.stderr,
+        )
 
 
 def _tail_file(args: argparse.Namespace) -> int:
@@ -104,10 +309,29 @@ def main() -> int:
     send.add_argument("--op", help="Operation name")
     send.add_argument("--args", help="JSON string for args")
     send.add_argument("--id", help="Request id")
-    send.add_argument("--log", help="Log file path for the server")
+    send.add_argument("--log", help="Log file path; spawns a server instead of using a daemon, which keeps its own")
+    send.add_argument(
+        "--connect",
+        help="Daemon address (unix:PATH or tcp:HOST:PORT); default: $ZENO_SERVER, then the per-root socket",
+    )
+    send.add_argument("--spawn", action="store_true", help="Always spawn a one-shot server, skipping any daemon")
     send.add_argument("--pretty", action="store_true", help="Pretty print JSON response")
     send.add_argument("--request", help="Raw JSON request (overrides --op/--args)")
 
+    run = sub.add_parser("run", help="Run a zeno_modes.py plan through one server")
+    run.add_argument("--plan", required=True, help="Plan file (JSONL or JSON list); - for stdin")
+    run.add_argument("--root", required=True, help="Root directory for the server")
+    run.add_argument("--out", help="Write responses here instead of stdout")
+    run.add_argument(
+        "--depth",
+        type=int,
+        default=DEFAULT_PIPELINE_DEPTH,
+        help=f"Max requests in flight (default: {DEFAULT_PIPELINE_DEPTH})",
+    )
+    run.add_argument("--log", help="Log file path; spawns a server instead of using a daemon, which keeps its own")
+    run.add_argument("--connect", help="Daemon address (unix:PATH or tcp:HOST:PORT)")
+    run.add_argument("--spawn", action="store_true", help="Always spawn a server, skipping any daemon")
+
     tail = sub.add_parser("tail", help="Tail a JSONL log file")
     tail.add_argument("--log", required=True, help="Log file path")
     tail.add_argument("--lines", type=int, default=0, help="Print last N lines before follow")
@@ -118,6 +342,8 @@ def main() -> int:
         if not args.request and not args.op:
             raise SystemExit("--op is required unless --request is provided")
         return _send_request(args)
+    if args.command == "run":
+        return _run_plan(args)
     if args.command == "tail":
         return _tail_file(args)
     return 0
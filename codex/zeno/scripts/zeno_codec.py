@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Wire codecs for the zeno_server.py protocol.
+
+JSONL stays the default: one JSON object per line. `JsonCodec` encodes with
+orjson when it is installed and falls back to the stdlib `json` module, and
+can write non-ASCII text as raw UTF-8 instead of `\\uXXXX` escapes. When
+msgpack is installed, a client may switch its stream to `MsgpackCodec` with
+a `hello` request: each message is then a 4-byte big-endian length followed
+by a msgpack payload.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import json
+import struct
+from typing import Any, BinaryIO, List, Optional, Sequence, Union
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional binary framing
+    msgpack = None
+
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=4096)
+def _surrogate_pair(hex_code: bytes) -> bytes:
+    code = int(hex_code, 16) - 0x10000
+    return b"\\u%04x\\u%04x" % (0xD800 | (code >> 10), 0xDC00 | (code & 0x3FF))
+
+
+def _escape_non_ascii(data: bytes) -> bytes:
+    """Rewrite orjson's UTF-8 output with the `\\uXXXX` escapes `json.dumps` writes.
+
+    orjson escapes every control character, so escaped backslashes can be
+    parked on NUL while the `backslashreplace` codec escapes non-ASCII in C;
+    its `\\xXX` and `\\UXXXXXXXX` forms are then rewritten into JSON's.
+    """
+    text = data.decode("utf-8")
+    parked = "\\\\" in text
+    if parked:
+        text = text.replace("\\\\", "\0")
+    out = text.encode("ascii", "backslashreplace")
+    if b"\\x" in out:
+        out = out.replace(b"\\x", b"\\u00")
+    if b"\\U" in out:
+        parts = out.split(b"\\U")
+        out = parts[0] + b"".join(_surrogate_pair(part[:8]) + part[8:] for part in parts[1:])
+    if parked:
+        out = out.replace(b"\0", b"\\\\")
+    return out
+
+
+class JsonCodec:
+    """One JSON object per line."""
+
+    name = "json"
+    framed = False
+
+    def __init__(self, ensure_ascii: bool = True) -> None:
+        self.ensure_ascii = ensure_ascii
+
+    def encode(self, obj: Any) -> bytes:
+        if orjson is not None:
+            try:
+                data = orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+            except TypeError:
+                # Non-string keys or out-of-range integers: let the stdlib handle them.
+                data = None
+            if data is not None:
+                if not self.ensure_ascii or data.isascii():
+                    return data
+                # orjson never escapes non-ASCII itself.
+                return _escape_non_ascii(data)
+        return (json.dumps(obj, ensure_ascii=self.ensure_ascii) + "\n").encode("utf-8")
+
+    def encode_value(self, value: Any) -> bytes:
+        """Encode `value` as it appears nested inside a message."""
+        return self.encode(value)[:-1]
+
+    def decode(self, data: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """Length-prefixed msgpack messages."""
+
+    name = "msgpack"
+    framed = True
+    ensure_ascii = False
+
+    def encode(self, obj: Any) -> bytes:
+        payload = msgpack.packb(obj, use_bin_type=True)
+        return FRAME_HEADER.pack(len(payload)) + payload
+
+    def encode_value(self, value: Any) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+Codec = Union[JsonCodec, MsgpackCodec]
+
+
+def json_encoder() -> str:
+    return "orjson" if orjson is not None else "json"
+
+
+def available_codecs() -> List[str]:
+    return ["json", "msgpack"] if msgpack is not None else ["json"]
+
+
+def negotiate(preferred: Sequence[str]) -> str:
+    """Return the first codec in `preferred` that is available, else "json"."""
+    available = available_codecs()
+    return next((name for name in preferred if name in available), "json")
+
+
+def make_codec(name: str, ensure_ascii: bool = True) -> Codec:
+    if name == "json":
+        return JsonCodec(ensure_ascii)
+    if name == "msgpack" and msgpack is not None:
+        return MsgpackCodec()
+    raise ValueError(f"codec not available: {name}")
+
+
+def _frame_size(header: bytes) -> int:
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"frame of {size} bytes exceeds {MAX_FRAME_SIZE}")
+    return size
+
+
+def read_message(stream: BinaryIO, codec: Codec) -> Optional[bytes]:
+    """Read one raw message from a blocking binary stream; None at EOF.
+
+    Blank lines between JSON messages are skipped.
+    """
+    if not codec.framed:
+        while True:
+            line = stream.readline()
+            if not line or line.strip():
+                return line or None
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    size = _frame_size(header)
+    payload = stream.read(size)
+    return payload if len(payload) == size else None
+
+
+async def read_message_async(reader: asyncio.StreamReader, codec: Codec) -> Optional[bytes]:
+    """`read_message` for an asyncio stream."""
+    try:
+        if not codec.framed:
+            while True:
+                line = await reader.readline()
+                if not line or line.strip():
+                    return line or None
+        size = _frame_size(await reader.readexactly(FRAME_HEADER.size))
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        return None
@@ -4,14 +4,26 @@
 from __future__ import annotations
 
 import argparse
-import fnmatch
 import json
 import os
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Iterable, List, Optional, Tuple
 
+from zeno_paths import (
+    WALK_WORKERS,
+    IgnoreCache,
+    apply_ignore_files,
+    compile_globs,
+    filter_listing,
+    git_list_files,
+    scandir_entries,
+    walk_files,
+)
+from zeno_trigrams import write_index
+
 DEFAULT_EXCLUDE_DIRS = {
     ".git",
     ".hg",
@@ -29,6 +41,10 @@ DEFAULT_EXCLUDE_DIRS = {
 
 DEFAULT_EXCLUDE_GLOBS = ["**/*.min.*", "**/*.map", "**/generated/**", "**/vendor/**"]
 
+# Trigrams present in more than this share of files are recorded as "dense"
+# without a posting list; they never narrow a search enough to be worth storing.
+TRIGRAM_DENSE_RATIO = 0.5
+
 SYMBOL_PATTERNS: List[Tuple[str, re.Pattern]] = [
     ("class", re.compile(r"^\s*class\s+([A-Za-z_][A-Za-z0-9_]*)")),
     ("struct", re.compile(r"^\s*struct\s+([A-Za-z_][A-Za-z0-9_]*)")),
@@ -88,23 +104,37 @@ def _iter_files(
     exclude_dirs: Iterable[str],
     exclude_globs: Iterable[str],
     max_files: int,
+    use_ignore: bool = True,
+    git: str = "auto",
 ) -> List[Path]:
-    results: List[Path] = []
     exclude_dir_set = set(exclude_dirs)
-    for dirpath, dirs, files in os.walk(root):
-        if not include_hidden:
-            dirs[:] = [d for d in dirs if not d.startswith(".")]
-            files = [f for f in files if not f.startswith(".")]
-        dirs[:] = [d for d in dirs if d not in exclude_dir_set]
-        for fname in files:
-            full = Path(dirpath) / fname
-            rel = full.relative_to(root)
-            if any(fnmatch.fnmatchcase(str(rel), g) for g in exclude_globs):
-                continue
-            results.append(full)
-            if len(results) >= max_files:
-                return results
-    return results
+    excluded = compile_globs(exclude_globs)
+    ignores = IgnoreCache()
+    if use_ignore and git != "off":
+        raw = git_list_files(str(root), untracked=git != "tracked")
+        if raw is not None:
+            rule_dirs = {""} | {path.rpartition("/")[0] for path in raw if path.endswith(".zenoignore")}
+            listed = filter_listing(raw, include_hidden, exclude_dir_set)
+            rels, _ = apply_ignore_files(str(root), listed, ignores, rule_dirs)
+            return [root / rel for rel in rels if not excluded.match(rel)][:max_files]
+    base = str(root)
+
+    def list_dir(rel_dir: str) -> Optional[List[Tuple[str, bool]]]:
+        return scandir_entries(os.path.join(base, rel_dir) if rel_dir else base)
+
+    with ThreadPoolExecutor(max_workers=WALK_WORKERS) as pool:
+        rels = walk_files(
+            [("", ())],
+            list_dir,
+            pool,
+            include_hidden,
+            exclude_dir_set,
+            base,
+            ignores=ignores if use_ignore else None,
+            exclude=excluded,
+            limit=max_files,
+        )
+    return [root / rel for rel in rels]
 
 
 def _detect_language(path: Path) -> Optional[str]:
@@ -177,6 +207,51 @@ def _scan_file(
     return symbols, imports, bytes_read
 
 
+def _file_trigrams(data: bytes) -> Iterable[bytes]:
+    lowered = data.lower()
+    grams = {lowered[idx : idx + 3] for idx in range(len(lowered) - 2)}
+    return [gram for gram in grams if b"\n" not in gram]
+
+
+def _build_trigram_index(root: Path, files: List[Path], max_bytes: int, out_path: Path) -> None:
+    """Write a Code Search style trigram index over (ASCII-lowercased) file bytes.
+
+    Files larger than `max_bytes` or unreadable are left out; the server
+    always scans files that are missing from the index or changed since.
+    """
+    entries: List[List] = []
+    postings: Dict[bytes, List[int]] = {}
+    bytes_read = 0
+    for path in files:
+        try:
+            st = path.stat()
+            if st.st_size > max_bytes:
+                continue
+            data = path.read_bytes()
+        except OSError:
+            continue
+        bytes_read += len(data)
+        file_id = len(entries)
+        entries.append([str(path.relative_to(root)), st.st_size, st.st_mtime_ns])
+        for gram in _file_trigrams(data):
+            postings.setdefault(gram, []).append(file_id)
+
+    dense_limit = max(1, int(len(entries) * TRIGRAM_DENSE_RATIO))
+    dense = [gram for gram, ids in postings.items() if len(ids) > dense_limit]
+    for gram in dense:
+        del postings[gram]
+
+    stats = {
+        "files": len(entries),
+        "trigrams": len(postings),
+        "dense": len(dense),
+        "postings": sum(len(ids) for ids in postings.values()),
+        "bytes_read": bytes_read,
+    }
+    meta = {"root": str(root), "generated_at": _utc_ts(), "files": entries, "stats": stats}
+    write_index(str(out_path), meta, postings, dense)
+
+
 def _write_output(out_path: Optional[Path], payload: Dict, fmt: str) -> None:
     text = ""
     if fmt == "jsonl":
@@ -202,9 +277,22 @@ def main() -> int:
     parser.add_argument("--format", choices=["json", "jsonl"], default="json")
     parser.add_argument("--include-hidden", action="store_true")
     parser.add_argument("--max-files", type=int, default=20000)
+    parser.add_argument("--no-ignore", action="store_true", help="Do not apply .gitignore/.zenoignore rules")
+    parser.add_argument(
+        "--git",
+        choices=["auto", "tracked", "off"],
+        default="auto",
+        help="In a git work tree, list files with git ls-files (tracked = index only, off = walk)",
+    )
     parser.add_argument("--max-bytes", type=int, default=2_000_000)
     parser.add_argument("--max-symbols", type=int, default=10000)
     parser.add_argument("--max-imports", type=int, default=10000)
+    parser.add_argument(
+        "--trigrams",
+        action="store_true",
+        help="Also write a trigram index for zeno_server.py --trigram-index (next to --out)",
+    )
+    parser.add_argument("--trigram-out", help="Trigram index path (default: <out>.trigrams)")
     args = parser.parse_args()
 
     root = Path(args.root).resolve()
@@ -214,6 +302,8 @@ def main() -> int:
         DEFAULT_EXCLUDE_DIRS,
         DEFAULT_EXCLUDE_GLOBS,
         args.max_files,
+        use_ignore=not args.no_ignore,
+        git=args.git,
     )
 
     symbols: List[Dict] = []
@@ -249,6 +339,15 @@ def main() -> int:
 
     out_path = Path(args.out).resolve() if args.out else None
     _write_output(out_path, payload, args.format)
+
+    if args.trigrams or args.trigram_out:
+        if args.trigram_out:
+            trigram_path = Path(args.trigram_out).resolve()
+        elif out_path:
+            trigram_path = out_path.with_name(out_path.name + ".trigrams")
+        else:
+            raise SystemExit("--trigrams requires --out or --trigram-out")
+        _build_trigram_index(root, files, args.max_bytes, trigram_path)
     return 0
 
 
@@ -2,19 +2,112 @@
 """Tiny JSONL REPL server for read-only corpus access."""
 
 import argparse
-import fnmatch
+import asyncio
+import contextvars
+import cProfile
+import hashlib
 import json
+import mmap
+import multiprocessing
 import os
+import pstats
+import queue
 import re
+import signal
+import socket
+import stat
+import subprocess
 import sys
+import tempfile
+import threading
 import time
-from collections import deque
-from typing import Dict, Iterable, List, Tuple
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from itertools import accumulate, islice, repeat
+from operator import add
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from zeno_paths import (
+    GLOB_SYNTAXES,
+    IGNORE_FILES,
+    GlobSet,
+    IgnoreCache,
+    IgnoreRules,
+    WALK_WORKERS,
+    apply_ignore_files,
+    compile_globs,
+    filter_listing,
+    git_list_files,
+    is_ignored,
+    scandir_entries,
+    walk_files,
+)
+from zeno_codec import (
+    Codec,
+    JsonCodec,
+    available_codecs,
+    json_encoder,
+    make_codec,
+    negotiate,
+    read_message,
+    read_message_async,
+)
+from zeno_trigrams import IndexFile
+
+try:
+    import re._constants as _sre_constants
+    import re._parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants as _sre_constants
+    import sre_parse as _sre_parse
 
 DEFAULT_MAX_FILES = 20000
 DEFAULT_MAX_LINES = 400
 DEFAULT_MAX_HITS = 200
 DEFAULT_MAX_BYTES = 2_000_000
+LINE_INDEX_CACHE_SIZE = 256
+INVENTORY_LISTING_CACHE_SIZE = 64
+LINE_INDEX_BLOCK_SIZE = 1 << 20
+PEEK_BLOCK_SIZE = 16 * 1024
+GREP_CHUNK_FILES = 32
+BATCH_MAX_PARALLEL = 8
+STREAM_CHUNK_FILES = 200
+STREAMING_OPS = {"list_files", "grep", "grep_multi"}
+LISTEN_CONCURRENCY = 8
+MAX_REQUEST_LINE = 64 * 1024 * 1024
+RESULT_CACHE_SIZE = 128
+CACHEABLE_OPS = {"list_files", "grep", "grep_multi", "extract_symbols"}
+CACHE_IGNORED_ARGS = {"stream", "deadline_ms"}
+UNBUDGETED_OPS = {"batch", "session", "cancel", "hello"}
+TIMED_OPS = {"list_files", "grep", "grep_multi", "read_file", "peek", "extract_symbols"}
+BINARY_SNIFF_BYTES = 8192
+# Stands in for a timed response's `encode_ms` while it is encoded; exactly
+# representable, so both JSON encoders print it the same way.
+ENCODE_MS_PENDING = -0.0001220703125
+# Files modified this recently may change again within one mtime tick
+# (2s on FAT), so results that read them are not cached.
+CACHE_RACY_WINDOW_NS = 2_000_000_000
+STATS_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+STATS_DUMP_INTERVAL = 60.0
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+LOG_FSYNC_INTERVAL = 1.0
+LOG_BACKUPS = 3
+LOG_CLOSE_TIMEOUT = 10.0
+# Trace events are derived from cProfile's caller graph; spans shorter than
+# PROFILE_TRACE_MIN_US or deeper than PROFILE_TRACE_DEPTH are left out.
+PROFILE_TRACE_MIN_US = 10
+PROFILE_TRACE_DEPTH = 64
+PROFILE_TRACE_MAX_EVENTS = 20000
+_BACKREF_RE = re.compile(r"\\[1-9]|\(\?P=")
+# Universal newlines: "\r\n", a lone "\r" and "\n" each end a line.
+_NEWLINE_RE = re.compile(rb"\r\n?|\n")
+_TEXT_NEWLINE_RE = re.compile(r"\r\n?|\n")
+# Non-ASCII characters that equal an ASCII letter under re.IGNORECASE or str.lower().
+_FOLD_ALTERNATES = {"i": ("\u0130", "\u0131"), "k": ("\u212a",), "s": ("\u017f",)}
+_FOLD_BYTES = frozenset(ord(char) for char in _FOLD_ALTERNATES)
 DEFAULT_EXCLUDE_DIRS = {
     ".git",
     ".hg",
@@ -53,37 +146,1824 @@ def _now_ms() -> int:
     return int(time.monotonic() * 1000)
 
 
-def _write_json(obj: Dict) -> None:
-    sys.stdout.write(json.dumps(obj, ensure_ascii=True) + "\n")
-    sys.stdout.flush()
+_WRITE_LOCK = threading.Lock()
+_LOG_LOCK = threading.Lock()
+_LOG_CODEC = JsonCodec()
 
 
-def _log(log_handle, event: Dict) -> None:
-    if not log_handle:
-        return
-    log_handle.write(json.dumps(event, ensure_ascii=True) + "\n")
-    log_handle.flush()
+class Wire:
+    """Codec of one request stream; a successful `hello` switches it."""
+
+    def __init__(self, codec: Codec) -> None:
+        self.codec = codec
+
+    def switch(self, request: Optional[Dict], response: Dict) -> None:
+        """Adopt the codec a `hello` response negotiated, once that response is written."""
+        if request is not None and request.get("op") == "hello" and response.get("ok"):
+            result = response["result"]
+            self.codec = make_codec(result["codec"], result["ascii"])
+
+    def encode(self, response: Dict) -> bytes:
+        """Encode one message, filling in `metrics.encode_ms` on timed responses.
+
+        A timed response is encoded once with `ENCODE_MS_PENDING` moved to the
+        very end of the message, and the measured time is spliced over it.
+        Msgpack floats are fixed-width, so the frame length stays valid.
+        """
+        result = response.get("result")
+        metrics = result.get("metrics") if isinstance(result, dict) else None
+        if not isinstance(metrics, dict) or "encode_ms" not in metrics or metrics["encode_ms"] is not None:
+            return self.codec.encode(response)
+        # Copies, not reorders: the log writer may still be encoding `metrics`.
+        frame = {key: value for key, value in response.items() if key != "result"}
+        frame["result"] = {key: value for key, value in result.items() if key != "metrics"}
+        frame["result"]["metrics"] = {key: value for key, value in metrics.items() if key != "encode_ms"}
+        frame["result"]["metrics"]["encode_ms"] = ENCODE_MS_PENDING
+        started = time.perf_counter()
+        data = self.codec.encode(frame)
+        encode_ms = round((time.perf_counter() - started) * 1000, 3)
+        pending = self.codec.encode_value(ENCODE_MS_PENDING)
+        at = data.rfind(pending)
+        return data[:at] + self.codec.encode_value(encode_ms) + data[at + len(pending) :]
+
+
+def _stdout_writer(wire: Wire) -> Callable[[Dict], None]:
+    out = sys.stdout.buffer
+
+    def write(obj: Dict) -> None:
+        data = wire.encode(obj)
+        with _WRITE_LOCK:
+            out.write(data)
+            out.flush()
+
+    return write
+
+
+class LogWriter:
+    """Background writer for the `--log` JSONL trace.
+
+    `write` only queues the event; a daemon thread encodes queued events in
+    batches of up to `batch_size`, writes each batch with one call, and
+    fsyncs at most every `fsync_interval` seconds (0 syncs every batch). An
+    event that would take the file past `max_bytes` goes to a fresh file after
+    rotating the current one to `PATH.1` ... `PATH.<backups>`.
+    When the queue is full, `overflow="block"` waits for room and `"drop"`
+    discards the event; dropped events are reported in a `log_dropped` event.
+    If writing fails (e.g. a full disk), the error is reported on stderr and
+    kept in `error`, and every later event is dropped so no request blocks.
+    """
+
+    _CLOSE = object()
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 0,
+        backups: int = LOG_BACKUPS,
+        fsync_interval: float = LOG_FSYNC_INTERVAL,
+        overflow: str = "block",
+        queue_size: int = LOG_QUEUE_SIZE,
+        batch_size: int = LOG_BATCH_SIZE,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.fsync_interval = fsync_interval
+        self.overflow = overflow
+        self.batch_size = max(1, batch_size)
+        self.dropped = 0
+        self.error: Optional[BaseException] = None
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._handle = open(path, "ab")
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="zeno-log", daemon=True)
+        self._thread.start()
+
+    def write(self, event: Dict) -> None:
+        if self._closed:
+            return
+        if self.error is not None:
+            with _LOG_LOCK:
+                self.dropped += 1
+        elif self.overflow == "drop":
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                with _LOG_LOCK:
+                    self.dropped += 1
+        else:
+            self._queue.put(event)
+
+    def close(self) -> None:
+        """Write everything still queued, fsync and close the file.
+
+        Waits at most `LOG_CLOSE_TIMEOUT` seconds for the writer thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(self._CLOSE, timeout=LOG_CLOSE_TIMEOUT)
+        except queue.Full:
+            pass
+        self._thread.join(LOG_CLOSE_TIMEOUT)
+        if self._thread.is_alive():
+            print(f"zeno_server: log writer still busy after {LOG_CLOSE_TIMEOUT:g}s; not flushed", file=sys.stderr)
+            return
+        try:
+            self._handle.close()
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        try:
+            self._write_loop()
+        except Exception as exc:  # noqa: BLE001
+            self.error = exc
+            print(f"zeno_server: log writer failed, dropping further events: {exc}", file=sys.stderr)
+            # Keep draining so writers blocked on a full queue, and close(), return.
+            while self._queue.get() is not self._CLOSE:
+                with _LOG_LOCK:
+                    self.dropped += 1
+
+    def _write_loop(self) -> None:
+        last_sync = time.monotonic()
+        unsynced = False
+        while True:
+            timeout = max(0.0, last_sync + self.fsync_interval - time.monotonic()) if unsynced else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            batch: List[Dict] = []
+            while item is not None and item is not self._CLOSE:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    item = None
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            with _LOG_LOCK:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                batch.append({"ts": _utc_ts(), "event": "log_dropped", "count": dropped})
+            if batch:
+                self._write_batch(batch)
+                unsynced = True
+            closing = item is self._CLOSE
+            if unsynced and (closing or time.monotonic() - last_sync >= self.fsync_interval):
+                os.fsync(self._handle.fileno())
+                last_sync = time.monotonic()
+                unsynced = False
+            if closing:
+                return
+
+    def _write_batch(self, batch: List[Dict]) -> None:
+        size = self._handle.tell()
+        chunk: List[bytes] = []
+        for event in batch:
+            data = _LOG_CODEC.encode(event)
+            if self.max_bytes and size and size + len(data) > self.max_bytes:
+                self._handle.write(b"".join(chunk))
+                self._rotate()
+                chunk, size = [], 0
+            chunk.append(data)
+            size += len(data)
+        self._handle.write(b"".join(chunk))
+        self._handle.flush()
+
+    def _rotate(self) -> None:
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        self._handle.close()
+        if self.backups > 0:
+            for idx in range(self.backups - 1, 0, -1):
+                older = f"{self.path}.{idx}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self.path}.{idx + 1}")
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.1")
+        self._handle = open(self.path, "wb")
+
+
+def _log(log_handle: Optional[LogWriter], event: Dict) -> None:
+    if log_handle is not None:
+        log_handle.write(event)
 
 
 def _realpath(path: str) -> str:
     return os.path.realpath(path)
 
 
+class FileReader:
+    """Positional reads on an open descriptor, safe to share across threads."""
+
+    def __init__(self, fd: int) -> None:
+        self.fd = fd
+        self.stat = os.fstat(fd)
+
+    def pread(self, size: int, offset: int) -> bytes:
+        return os.pread(self.fd, size, offset)
+
+
+class BatchScope:
+    """State shared by the sub-requests of one batch.
+
+    Descriptors are opened once per file and the file inventory is
+    revalidated once per filter set instead of once per sub-request.
+    """
+
+    def __init__(self) -> None:
+        self._readers: Dict[str, FileReader] = {}
+        self.listings: Dict[Tuple, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def reader(self, path: str) -> FileReader:
+        with self._lock:
+            reader = self._readers.get(path)
+            if reader is None:
+                reader = self._readers[path] = FileReader(os.open(path, os.O_RDONLY))
+            return reader
+
+    def close(self) -> None:
+        with self._lock:
+            for reader in self._readers.values():
+                os.close(reader.fd)
+            self._readers.clear()
+
+
+_BATCH: contextvars.ContextVar[Optional[BatchScope]] = contextvars.ContextVar("zeno_batch", default=None)
+
+
+@contextmanager
+def _open_reader(path: str) -> Iterator[FileReader]:
+    scope = _BATCH.get()
+    if scope is not None:
+        yield scope.reader(path)
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        yield FileReader(fd)
+    finally:
+        os.close(fd)
+
+
+def _line_starts(reader: FileReader) -> array:
+    """Byte offset of every line start, plus a final sentinel at EOF.
+
+    Lines end at `\\n`, `\\r\\n` or a lone `\\r`, as with universal newlines.
+    Blocks without `\\r` are split in C and the offsets accumulated without
+    a per-line Python loop.
+    """
+    starts = array("q", [0])
+    base = 0
+    while True:
+        block = reader.pread(LINE_INDEX_BLOCK_SIZE, base)
+        if not block:
+            break
+        if block.endswith(b"\r") and reader.pread(1, base + len(block)) == b"\n":
+            # Keep a "\r\n" that straddles two blocks in one piece.
+            block += b"\n"
+        if b"\r" in block:
+            starts.extend(base + found.end() for found in _NEWLINE_RE.finditer(block))
+        else:
+            pieces = block.split(b"\n")
+            offsets = accumulate(map(add, map(len, pieces[:-1]), repeat(1)), initial=base)
+            next(offsets)
+            starts.extend(offsets)
+        base += len(block)
+    if starts[-1] != base:
+        starts.append(base)
+    return starts
+
+
+def _count_lines(reader: FileReader) -> Tuple[int, int]:
+    """Return (line count, bytes read) without decoding."""
+    count = 0
+    size = 0
+    last = b""
+    while True:
+        block = reader.pread(LINE_INDEX_BLOCK_SIZE, size)
+        if not block:
+            break
+        count += block.count(b"\n")
+        if b"\r" in block:
+            count += block.count(b"\r") - block.count(b"\r\n")
+        if last == b"\r" and block.startswith(b"\n"):
+            count -= 1
+        size += len(block)
+        last = block[-1:]
+    if size and last not in (b"\n", b"\r"):
+        count += 1
+    return count, size
+
+
+def _nth_line_end(data: bytes, count: int) -> Optional[int]:
+    """Offset just past the `count`-th line break in `data`, or None."""
+    if b"\r" in data:
+        for found in islice(_NEWLINE_RE.finditer(data), count - 1, None):
+            return found.end()
+        return None
+    cut = -1
+    for _ in range(count):
+        cut = data.find(b"\n", cut + 1)
+        if cut < 0:
+            return None
+    return cut + 1
+
+
+def _nth_line_start_from_end(data: bytes, count: int) -> Optional[int]:
+    """Offset where the last `count` lines of `data` begin, or None when it holds fewer."""
+    if b"\r" in data:
+        ends = [found.end() for found in _NEWLINE_RE.finditer(data)]
+        if ends and ends[-1] == len(data):
+            ends.pop()
+        return ends[-count] if len(ends) >= count else None
+    limit = len(data) - 1 if data.endswith(b"\n") else len(data)
+    cut = limit
+    for _ in range(count):
+        cut = data.rfind(b"\n", 0, cut)
+        if cut < 0:
+            return None
+    return cut + 1
+
+
+def _read_head(reader: FileReader, size: int, count: int) -> Tuple[bytes, int]:
+    """Return (raw bytes of the first `count` lines, bytes read)."""
+    if count <= 0 or size == 0:
+        return b"", 0
+    data = b""
+    while len(data) < size:
+        block = reader.pread(PEEK_BLOCK_SIZE, len(data))
+        if not block:
+            break
+        data += block
+        end = _nth_line_end(data, count)
+        # A "\r" at the end of the data may be the first half of "\r\n".
+        if end is not None and (end < len(data) or not data.endswith(b"\r")):
+            return data[:end], len(data)
+    return data, len(data)
+
+
+def _read_tail(reader: FileReader, size: int, count: int) -> Tuple[bytes, int]:
+    """Return (raw bytes of the last `count` lines, bytes read) by seeking back from EOF."""
+    if count <= 0 or size == 0:
+        return b"", 0
+    data = b""
+    pos = size
+    while pos > 0:
+        step = min(PEEK_BLOCK_SIZE, pos)
+        pos -= step
+        data = reader.pread(step, pos) + data
+        start = _nth_line_start_from_end(data, count)
+        if start is not None:
+            return data[start:], len(data)
+    return data, len(data)
+
+
+def _split_lines(data: bytes) -> List[str]:
+    if not data:
+        return []
+    text = data.decode("utf-8", errors="replace")
+    lines = _TEXT_NEWLINE_RE.split(text) if "\r" in text else text.split("\n")
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+class LineIndexCache:
+    """LRU of per-file line offsets keyed by inode, size and mtime."""
+
+    def __init__(self, max_entries: int = LINE_INDEX_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int, int], array]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(st: os.stat_result) -> Tuple[int, int, int]:
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def lookup(self, path: str, st: os.stat_result) -> Optional[array]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != self._key(st):
+                return None
+            self._entries.move_to_end(path)
+            return entry[1]
+
+    def get(self, path: str, reader: FileReader) -> Tuple[array, int]:
+        """Return (line starts, bytes read to build them) for an open file."""
+        st = reader.stat
+        starts = self.lookup(path, st)
+        if starts is not None:
+            return starts, 0
+        starts = _line_starts(reader)
+        with self._lock:
+            self._entries[path] = (self._key(st), starts)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return starts, starts[-1]
+
+
+# (mtime_ns, size) of a path a listing depends on; size is None for directories.
+_Sig = Optional[Tuple[int, Optional[int]]]
+
+
+def _file_sig(path: str) -> _Sig:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _git_dir(root: str) -> Optional[str]:
+    """Absolute git directory for a root inside a work tree, else None."""
+    try:
+        proc = subprocess.run(
+            ["git", "-C", root, "rev-parse", "--absolute-git-dir"],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    except OSError:
+        return None
+    if proc.returncode != 0:
+        return None
+    return proc.stdout.strip() or None
+
+
+class _DirNode:
+    __slots__ = ("mtime_ns", "entries", "ignore_files")
+
+    def __init__(self, mtime_ns: int, entries: List[Tuple[str, bool]]) -> None:
+        self.mtime_ns = mtime_ns
+        self.entries = entries
+        self.ignore_files = tuple(name for name, is_dir in entries if name in IGNORE_FILES and not is_dir)
+
+
+class FileInventory:
+    """Process-lifetime cache of the directory tree under root.
+
+    Each directory listing is kept in memory and revalidated with a single
+    stat of the directory (its mtime changes whenever entries are added,
+    removed or renamed). Only directories that changed are listed again.
+    Callers may pass literal directory prefixes from their globs so that
+    only those subtrees are walked. Directory listings are prefetched on a
+    small thread pool and consumed in path order, so a capped listing stops
+    early with the same files a full sorted listing would start with.
+    `.gitignore`/`.zenoignore` rules are applied while walking, so ignored
+    subtrees are never listed. A walk cut short by `stop` is not kept.
+
+    When root is inside a git work tree, ignore-aware listings come from
+    `git ls-files` instead (`git="auto"` adds untracked files, `"tracked"`
+    lists the index only, `"off"` always walks). They are revalidated by the
+    git index, ignore files and directory mtimes, and fall back to the walker
+    whenever git fails.
+    """
+
+    def __init__(self, root: str, git: str = "auto", walk_workers: int = WALK_WORKERS) -> None:
+        self.root = root
+        self.git = git
+        self.walk_workers = max(1, walk_workers)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._git_dir: Optional[str] = _git_dir(root) if git != "off" else None
+        self._nodes: Dict[str, _DirNode] = {}
+        self._flat: "OrderedDict[Tuple, Tuple[List[Tuple[str, _Sig]], List[str]]]" = OrderedDict()
+        self._ignores = IgnoreCache()
+        self._lock = threading.Lock()
+
+    def _full(self, rel_dir: str) -> str:
+        return os.path.join(self.root, rel_dir) if rel_dir else self.root
+
+    def _list_dir(self, rel_dir: str, mtime_ns: int) -> Tuple[_DirNode, int]:
+        entries = scandir_entries(self._full(rel_dir)) or []
+        node = _DirNode(mtime_ns, entries)
+        self._nodes[rel_dir] = node
+        return node, sum(1 for _, is_dir in entries if not is_dir)
+
+    def _node(self, rel_dir: str) -> Tuple[Optional[_DirNode], int]:
+        try:
+            mtime_ns = os.stat(self._full(rel_dir)).st_mtime_ns
+        except OSError:
+            self._nodes.pop(rel_dir, None)
+            return None, 0
+        node = self._nodes.get(rel_dir)
+        if node is not None and node.mtime_ns == mtime_ns:
+            return node, 0
+        return self._list_dir(rel_dir, mtime_ns)
+
+    def _is_fresh(self, sigs: List[Tuple[str, _Sig]]) -> bool:
+        for rel, sig in sigs:
+            try:
+                st = os.stat(self._full(rel))
+            except OSError:
+                if sig is not None:
+                    return False
+                continue
+            if sig is None or sig != (st.st_mtime_ns, st.st_size if sig[1] is not None else None):
+                return False
+        return True
+
+    def _start(
+        self,
+        prefix: str,
+        include_hidden: bool,
+        exclude_dir_set: frozenset,
+        use_ignore: bool,
+        sigs: List[Tuple[str, _Sig]],
+    ) -> Optional[Tuple[IgnoreRules, ...]]:
+        """Return the ignore chain for a walk starting at `prefix`, or None if a
+        full walk would never have descended into it."""
+        chain: Tuple[IgnoreRules, ...] = ()
+        rel = ""
+        for name in prefix.split("/") if prefix else []:
+            if use_ignore:
+                node, _ = self._node(rel)
+                if node is None:
+                    sigs.append((rel, None))
+                    return None
+                sigs.append((rel, (node.mtime_ns, None)))
+                chain, seen = self._ignores.extend(chain, self._full(rel), rel, node.ignore_files)
+                sigs.extend(seen)
+            rel = f"{rel}/{name}" if rel else name
+            if (not include_hidden and name.startswith(".")) or name in exclude_dir_set:
+                return None
+            if use_ignore and is_ignored(chain, rel, True):
+                return None
+        full = self._full(prefix)
+        if _realpath(full) != full and os.path.exists(full):
+            return None
+        return chain
+
+    @staticmethod
+    def _key(
+        include_hidden: bool,
+        exclude_dirs: Iterable[str],
+        prefixes: Optional[Tuple[str, ...]] = None,
+        use_ignore: bool = True,
+        exclude_globs: Iterable[str] = (),
+        limit: Optional[int] = None,
+        glob_syntax: str = "fnmatch",
+    ) -> Tuple:
+        excludes = tuple(sorted(exclude_globs))
+        return (include_hidden, frozenset(exclude_dirs), prefixes, use_ignore, excludes, limit, glob_syntax)
+
+    def files(
+        self,
+        include_hidden: bool,
+        exclude_dirs: Iterable[str],
+        prefixes: Optional[Tuple[str, ...]] = None,
+        use_ignore: bool = True,
+        exclude_globs: Iterable[str] = (),
+        limit: Optional[int] = None,
+        glob_syntax: str = "fnmatch",
+        stop: Optional[Callable[[], object]] = None,
+        visit: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[List[str], int]:
+        """Return (sorted relative file paths, files listed from disk by this call).
+
+        With `prefixes`, only files under those root-relative directories are
+        returned. With `use_ignore`, `.gitignore`/`.zenoignore` rules apply.
+        Files matching `exclude_globs` (in `glob_syntax`) are skipped, and the walk stops once
+        `limit` files have been found in path order, or early with a partial
+        listing once `stop()` returns a true value. `visit(rel)` sees every
+        returned path in order, while the walk runs when the tree is walked.
+        """
+        scope = _BATCH.get()
+        key = self._key(include_hidden, exclude_dirs, prefixes, use_ignore, exclude_globs, limit, glob_syntax)
+        walked = 0
+
+        def on_file(rel: str) -> None:
+            nonlocal walked
+            walked += 1
+            visit(rel)
+
+        if scope is not None and key in scope.listings:
+            files, listed = scope.listings[key], 0
+        else:
+            with self._lock:
+                files, listed, complete = self._files(key, stop, on_file if visit is not None else None)
+            if scope is not None and complete:
+                scope.listings[key] = files
+        if visit is not None:
+            # Cached and git listings arrive whole; a walk has visited its files already.
+            for rel in files[walked:]:
+                visit(rel)
+        return files, listed
+
+    def _files(
+        self,
+        key: Tuple,
+        stop: Optional[Callable[[], object]] = None,
+        visit: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[List[str], int, bool]:
+        include_hidden, exclude_dir_set, prefixes, use_ignore, exclude_globs, limit, glob_syntax = key
+        cached = self._flat.get(key)
+        if cached is not None and self._is_fresh(cached[0]):
+            self._flat.move_to_end(key)
+            return cached[1], 0, True
+
+        listing = self._git_files(key) if use_ignore and self._git_dir else None
+        if listing is not None:
+            sigs, files, listed = listing
+            self._store(key, sigs, files)
+            return files, listed, True
+
+        sigs: List[Tuple[str, _Sig]] = []
+        counts: List[int] = []
+        starts: List[Tuple[str, Tuple[IgnoreRules, ...]]] = []
+        for prefix in prefixes or ("",):
+            chain = self._start(prefix, include_hidden, exclude_dir_set, use_ignore, sigs)
+            if chain is not None:
+                starts.append((prefix, chain))
+
+        def list_dir(rel_dir: str) -> Optional[List[Tuple[str, bool]]]:
+            node, count = self._node(rel_dir)
+            if node is None:
+                # A missing prefix directory keeps the listing stale until it exists.
+                sigs.append((rel_dir, None))
+                return None
+            counts.append(count)
+            sigs.append((rel_dir, (node.mtime_ns, None)))
+            return node.entries
+
+        seen: List[Tuple[str, Tuple[int, int]]] = []
+        files = walk_files(
+            starts,
+            list_dir,
+            self._walk_pool(),
+            include_hidden,
+            exclude_dir_set,
+            self.root,
+            ignores=self._ignores if use_ignore else None,
+            exclude=compile_globs(exclude_globs, glob_syntax),
+            limit=limit,
+            seen=seen,
+            stop=stop,
+            visit=visit,
+        )
+        if stop is not None and stop():
+            return files, sum(counts), False
+        sigs.extend(seen)
+        self._store(key, sigs, files)
+        return files, sum(counts), True
+
+    def _walk_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.walk_workers, thread_name_prefix="zeno-walk")
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _store(self, key: Tuple, sigs: List[Tuple[str, _Sig]], files: List[str]) -> None:
+        self._flat[key] = (sigs, files)
+        self._flat.move_to_end(key)
+        while len(self._flat) > INVENTORY_LISTING_CACHE_SIZE:
+            self._flat.popitem(last=False)
+
+    def _git_files(self, key: Tuple) -> Optional[Tuple[List[Tuple[str, _Sig]], List[str], int]]:
+        include_hidden, exclude_dir_set, prefixes, _, exclude_globs, limit, glob_syntax = key
+        assert self._git_dir is not None
+        sigs: List[Tuple[str, _Sig]] = []
+        for path in (os.path.join(self._git_dir, "index"), os.path.join(self._git_dir, "info", "exclude")):
+            sigs.append((path, _file_sig(path)))
+        start_ns = time.time_ns()
+        raw = git_list_files(self.root, prefixes, untracked=self.git != "tracked")
+        if raw is None:
+            return None
+
+        dirs = {""}
+        ignore_dirs = {""}
+        for path in raw:
+            rel_dir, _, name = path.rpartition("/")
+            if name in IGNORE_FILES:
+                ignore_dirs.add(rel_dir)
+                if name == ".gitignore":
+                    sigs.append((path, _file_sig(self._full(path))))
+            while rel_dir not in dirs:
+                dirs.add(rel_dir)
+                rel_dir = rel_dir.rpartition("/")[0]
+        for prefix in prefixes or ():
+            parts = prefix.split("/")
+            dirs.update("/".join(parts[:idx]) for idx in range(1, len(parts) + 1))
+            ignore_dirs.update("/".join(parts[:idx]) for idx in range(len(parts)))
+        for rel_dir in sorted(dirs):
+            try:
+                mtime_ns: Optional[int] = os.stat(self._full(rel_dir)).st_mtime_ns
+            except OSError:
+                sigs.append((rel_dir, None))
+                continue
+            # A directory changed while git was listing may hide a new entry.
+            sigs.append((rel_dir, (mtime_ns if mtime_ns < start_ns else -1, None)))
+
+        files = filter_listing(raw, include_hidden, exclude_dir_set)
+        files, seen = apply_ignore_files(self.root, files, self._ignores, ignore_dirs)
+        sigs.extend(seen)
+        excluded = compile_globs(exclude_globs, glob_syntax)
+        if excluded:
+            files = [rel for rel in files if not excluded.match(rel)]
+        return sigs, files[:limit], len(raw)
+
+    def listing_paths(self, *args) -> List[str]:
+        """Return absolute paths of the directories and ignore files behind a previous `files(*args)` call."""
+        cached = self._flat.get(self._key(*args))
+        return [self._full(rel) for rel, _ in cached[0]] if cached else []
+
+
+class PhaseTimes:
+    """Opt-in per-request phase breakdown (`timings: true`) kept in perf_counter seconds.
+
+    Instances are picklable so process-pool grep workers can return theirs.
+    """
+
+    PHASES = ("walk", "filter", "io", "match")
+
+    def __init__(self) -> None:
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.skipped_size = 0
+        self.skipped_binary = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - started
+
+    def merge(self, other: "PhaseTimes") -> None:
+        for name, seconds in other.seconds.items():
+            self.seconds[name] += seconds
+        self.skipped_size += other.skipped_size
+        self.skipped_binary += other.skipped_binary
+
+    def metrics(self) -> Dict:
+        out: Dict = {f"{name}_ms": round(seconds * 1000, 3) for name, seconds in self.seconds.items()}
+        out["files_skipped_size"] = self.skipped_size
+        out["files_skipped_binary"] = self.skipped_binary
+        return out
+
+
+def _timed(phases: Optional[PhaseTimes], name: str):
+    """`phases.phase(name)`, or a no-op when the request did not ask for timings."""
+    return phases.phase(name) if phases is not None else nullcontext()
+
+
+class RequestContext:
+    """Per-request state visible to op handlers through `_REQUEST`."""
+
+    def __init__(self, req_id, op: Optional[str]) -> None:
+        self.id = req_id
+        self.op = op
+        self.emit: Optional[Callable[[Dict], None]] = None
+        self.touched: Optional[List[str]] = None
+        self.listings: List[Tuple] = []
+        self.session: Optional[SessionBudget] = None
+        self.parent: Optional[RequestContext] = None
+        self.deadline: Optional[float] = None
+        self.cancelled = False
+        self.phases: Optional[PhaseTimes] = None
+        self.profiled = False
+
+    def interrupted(self) -> Optional[str]:
+        """Return "cancelled" or "timed_out" once this request or its batch should stop."""
+        ctx: Optional[RequestContext] = self
+        while ctx is not None:
+            if ctx.cancelled:
+                return "cancelled"
+            if ctx.deadline is not None and time.monotonic() >= ctx.deadline:
+                return "timed_out"
+            ctx = ctx.parent
+        return None
+
+
+_REQUEST: contextvars.ContextVar[Optional[RequestContext]] = contextvars.ContextVar("zeno_request", default=None)
+
+
+def _stream_emitter() -> Optional[Callable[[Dict], None]]:
+    """Return the partial-frame writer when the current request asked to stream."""
+    ctx = _REQUEST.get()
+    return ctx.emit if ctx is not None else None
+
+
+def _request_phases() -> Optional[PhaseTimes]:
+    ctx = _REQUEST.get()
+    return ctx.phases if ctx is not None else None
+
+
+def _interrupted() -> Optional[str]:
+    """Cooperative stop check for scanning loops; see `RequestContext.interrupted`."""
+    ctx = _REQUEST.get()
+    return ctx.interrupted() if ctx is not None else None
+
+
+def _track_paths(paths: Iterable[str]) -> None:
+    """Record files the current request read, when its result may be cached."""
+    ctx = _REQUEST.get()
+    if ctx is not None and ctx.touched is not None:
+        ctx.touched.extend(paths)
+
+
+def _track_listing(*args) -> None:
+    """Record the `FileInventory.files` arguments of a listing the current request used."""
+    ctx = _REQUEST.get()
+    if ctx is not None and ctx.touched is not None:
+        ctx.listings.append(args)
+
+
+class SessionBudget:
+    """Retrieval budget shared by the requests of one session.
+
+    A session is the stdin/stdout stream or one daemon connection. `ops`
+    counts requests other than `batch` and `session`, `lines` counts lines
+    returned (read_file/peek excerpts, grep hits plus their context) and
+    `bytes` counts bytes read from disk. Unset limits are unbounded.
+    """
+
+    KINDS = ("ops", "lines", "bytes")
+
+    def __init__(self, limits: Optional[Dict] = None) -> None:
+        self._lock = threading.Lock()
+        self.limits: Dict[str, int] = {}
+        self.used = dict.fromkeys(self.KINDS, 0)
+        self.configure(limits or {})
+
+    def configure(self, limits: Dict) -> None:
+        """Replace the limits and start counting from zero."""
+        parsed: Dict[str, int] = {}
+        for kind, value in limits.items():
+            if kind not in self.KINDS:
+                raise ValueError(f"unknown budget limit: {kind}")
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ValueError(f"budget limit {kind} must be a non-negative integer")
+            parsed[kind] = value
+        with self._lock:
+            self.limits = parsed
+            self.used = dict.fromkeys(self.KINDS, 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.used = dict.fromkeys(self.KINDS, 0)
+
+    def _over(self, kinds: Iterable[str]) -> Optional[str]:
+        for kind in kinds:
+            limit = self.limits.get(kind)
+            if limit is not None and self.used[kind] >= limit:
+                return kind
+        return None
+
+    def exhausted(self) -> Optional[str]:
+        with self._lock:
+            return self._over(self.KINDS)
+
+    def start_op(self) -> Optional[str]:
+        """Count one op, or return the exhausted limit that refuses it."""
+        with self._lock:
+            kind = self._over(self.KINDS)
+            if kind is None:
+                self.used["ops"] += 1
+            return kind
+
+    def lines_left(self) -> Optional[int]:
+        with self._lock:
+            limit = self.limits.get("lines")
+            return None if limit is None else max(0, limit - self.used["lines"])
+
+    def charge(self, bytes_read: int = 0, line_costs: Sequence[int] = ()) -> Tuple[int, Optional[str]]:
+        """Add bytes read and as many `line_costs` items as fit in the lines budget.
+
+        Returns the number of items charged and the limit ("lines" first,
+        then "bytes") that is now used up, if any; items that do not fit are
+        not charged.
+        """
+        with self._lock:
+            self.used["bytes"] += bytes_read
+            limit = self.limits.get("lines")
+            fit = 0
+            for cost in line_costs:
+                if limit is not None and self.used["lines"] + cost > limit:
+                    return fit, "lines"
+                self.used["lines"] += cost
+                fit += 1
+            return fit, self._over(("lines", "bytes"))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            report = {}
+            for kind in self.KINDS:
+                limit = self.limits.get(kind)
+                used = self.used[kind]
+                remaining = None if limit is None else max(0, limit - used)
+                report[kind] = {"limit": limit, "used": used, "remaining": remaining}
+            return report
+
+
+def _session_budget() -> Optional[SessionBudget]:
+    ctx = _REQUEST.get()
+    return ctx.session if ctx is not None else None
+
+
+def _charge_budget(bytes_read: int = 0, line_costs: Sequence[int] = ()) -> Tuple[int, Optional[str]]:
+    """Charge the current session's budget; see `SessionBudget.charge`."""
+    budget = _session_budget()
+    if budget is None:
+        return len(line_costs), None
+    return budget.charge(bytes_read, line_costs)
+
+
+def _hit_lines(hit: Dict) -> int:
+    return 1 + len(hit.get("context", ()))
+
+
+def _stat_sig(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class _OpStats:
+    __slots__ = ("count", "errors", "total_ms", "max_ms", "buckets", "bytes_read", "files_scanned", "hits", "misses")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(STATS_BUCKETS_MS) + 1)
+        self.bytes_read = 0
+        self.files_scanned = 0
+        self.hits = 0
+        self.misses = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile, capped by the slowest request."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(STATS_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(float(bound), round(self.max_ms, 3))
+        return round(self.max_ms, 3)
+
+    def report(self) -> Dict:
+        busy_s = self.total_ms / 1000
+        report = {
+            "count": self.count,
+            "errors": self.errors,
+            "time_ms": {
+                "total": round(self.total_ms, 3),
+                "mean": round(self.total_ms / self.count, 3) if self.count else None,
+                "max": round(self.max_ms, 3),
+                "p50": self.percentile(0.50),
+                "p90": self.percentile(0.90),
+                "p99": self.percentile(0.99),
+            },
+            "histogram": [
+                {"le_ms": bound, "count": count} for bound, count in zip(STATS_BUCKETS_MS + (None,), self.buckets)
+            ],
+            "bytes_read": self.bytes_read,
+            "files_scanned": self.files_scanned,
+            "bytes_per_s": round(self.bytes_read / busy_s) if busy_s else None,
+        }
+        if self.hits or self.misses:
+            report["cache"] = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / (self.hits + self.misses), 4),
+            }
+        return report
+
+
+class ServerStats:
+    """In-process per-op counters and latency histograms for the `stats` op.
+
+    Latency is measured around each request (batch sub-requests count under
+    their own ops) and bucketed by `STATS_BUCKETS_MS`; percentiles report the
+    upper bound of the bucket they fall in. With `dump_path`, a daemon thread
+    appends a `stats` snapshot to that JSONL file every `dump_interval`
+    seconds and once more on close.
+    """
+
+    def __init__(self, dump_path: Optional[str] = None, dump_interval: float = STATS_DUMP_INTERVAL) -> None:
+        self._lock = threading.Lock()
+        self._ops: Dict[str, _OpStats] = {}
+        self.started = time.monotonic()
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if dump_path:
+            self._thread = threading.Thread(target=self._dump_loop, name="zeno-stats", daemon=True)
+            self._thread.start()
+
+    def record(self, op: str, elapsed_ms: float, result: Optional[Dict]) -> None:
+        """Count one finished request; `result` is None when it failed."""
+        metrics = result.get("metrics", {}) if result is not None else {}
+        bucket = next((idx for idx, bound in enumerate(STATS_BUCKETS_MS) if elapsed_ms <= bound), len(STATS_BUCKETS_MS))
+        with self._lock:
+            stats = self._ops.get(op)
+            if stats is None:
+                stats = self._ops[op] = _OpStats()
+            stats.count += 1
+            stats.errors += result is None
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.buckets[bucket] += 1
+            stats.bytes_read += metrics.get("bytes_read", 0)
+            stats.files_scanned += metrics.get("files_scanned", 0)
+            if "cache_hit" in metrics:
+                stats.hits += metrics["cache_hit"]
+                stats.misses += not metrics["cache_hit"]
+
+    def snapshot(self, reset: bool = False) -> Dict:
+        with self._lock:
+            ops = {op: self._ops[op].report() for op in sorted(self._ops)}
+            uptime_s = time.monotonic() - self.started
+            if reset:
+                self._ops = {}
+                self.started = time.monotonic()
+        requests = sum(report["count"] for report in ops.values())
+        return {
+            "uptime_s": round(uptime_s, 3),
+            "requests": requests,
+            "requests_per_s": round(requests / uptime_s, 3) if uptime_s > 0 else None,
+            "ops": ops,
+        }
+
+    def _dump(self) -> None:
+        event = {"ts": _utc_ts(), "event": "stats", **self.snapshot()}
+        with open(self.dump_path, "ab") as handle:
+            handle.write(_LOG_CODEC.encode(event))
+
+    def _dump_loop(self) -> None:
+        while not self._stop.wait(self.dump_interval):
+            self._dump()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._dump()
+
+
+def _profile_name(req_id, op: str) -> str:
+    """File name stem for a request's profile: its id made filesystem-safe."""
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", str(req_id)) if req_id is not None else ""
+    return stem.strip(".") or op
+
+
+def _trace_events(stats: Dict, name: str, total_us: float) -> List[Dict]:
+    """Lay a cProfile caller graph out as Chrome trace "X" events.
+
+    cProfile keeps aggregate times, not a timeline, so each function is drawn
+    as one span per call path sized by its cumulative time under that caller,
+    with children packed left to right. Read it as a flame chart.
+    """
+    children: Dict[Tuple, List[Tuple[Tuple, float]]] = {}
+    roots: List[Tuple[Tuple, float]] = []
+    for func, (_, _, _, cumtime, callers) in stats.items():
+        if not callers:
+            roots.append((func, cumtime))
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    pid = os.getpid()
+    tid = threading.get_ident()
+    events = [{"name": name, "cat": "request", "ph": "X", "ts": 0, "dur": round(total_us, 3), "pid": pid, "tid": tid}]
+
+    def place(funcs: List[Tuple[Tuple, float]], ts: float, end: float, depth: int, stack: Tuple) -> None:
+        for func, cumtime in sorted(funcs, key=lambda item: -item[1]):
+            dur = min(cumtime * 1e6, end - ts)
+            if dur < PROFILE_TRACE_MIN_US or len(events) >= PROFILE_TRACE_MAX_EVENTS:
+                return
+            if func in stack:
+                continue
+            filename, line, func_name = func
+            events.append(
+                {
+                    "name": func_name,
+                    "cat": "python",
+                    "ph": "X",
+                    "ts": round(ts, 3),
+                    "dur": round(dur, 3),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"file": filename, "line": line, "calls": stats[func][1]},
+                }
+            )
+            if depth < PROFILE_TRACE_DEPTH:
+                place(children.get(func, []), ts, ts + dur, depth + 1, stack + (func,))
+            ts += dur
+
+    place(roots, 0.0, total_us, 1, ())
+    return events
+
+
+def _write_profile(profile_dir: str, req_id, op: str, profiler: cProfile.Profile, elapsed: float) -> Dict:
+    """Write `<id>.pstats` and `<id>.trace.json` under `profile_dir` and return their paths."""
+    stem = os.path.join(profile_dir, _profile_name(req_id, op))
+    pstats_path = stem + ".pstats"
+    trace_path = stem + ".trace.json"
+    profiler.dump_stats(pstats_path)
+    trace = {
+        "traceEvents": _trace_events(pstats.Stats(profiler).stats, op, elapsed * 1e6),
+        "displayTimeUnit": "ms",
+        "otherData": {"id": req_id, "op": op, "profiler": "cProfile"},
+    }
+    with open(trace_path, "w", encoding="utf-8") as handle:
+        json.dump(trace, handle)
+    return {"profiler": "cProfile", "pstats": pstats_path, "trace": trace_path}
+
+
+class ResultCache:
+    """Bounded LRU of op results validated against the paths they depend on.
+
+    Each entry records (size, mtime_ns) for every file the op read and every
+    directory listed for it. A lookup re-stats those paths and evicts the
+    entry on any mismatch, so edits, additions and deletions invalidate it.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Dict, List[Tuple[str, Optional[Tuple[int, int]]]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(op: str, args: Dict) -> Optional[str]:
+        normalized = {k: v for k, v in args.items() if k not in CACHE_IGNORED_ARGS}
+        try:
+            return op + "\0" + json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        result, deps = entry
+        if any(_stat_sig(path) != sig for path, sig in deps):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: Dict, paths: Iterable[str]) -> bool:
+        racy_ns = time.time_ns() - CACHE_RACY_WINDOW_NS
+        deps = []
+        for path in dict.fromkeys(paths):
+            sig = _stat_sig(path)
+            if sig is not None and sig[1] >= racy_ns:
+                return False
+            deps.append((path, sig))
+        with self._lock:
+            self._entries[key] = (result, deps)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+
+def _glob_syntax(args: Dict) -> str:
+    """Return the request's `glob_syntax` ("fnmatch" unless it asks for "path")."""
+    syntax = args.get("glob_syntax", "fnmatch")
+    if syntax not in GLOB_SYNTAXES:
+        raise ValueError(f"unknown glob_syntax: {syntax} (expected one of {', '.join(GLOB_SYNTAXES)})")
+    return syntax
+
+
+def _resolve_under(root: str, path: str) -> str:
+    if os.path.isabs(path):
+        candidate = _realpath(path)
+    else:
+        candidate = _realpath(os.path.join(root, path))
+    if candidate == root:
+        return candidate
+    if not candidate.startswith(root + os.sep):
+        raise ValueError("path outside root")
+    return candidate
+
+
+def _required_literals(pattern: str, flags: int) -> Tuple[List[str], bool]:
+    """Return (literal runs every match must contain, ignorecase) for a regex.
+
+    Only top-level concatenations (and plain groups inside them) are walked;
+    alternations, classes and repeats end the current run.
+    """
+    try:
+        parsed = _sre_parse.parse(pattern, flags)
+    except Exception:  # noqa: BLE001
+        return [], bool(flags & re.IGNORECASE)
+    ignorecase = bool(parsed.state.flags & re.IGNORECASE)
+    runs: List[str] = []
+    current: List[str] = []
+
+    def walk(items) -> None:
+        for op, av in items:
+            if op == _sre_constants.LITERAL:
+                current.append(chr(av))
+            elif op == _sre_constants.SUBPATTERN and not av[1] and not av[2]:
+                walk(av[3])
+            elif current:
+                runs.append("".join(current))
+                current.clear()
+
+    walk(list(parsed))
+    if current:
+        runs.append("".join(current))
+    return runs, ignorecase
+
+
+def _needs_line_scan(pattern: str, flags: int) -> bool:
+    """Whether a regex may match differently across the whole text than within one line.
+
+    `\\A`, `\\Z` and lookarounds see past line ends when the pattern is run
+    over the whole text, so such patterns are tested line by line.
+    """
+    try:
+        parsed = _sre_parse.parse(pattern, flags)
+    except Exception:  # noqa: BLE001
+        return True
+
+    def walk(node) -> bool:
+        if isinstance(node, _sre_parse.SubPattern):
+            for op, av in node:
+                if op in (_sre_constants.ASSERT, _sre_constants.ASSERT_NOT):
+                    return True
+                if op == _sre_constants.AT:
+                    if av in (_sre_constants.AT_BEGINNING_STRING, _sre_constants.AT_END_STRING):
+                        return True
+                elif walk(av):
+                    return True
+            return False
+        if isinstance(node, (list, tuple)):
+            return any(walk(item) for item in node)
+        return False
+
+    return walk(parsed)
+
+
+def _ascii_fold_prefilter(literal: str) -> re.Pattern:
+    """Case-insensitive bytes search for an ASCII literal, including its non-ASCII case folds."""
+    parts: List[bytes] = []
+    for char in literal:
+        part = re.escape(char.encode("ascii"))
+        alternates = _FOLD_ALTERNATES.get(char.lower())
+        if alternates:
+            part = b"(?:" + b"|".join([part] + [re.escape(alt.encode("utf-8")) for alt in alternates]) + b")"
+        parts.append(part)
+    return re.compile(b"".join(parts), re.IGNORECASE)
+
+
+class GrepMatcher:
+    """Line matcher plus a bytes-level prefilter for one grep pattern.
+
+    `might_match` runs over the raw (mmapped) bytes so files without a
+    candidate are never decoded. `finder` locates candidates in decoded text
+    and `is_match` confirms them one line at a time, which keeps the original
+    per-line semantics. `finder` is None for regexes that must be run line by
+    line (see `_needs_line_scan`).
+    """
+
+    def __init__(self, pattern: str, regex_enabled: bool, case_sensitive: bool) -> None:
+        self.needle: Optional[bytes] = None
+        self.prefilter: Optional[re.Pattern] = None
+        if regex_enabled:
+            flags = 0 if case_sensitive else re.IGNORECASE
+            regex = re.compile(pattern, flags)
+            self.finder: Optional[re.Pattern] = None
+            if not _needs_line_scan(pattern, flags):
+                self.finder = re.compile(pattern, flags | re.MULTILINE)
+            self.is_match: Callable[[str], bool] = lambda line: regex.search(line) is not None
+            runs, ignorecase = _required_literals(pattern, flags)
+            literal = max(runs, key=len) if runs else ""
+        else:
+            self.finder = re.compile(re.escape(pattern), 0 if case_sensitive else re.IGNORECASE)
+            if case_sensitive:
+                self.is_match = lambda line: pattern in line
+            else:
+                lowered = pattern.lower()
+                self.is_match = lambda line: lowered in line.lower()
+            literal, ignorecase = pattern, not case_sensitive
+        if not literal:
+            return
+        if not ignorecase:
+            self.needle = literal.encode("utf-8")
+        elif literal.isascii():
+            self.prefilter = _ascii_fold_prefilter(literal)
+
+    def might_match(self, buf) -> bool:
+        if self.needle is not None:
+            return buf.find(self.needle) >= 0
+        if self.prefilter is not None:
+            return self.prefilter.search(buf) is not None
+        return True
+
+
+class MultiMatcher:
+    """Single-pass matcher for several `GrepMatcher`s (used by grep_multi).
+
+    All literal and regex patterns are folded into one bytes alternation for
+    the file-level prefilter and one text alternation for locating candidate
+    lines; each candidate line is then confirmed against every pattern so
+    hits can be tagged with the pattern that produced them.
+    """
+
+    def __init__(self, matchers: List[GrepMatcher]) -> None:
+        self.matchers = matchers
+        self.prefilter = self._combine_prefilters(matchers)
+        self.finder = self._combine_finders(matchers)
+
+    @staticmethod
+    def _combine_prefilters(matchers: List[GrepMatcher]) -> Optional[re.Pattern]:
+        parts: List[bytes] = []
+        for matcher in matchers:
+            if matcher.needle is not None:
+                parts.append(re.escape(matcher.needle))
+            elif matcher.prefilter is not None:
+                parts.append(b"(?i:" + matcher.prefilter.pattern + b")")
+            else:
+                return None
+        return re.compile(b"|".join(parts))
+
+    @staticmethod
+    def _combine_finders(matchers: List[GrepMatcher]) -> Optional[re.Pattern]:
+        parts: List[str] = []
+        for matcher in matchers:
+            if matcher.finder is None:
+                return None
+            source = matcher.finder.pattern
+            if _BACKREF_RE.search(source):
+                # Group numbers shift inside an alternation; test line by line instead.
+                return None
+            if matcher.finder.flags & re.IGNORECASE:
+                parts.append(f"(?i:{source})")
+            else:
+                parts.append(f"(?:{source})")
+        try:
+            return re.compile("|".join(parts), re.MULTILINE)
+        except re.error:
+            return None
+
+    def might_match(self, buf) -> bool:
+        return self.prefilter is None or self.prefilter.search(buf) is not None
+
+
+class TrigramIndex:
+    """Read side of the trigram index written by `zeno_index.py --trigrams`.
+
+    The index narrows grep candidates to files containing every trigram of the
+    pattern's required literals. Files missing from the index, or whose size or
+    mtime changed since it was built, are always kept as candidates. The file
+    is memory-mapped and only the posting lists a query needs are decoded.
+    """
+
+    def __init__(self, path: str, root: str) -> None:
+        self.path = path
+        self.root = root
+        self._mtime_ns: Optional[int] = None
+        self._files: Dict[str, Tuple[int, int, int]] = {}
+        self._index: Optional[IndexFile] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Optional[IndexFile]:
+        with self._lock:
+            return self._index if self._reload() else None
+
+    def _reload(self) -> bool:
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime_ns == self._mtime_ns:
+            return bool(self._files)
+        self._mtime_ns = mtime_ns
+        self._files = {}
+        # A replaced mapping is closed when the last query using it lets go.
+        self._index = None
+        try:
+            index = IndexFile(self.path)
+        except (OSError, ValueError) as exc:
+            print(f"zeno_server: ignoring trigram index {self.path}: {exc}", file=sys.stderr)
+            return False
+        if _realpath(index.meta.get("root", "")) != self.root:
+            return False
+        self._index = index
+        self._files = {rel: (file_id, size, mtime) for file_id, (rel, size, mtime) in enumerate(index.meta["files"])}
+        return True
+
+    @staticmethod
+    def _grams(literals: Iterable[str], ignorecase: bool) -> List[bytes]:
+        grams = set()
+        for literal in literals:
+            raw = literal.encode("utf-8").lower()
+            for idx in range(len(raw) - 2):
+                gram = raw[idx : idx + 3]
+                # The index lowercases ASCII only, so under IGNORECASE a gram with a
+                # letter that has non-ASCII folds (K for U+212A) could miss files.
+                if ignorecase and (not gram.isascii() or not _FOLD_BYTES.isdisjoint(gram)):
+                    continue
+                grams.add(gram)
+        return sorted(grams)
+
+    def candidates(self, literals: Iterable[str], ignorecase: bool) -> Optional[set]:
+        """Return the ids of indexed files that may match, or None when the index cannot help."""
+        index = self._load()
+        if index is None:
+            return None
+        spans = []
+        for gram in self._grams(literals, ignorecase):
+            if index.is_dense(gram):
+                continue
+            span = index.lookup(gram)
+            if span is None:
+                return set()
+            spans.append(span)
+        if not spans:
+            return None
+        ids: Optional[set] = None
+        # Shorter encodings hold fewer files; intersect the most selective first.
+        for span in sorted(spans, key=lambda span: span[1] - span[0]):
+            posting = index.postings(span)
+            ids = set(posting) if ids is None else ids.intersection(posting)
+            if not ids:
+                break
+        return ids
+
+    def narrow(self, root: str, rels: List[str], ids: set) -> List[str]:
+        kept: List[str] = []
+        for rel in rels:
+            entry = self._files.get(rel)
+            if entry is None:
+                kept.append(rel)
+                continue
+            file_id, size, mtime_ns = entry
+            if file_id in ids:
+                kept.append(rel)
+                continue
+            try:
+                st = os.stat(os.path.join(root, rel))
+            except OSError:
+                continue
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                kept.append(rel)
+        return kept
+
+
+def _load_text(
+    full: str,
+    might_match: Callable[..., bool],
+    phases: Optional[PhaseTimes] = None,
+    skip_binary: bool = False,
+) -> Tuple[Optional[str], int]:
+    """Return (decoded text or None, bytes read).
+
+    The file is mmapped and tested with the bytes prefilter first; text is
+    only decoded when the prefilter finds a candidate. With `skip_binary`,
+    files with a NUL byte in their first `BINARY_SNIFF_BYTES` are skipped.
+    When timed, the prefilter counts as match time and the rest as io time.
+    """
+    started = time.perf_counter() if phases is not None else 0.0
+    matching = 0.0
+    try:
+        with open(full, "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size == 0:
+                return None, 0
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                if skip_binary and buf.find(b"\0", 0, BINARY_SNIFF_BYTES) >= 0:
+                    if phases is not None:
+                        phases.skipped_binary += 1
+                    return None, min(size, BINARY_SNIFF_BYTES)
+                if phases is None:
+                    candidate = might_match(buf)
+                else:
+                    before = time.perf_counter()
+                    candidate = might_match(buf)
+                    matching = time.perf_counter() - before
+                if not candidate:
+                    return None, size
+                text = buf[:].decode("utf-8", errors="replace")
+    except (OSError, ValueError):
+        return None, 0
+    finally:
+        if phases is not None:
+            phases.seconds["match"] += matching
+            phases.seconds["io"] += time.perf_counter() - started - matching
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, size
+
+
+def _candidate_lines(text: str, finder: Optional[re.Pattern]) -> Iterator[Tuple[int, int, int]]:
+    """Yield (line number, start, end) for each line holding a `finder` match.
+
+    With no finder every line is yielded. Line numbers are counted lazily
+    between candidates.
+    """
+    line_no = 1
+    counted_to = 0
+    pos = 0
+    end = len(text)
+    while pos <= end:
+        if finder is None:
+            line_start = pos
+        else:
+            found = finder.search(text, pos)
+            if found is None:
+                break
+            line_start = text.rfind("\n", 0, found.start()) + 1
+        if line_start == end and end:
+            break
+        line_end = text.find("\n", line_start)
+        if line_end < 0:
+            line_end = end
+        line_no += text.count("\n", counted_to, line_start)
+        counted_to = line_start
+        yield line_no, line_start, line_end
+        pos = line_end + 1
+
+
+def _grep_file(
+    full: str,
+    rel: str,
+    matcher: GrepMatcher,
+    context: int,
+    max_hits: int,
+    phases: Optional[PhaseTimes] = None,
+    skip_binary: bool = False,
+) -> Tuple[List[Dict], int]:
+    """Return (hits, bytes read) for one file, stopping after `max_hits` hits.
+
+    Line numbers and context are computed only around candidates, so
+    non-matching files are never decoded or split into lines.
+    """
+    text, size = _load_text(full, matcher.might_match, phases, skip_binary)
+    if text is None:
+        return [], size
+    hits: List[Dict] = []
+    with _timed(phases, "match"):
+        for line_no, line_start, line_end in _candidate_lines(text, matcher.finder):
+            line = text[line_start:line_end]
+            if matcher.is_match(line):
+                hit = {"path": rel, "line": line_no, "text": line}
+                if context > 0:
+                    hit["context"] = _context_lines(text, line_start, line_end, line_no, context)
+                hits.append(hit)
+                if len(hits) >= max_hits:
+                    break
+    return hits, size
+
+
+def _context_lines(text: str, line_start: int, line_end: int, line_no: int, context: int) -> List[Dict]:
+    before: List[Dict] = []
+    cursor = line_start
+    for offset in range(1, context + 1):
+        if cursor == 0:
+            break
+        prev_start = text.rfind("\n", 0, cursor - 1) + 1
+        before.append({"line": line_no - offset, "text": text[prev_start : cursor - 1]})
+        cursor = prev_start
+    before.reverse()
+    lines = before + [{"line": line_no, "text": text[line_start:line_end]}]
+    cursor = line_end
+    for offset in range(1, context + 1):
+        if cursor >= len(text) - 1:
+            break
+        next_end = text.find("\n", cursor + 1)
+        if next_end < 0:
+            next_end = len(text)
+        lines.append({"line": line_no + offset, "text": text[cursor + 1 : next_end]})
+        cursor = next_end
+    return lines
+
+
+def _grep_files(
+    root: str, rels: Iterable[str], spec: Tuple, phases: Optional[PhaseTimes] = None
+) -> Iterator[Tuple[str, List[Dict], int]]:
+    """Yield (rel, hits, bytes read) per file; `spec` is the picklable grep configuration."""
+    pattern, regex_enabled, case_sensitive, context, max_bytes, skip_binary, max_hits = spec
+    matcher = GrepMatcher(pattern, regex_enabled, case_sensitive)
+    for rel in rels:
+        try:
+            full = _resolve_under(root, rel)
+            size = os.path.getsize(full)
+        except (OSError, ValueError):
+            # Missing files, and symlinks that resolve outside the root, are skipped.
+            yield rel, [], 0
+            continue
+        if size > max_bytes:
+            if phases is not None:
+                phases.skipped_size += 1
+            yield rel, [], 0
+            continue
+        file_hits, file_bytes = _grep_file(full, rel, matcher, context, max_hits, phases, skip_binary)
+        yield rel, file_hits, file_bytes
+
+
+def _grep_chunk(root: str, rels: List[str], spec: Tuple, timed: bool = False) -> Dict:
+    """Process-pool entry point: grep one chunk of files."""
+    started = time.perf_counter()
+    max_hits = spec[-1]
+    phases = PhaseTimes() if timed else None
+    files: List[Tuple[str, List[Dict], int]] = []
+    bytes_read = 0
+    hit_count = 0
+    for rel, file_hits, file_bytes in _grep_files(root, rels, spec, phases):
+        files.append((rel, file_hits, file_bytes))
+        bytes_read += file_bytes
+        hit_count += len(file_hits)
+        if hit_count >= max_hits:
+            break
+    return {
+        "pid": os.getpid(),
+        "files": files,
+        "bytes_read": bytes_read,
+        "time_ms": round((time.perf_counter() - started) * 1000, 3),
+        "phases": phases,
+    }
+
+
+def _scan_symbols(lines: Iterable[str], max_symbols: int) -> Tuple[List[Dict], int, bool]:
+    """Return (symbols, bytes read, truncated), stopping after `max_symbols` symbols."""
+    symbols: List[Dict] = []
+    bytes_read = 0
+    for idx, raw in enumerate(lines, start=1):
+        bytes_read += len(raw)
+        line = raw.rstrip("\n")
+        for kind, regex in SYMBOL_PATTERNS:
+            match = regex.search(line)
+            if match:
+                symbols.append({"kind": kind, "name": match.group(1), "line": idx})
+                if len(symbols) >= max_symbols:
+                    return symbols, bytes_read, True
+    return symbols, bytes_read, False
+
+
 class ZenoServer:
-    def __init__(self, root: str, log_handle) -> None:
+    def __init__(
+        self,
+        root: str,
+        log_handle,
+        workers: int = 0,
+        trigram_index: Optional[str] = None,
+        cache_size: int = RESULT_CACHE_SIZE,
+        git: str = "auto",
+        budget: Optional[Dict[str, int]] = None,
+        ensure_ascii: bool = True,
+        stats_file: Optional[str] = None,
+        stats_interval: float = STATS_DUMP_INTERVAL,
+        profile_dir: Optional[str] = None,
+    ) -> None:
         self.root = _realpath(root)
         self.log_handle = log_handle
+        self.workers = workers or os.cpu_count() or 1
+        self.trigram_index = TrigramIndex(_realpath(trigram_index), self.root) if trigram_index else None
+        self.ops: Dict[str, Callable[[Dict], Dict]] = {
+            "list_files": self.list_files,
+            "read_file": self.read_file,
+            "grep": self.grep,
+            "grep_multi": self.grep_multi,
+            "peek": self.peek,
+            "extract_symbols": self.extract_symbols,
+            "stat": self.stat,
+            "batch": self.batch,
+            "session": self.session,
+            "cancel": self.cancel,
+            "hello": self.hello,
+            "stats": self.stats,
+        }
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.inventory = FileInventory(self.root, git=git)
+        self.line_index = LineIndexCache()
+        self.result_cache = ResultCache(cache_size) if cache_size > 0 else None
+        self.budget = dict(budget or {})
+        self.ensure_ascii = ensure_ascii
+        self.op_stats = ServerStats(stats_file, stats_interval)
+        self._in_flight: Dict[Tuple, RequestContext] = {}
+        self._in_flight_lock = threading.Lock()
+        self.profile_dir = os.path.abspath(profile_dir) if profile_dir else None
+        self._profile_lock = threading.Lock()
+
+    def new_wire(self) -> Wire:
+        """Start a request stream on JSONL with the server's default escaping."""
+        return Wire(JsonCodec(self.ensure_ascii))
+
+    def new_session(self) -> SessionBudget:
+        """Start a session budget with the server's default (`--budget`) limits."""
+        return SessionBudget(self.budget)
+
+    def run(self, op: str, args: Dict) -> Dict:
+        """Dispatch one op, serving idempotent ones from the result cache."""
+        handler = self.ops[op]
+        ctx = _REQUEST.get()
+        if ctx is not None and ctx.profiled:
+            return self._run_profiled(op, handler, args, ctx)
+        if ctx is not None and ctx.phases is not None:
+            return self._run_timed(handler, args, ctx.phases)
+        cache = self.result_cache
+        if cache is None or op not in CACHEABLE_OPS or ctx is None or ctx.emit is not None:
+            return handler(args)
+        key = cache.key(op, args)
+        if key is None:
+            return handler(args)
+        start_ms = _now_ms()
+        cached = cache.get(key)
+        if cached is not None and _charge_budget(line_costs=[sum(map(_hit_lines, cached.get("hits", ())))])[0]:
+            metrics = dict(cached["metrics"], time_ms=_now_ms() - start_ms, bytes_read=0, files_scanned=0)
+            metrics["cache_hit"] = True
+            return {**cached, "metrics": metrics}
+        ctx.touched = []
+        result = handler(args)
+        result["metrics"]["cache_hit"] = False
+        paths = ctx.touched
+        for listing in ctx.listings:
+            paths.extend(self.inventory.listing_paths(*listing))
+        ctx.touched = None
+        if not any(flag in result for flag in ("budget_exhausted", "timed_out", "cancelled")):
+            cache.put(key, result, paths)
+        return result
+
+    def _run_timed(self, handler: Callable[[Dict], Dict], args: Dict, phases: PhaseTimes) -> Dict:
+        """Run a handler uncached and add its phase breakdown to `metrics`.
+
+        `encode_ms` stays None until `Wire.encode` writes the response. Batch
+        sub-requests are encoded with the whole batch and leave it out.
+        """
+        result = handler(args)
+        metrics = result["metrics"]
+        metrics.update(phases.metrics())
+        if _REQUEST.get().parent is None:
+            metrics["encode_ms"] = None
+        return result
+
+    def _run_profiled(self, op: str, handler: Callable[[Dict], Dict], args: Dict, ctx: RequestContext) -> Dict:
+        """Run a handler uncached under cProfile and point `result["profile"]` at the output.
+
+        One request is profiled at a time; the profile covers the request's
+        own thread, so parallel batch sub-requests and grep workers show up
+        only as the time spent waiting on them.
+        """
+        if self.profile_dir is None:
+            raise ValueError("profiling is disabled; start the server with --profile-dir")
+        if not self._profile_lock.acquire(blocking=False):
+            raise ValueError("another request is being profiled")
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            if ctx.phases is not None:
+                result = profiler.runcall(self._run_timed, handler, args, ctx.phases)
+            else:
+                result = profiler.runcall(handler, args)
+            elapsed = time.perf_counter() - started
+            os.makedirs(self.profile_dir, exist_ok=True)
+            result["profile"] = _write_profile(self.profile_dir, ctx.id, op, profiler, elapsed)
+        finally:
+            self._profile_lock.release()
+        return result
+
+    @contextmanager
+    def cancellable(self, ctx: RequestContext) -> Iterator[None]:
+        """Register a running request so `cancel` from the same session can reach it."""
+        key = (ctx.session, ctx.id) if isinstance(ctx.id, (str, int)) else None
+        if key is not None:
+            with self._in_flight_lock:
+                self._in_flight[key] = ctx
+        try:
+            yield
+        finally:
+            if key is not None:
+                with self._in_flight_lock:
+                    if self._in_flight.get(key) is ctx:
+                        del self._in_flight[key]
 
     def _resolve(self, path: str) -> str:
-        if os.path.isabs(path):
-            candidate = _realpath(path)
-        else:
-            candidate = _realpath(os.path.join(self.root, path))
-        if candidate == self.root:
-            return candidate
-        if not candidate.startswith(self.root + os.sep):
-            raise ValueError("path outside root")
-        return candidate
+        return _resolve_under(self.root, path)
+
+    def close(self) -> None:
+        self.inventory.close()
+        self.op_stats.close()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
 
     def _rel(self, path: str) -> str:
         return os.path.relpath(path, self.root)
@@ -94,25 +1974,16 @@ class ZenoServer:
         exclude_dirs: Iterable[str],
         exclude_globs: Iterable[str],
         max_files: int,
+        prefixes: Optional[Tuple[str, ...]] = None,
+        use_ignore: bool = True,
+        glob_syntax: str = "fnmatch",
+        visit: Optional[Callable[[str], None]] = None,
     ) -> Tuple[List[str], int]:
-        results: List[str] = []
-        scanned = 0
-        exclude_dir_set = set(exclude_dirs)
-        for root, dirs, files in os.walk(self.root):
-            if not include_hidden:
-                dirs[:] = [d for d in dirs if not d.startswith(".")]
-                files = [f for f in files if not f.startswith(".")]
-            dirs[:] = [d for d in dirs if d not in exclude_dir_set]
-            for fname in files:
-                full = os.path.join(root, fname)
-                rel = os.path.relpath(full, self.root)
-                scanned += 1
-                if any(fnmatch.fnmatchcase(rel, g) for g in exclude_globs):
-                    continue
-                results.append(rel)
-                if len(results) >= max_files:
-                    return sorted(results), scanned
-        return sorted(results), scanned
+        listing = (include_hidden, exclude_dirs, prefixes, use_ignore, exclude_globs, max_files, glob_syntax)
+        with _timed(_request_phases(), "walk"):
+            files, scanned = self.inventory.files(*listing, stop=_interrupted, visit=visit)
+        _track_listing(*listing)
+        return files, scanned
 
     def list_files(self, args: Dict) -> Dict:
         start_ms = _now_ms()
@@ -124,28 +1995,62 @@ class ZenoServer:
         exclude_globs = args.get("exclude_globs") or []
         exclude_dirs = list(set(exclude_dirs).union(DEFAULT_EXCLUDE_DIRS))
         max_files = int(args.get("max_files", DEFAULT_MAX_FILES))
-        files, scanned = self._iter_files(include_hidden, exclude_dirs, exclude_globs, max_files)
-
+        glob_syntax = _glob_syntax(args)
+        include = compile_globs([glob_pat], glob_syntax) if glob_pat else None
+        prefixes = include.prefixes if include else None
+        regex = re.compile(regex_pat) if regex_pat and not include else None
+        emit = _stream_emitter()
         matched: List[str] = []
-        if glob_pat:
-            for rel in files:
-                if fnmatch.fnmatchcase(rel, glob_pat):
-                    matched.append(rel)
-        elif regex_pat:
-            regex = re.compile(regex_pat)
-            for rel in files:
-                if regex.search(rel):
-                    matched.append(rel)
+        chunk: List[str] = []
+
+        def visit(rel: str) -> None:
+            # Streaming filters each path as the walk finds it, so the first
+            # frame goes out before the walk ends; its filter time counts as walk.
+            if (include and not include.match(rel)) or (regex and not regex.search(rel)):
+                return
+            matched.append(rel)
+            if len(matched) <= max_n:
+                chunk.append(rel)
+                if len(chunk) == STREAM_CHUNK_FILES:
+                    emit({"files": chunk[:]})
+                    chunk.clear()
+
+        files, scanned = self._iter_files(
+            include_hidden,
+            exclude_dirs,
+            exclude_globs,
+            max_files,
+            prefixes,
+            use_ignore=not args.get("no_ignore", False),
+            glob_syntax=glob_syntax,
+            visit=visit if emit is not None else None,
+        )
+        stopped = _interrupted()
+
+        if emit is not None:
+            if chunk:
+                emit({"files": chunk})
         else:
-            matched = files
+            with _timed(_request_phases(), "filter"):
+                if include:
+                    matched = include.filter(files)
+                elif regex:
+                    matched = [rel for rel in files if regex.search(rel)]
+                else:
+                    matched = files
 
-        truncated = len(matched) > max_n
-        result = {"files": matched[:max_n], "truncated": truncated}
+        truncated = len(matched) > max_n or stopped is not None
+        result = {"files": [] if emit else matched[:max_n], "truncated": truncated}
+        if stopped:
+            result[stopped] = True
         result["metrics"] = {
             "time_ms": _now_ms() - start_ms,
             "bytes_read": 0,
             "files_scanned": scanned,
         }
+        if emit is not None:
+            result["streamed"] = True
+            result["metrics"]["files"] = min(len(matched), max_n)
         return result
 
     def read_file(self, args: Dict) -> Dict:
@@ -162,27 +2067,29 @@ class ZenoServer:
         end_line = max(start_line, end_line)
         max_end_line = min(end_line, start_line + max_lines - 1)
         truncated = (end_line - start_line + 1) > max_lines
+        exhausted: Optional[str] = None
 
         excerpt: List[str] = []
-        total_lines = 0
-        bytes_read = 0
-        with open(resolved, "r", encoding="utf-8", errors="replace") as handle:
-            for idx, raw in enumerate(handle, start=1):
-                total_lines = idx
-                bytes_read += len(raw)
-                line = raw.rstrip("\n")
-                if idx < start_line:
-                    continue
-                if idx > max_end_line:
-                    continue
-                excerpt.append(line)
-
-        if total_lines < start_line:
-            end_line = total_lines
-            excerpt = []
-            truncated = False
-        else:
-            end_line = min(total_lines, max_end_line)
+        with _timed(_request_phases(), "io"), _open_reader(resolved) as reader:
+            starts, bytes_read = self.line_index.get(resolved, reader)
+            total_lines = len(starts) - 1
+            if total_lines < start_line:
+                end_line = total_lines
+                truncated = False
+            else:
+                end_line = min(total_lines, max_end_line)
+                budget = _session_budget()
+                lines_left = budget.lines_left() if budget is not None else None
+                if lines_left is not None and end_line - start_line + 1 > lines_left:
+                    end_line = start_line + lines_left - 1
+                    truncated = True
+                    exhausted = "lines"
+                if end_line >= start_line:
+                    begin = starts[start_line - 1]
+                    data = reader.pread(starts[end_line] - begin, begin)
+                    bytes_read += len(data)
+                    excerpt = _split_lines(data)
+        _charge_budget(bytes_read, [len(excerpt)])
 
         result = {
             "path": self._rel(resolved),
@@ -192,6 +2099,8 @@ class ZenoServer:
             "truncated": truncated,
             "text": "\n".join(excerpt),
         }
+        if exhausted:
+            result["budget_exhausted"] = exhausted
         result["metrics"] = {
             "time_ms": _now_ms() - start_ms,
             "bytes_read": bytes_read,
@@ -209,37 +2118,72 @@ class ZenoServer:
         tail_lines = int(args.get("tail_lines", 60))
         resolved = self._resolve(path)
 
-        head: List[str] = []
-        tail = deque(maxlen=max(0, tail_lines))
-        total_lines = 0
-        bytes_read = 0
-        with open(resolved, "r", encoding="utf-8", errors="replace") as handle:
-            for idx, raw in enumerate(handle, start=1):
-                total_lines = idx
-                bytes_read += len(raw)
-                line = raw.rstrip("\n")
-                if idx <= head_lines:
-                    head.append(line)
-                if tail_lines > 0:
-                    tail.append(line)
-
-        tail_list = list(tail)
-        tail_start = max(1, total_lines - len(tail_list) + 1) if total_lines else 0
+        count_lines = bool(args.get("count_lines", True))
+        exhausted: Optional[str] = None
+        budget = _session_budget()
+        lines_left = budget.lines_left() if budget is not None else None
+        if lines_left is not None and head_lines + tail_lines > lines_left:
+            head_lines = min(head_lines, lines_left)
+            tail_lines = min(tail_lines, lines_left - head_lines)
+            exhausted = "lines"
+
+        with _timed(_request_phases(), "io"), _open_reader(resolved) as reader:
+            st = reader.stat
+            size = st.st_size
+            head_data, head_read = _read_head(reader, size, head_lines)
+            head = _split_lines(head_data)
+            head_bytes = len(head_data)
+
+            if head_bytes >= size:
+                # The head already covers the whole file.
+                tail_data = head_data
+                tail_data_start = 0
+                tail_read = 0
+            else:
+                tail_data, tail_read = _read_tail(reader, size, tail_lines)
+                tail_data_start = size - len(tail_data)
+            tail_list = _split_lines(tail_data)[-tail_lines:] if tail_lines > 0 else []
+            bytes_read = head_read + tail_read
+
+            total_lines: Optional[int]
+            starts = self.line_index.lookup(resolved, st)
+            if starts is not None:
+                total_lines = len(starts) - 1
+            elif head_bytes >= size:
+                total_lines = len(head)
+            elif tail_data_start == 0:
+                total_lines = len(_split_lines(tail_data))
+            elif count_lines or size <= PEEK_BLOCK_SIZE:
+                # Counting is a C-level scan; files within one block cost no more to count than to peek.
+                total_lines, counted = _count_lines(reader)
+                bytes_read += counted
+            else:
+                total_lines = None
+
+        _charge_budget(bytes_read, [len(head) + len(tail_list)])
+        if not tail_list:
+            tail_start, tail_end = 0, 0
+        elif total_lines is None:
+            tail_start, tail_end = None, None
+        else:
+            tail_start, tail_end = max(1, total_lines - len(tail_list) + 1), total_lines
 
         result = {
             "path": self._rel(resolved),
             "total_lines": total_lines,
             "head": {
-                "start_line": 1 if total_lines else 0,
+                "start_line": 1 if head else 0,
                 "end_line": len(head),
                 "text": "\n".join(head),
             },
             "tail": {
                 "start_line": tail_start,
-                "end_line": total_lines,
+                "end_line": tail_end,
                 "text": "\n".join(tail_list),
             },
         }
+        if exhausted:
+            result["budget_exhausted"] = exhausted
         result["metrics"] = {
             "time_ms": _now_ms() - start_ms,
             "bytes_read": bytes_read,
@@ -264,96 +2208,284 @@ class ZenoServer:
 
         max_files = int(args.get("max_files", DEFAULT_MAX_FILES))
         max_bytes = int(args.get("max_bytes", DEFAULT_MAX_BYTES))
-        all_files, scanned = self._iter_files(include_hidden, exclude_dirs, exclude_globs, max_files)
-        selected: List[str] = []
-        if paths:
-            for rel in all_files:
-                if any(fnmatch.fnmatchcase(rel, p) or rel == p for p in paths):
-                    selected.append(rel)
-        else:
-            selected = all_files
+        glob_syntax = _glob_syntax(args)
+        include = compile_globs(paths, glob_syntax) if paths else None
+        prefixes = include.prefixes if include else None
+        all_files, scanned = self._iter_files(
+            include_hidden,
+            exclude_dirs,
+            exclude_globs,
+            max_files,
+            prefixes,
+            use_ignore=not args.get("no_ignore", False),
+            glob_syntax=glob_syntax,
+        )
+        phases = _request_phases()
+        with _timed(phases, "filter"):
+            selected = include.filter(all_files) if include else all_files
+        _track_paths(os.path.join(self.root, rel) for rel in selected)
 
-        if regex_enabled:
-            flags = 0 if case_sensitive else re.IGNORECASE
-            regex = re.compile(pattern, flags)
+        index_used = False
+        candidates = len(selected)
+        if self.trigram_index is not None and bool(args.get("use_index", True)):
+            with _timed(phases, "filter"):
+                if regex_enabled:
+                    literals, ignorecase = _required_literals(pattern, 0 if case_sensitive else re.IGNORECASE)
+                else:
+                    literals, ignorecase = [pattern], not case_sensitive
+                ids = self.trigram_index.candidates(literals, ignorecase)
+                if ids is not None:
+                    index_used = True
+                    selected = self.trigram_index.narrow(self.root, selected, ids)
+                    candidates = len(selected)
 
-            def is_match(line: str) -> bool:
-                return bool(regex.search(line))
+        stopped = _interrupted()
+        if stopped:
+            selected = []
+        parallel = bool(args.get("parallel", False))
+        skip_binary = bool(args.get("skip_binary", False))
+        spec = (pattern, regex_enabled, case_sensitive, context, max_bytes, skip_binary, max_hits)
 
+        hits: List[Dict] = []
+        bytes_read = 0
+        files_scanned = 0
+        truncated = False
+        worker_stats: Dict[int, Dict] = {}
+        if parallel and self.workers > 1 and len(selected) > GREP_CHUNK_FILES:
+            scan = self._grep_parallel(selected, spec, worker_stats, phases)
         else:
-            needle = pattern if case_sensitive else pattern.lower()
+            scan = _grep_files(self.root, selected, spec, phases)
+        emit = _stream_emitter()
+        emitted = 0
+        exhausted: Optional[str] = None
+        with closing(scan):
+            for rel, file_hits, file_bytes in scan:
+                files_scanned += 1
+                bytes_read += file_bytes
+                file_hits = file_hits[: max_hits - len(hits)]
+                fit, exhausted = _charge_budget(file_bytes, [_hit_lines(hit) for hit in file_hits])
+                hits.extend(file_hits[:fit])
+                stopped = _interrupted()
+                if len(hits) >= max_hits or exhausted or stopped:
+                    truncated = True
+                if emit is not None and len(hits) > emitted:
+                    emit({"hits": hits[emitted:]})
+                    emitted = len(hits)
+                if truncated:
+                    break
 
-            def is_match(line: str) -> bool:
-                hay = line if case_sensitive else line.lower()
-                return needle in hay
+        result = {"hits": [] if emit else hits, "truncated": truncated or stopped is not None}
+        if exhausted:
+            result["budget_exhausted"] = exhausted
+        if stopped:
+            result[stopped] = True
+        result["metrics"] = {
+            "time_ms": _now_ms() - start_ms,
+            "bytes_read": bytes_read,
+            "files_scanned": files_scanned,
+            "hits": len(hits),
+        }
+        if emit is not None:
+            result["streamed"] = True
+        if self.trigram_index is not None:
+            result["metrics"]["index_used"] = index_used
+            result["metrics"]["candidates"] = candidates
+        if worker_stats:
+            result["metrics"]["workers"] = [worker_stats[pid] for pid in sorted(worker_stats)]
+        return result
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Forking now would copy locks held by the walk and log threads.
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+            return self._pool
+
+    def _grep_parallel(
+        self,
+        selected: List[str],
+        spec: Tuple,
+        worker_stats: Dict[int, Dict],
+        phases: Optional[PhaseTimes] = None,
+    ) -> Iterator[Tuple[str, List[Dict], int]]:
+        """Fan file chunks out to the process pool and yield results in path order.
+
+        Only a bounded window of chunks is queued at a time so that reaching
+        `max_hits` cancels the work that has not started yet. Worker phase
+        times are summed into `phases`, so they can exceed wall time.
+        """
+        timed = phases is not None
+        pool = self._process_pool()
+        chunks = iter([selected[i : i + GREP_CHUNK_FILES] for i in range(0, len(selected), GREP_CHUNK_FILES)])
+        pending: deque = deque()
+        try:
+            for chunk in islice(chunks, self.workers * 2):
+                pending.append(pool.submit(_grep_chunk, self.root, chunk, spec, timed))
+            while pending:
+                outcome = pending.popleft().result()
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.append(pool.submit(_grep_chunk, self.root, chunk, spec, timed))
+                stats = worker_stats.setdefault(
+                    outcome["pid"],
+                    {"pid": outcome["pid"], "files": 0, "bytes_read": 0, "time_ms": 0.0},
+                )
+                stats["files"] += len(outcome["files"])
+                stats["bytes_read"] += outcome["bytes_read"]
+                stats["time_ms"] = round(stats["time_ms"] + outcome["time_ms"], 3)
+                if timed:
+                    phases.merge(outcome["phases"])
+                yield from outcome["files"]
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def grep_multi(self, args: Dict) -> Dict:
+        start_ms = _now_ms()
+        entries = args.get("patterns") or []
+        if not entries:
+            raise ValueError("missing patterns")
+        paths = args.get("paths")
+        default_max_hits = int(args.get("max_hits", DEFAULT_MAX_HITS))
+        context = int(args.get("context", 0))
+        include_hidden = bool(args.get("include_hidden", False))
+        exclude_dirs = args.get("exclude_dirs") or []
+        exclude_globs = args.get("exclude_globs") or []
+        exclude_dirs = list(set(exclude_dirs).union(DEFAULT_EXCLUDE_DIRS))
+        max_files = int(args.get("max_files", DEFAULT_MAX_FILES))
+        max_bytes = int(args.get("max_bytes", DEFAULT_MAX_BYTES))
+        skip_binary = bool(args.get("skip_binary", False))
+        glob_syntax = _glob_syntax(args)
 
-        hits = []
+        ids: List[str] = []
+        matchers: List[GrepMatcher] = []
+        caps: List[int] = []
+        glob_sets: List[Optional[GlobSet]] = []
+        for idx, entry in enumerate(entries):
+            pattern = entry.get("pattern")
+            if not pattern:
+                raise ValueError(f"missing pattern for entry {idx}")
+            ids.append(str(entry.get("id") or f"p{idx + 1}"))
+            matchers.append(
+                GrepMatcher(
+                    pattern,
+                    bool(entry.get("regex", False)),
+                    bool(entry.get("case_sensitive", True)),
+                )
+            )
+            caps.append(int(entry.get("max_hits", default_max_hits)))
+            globs = entry.get("globs") or paths
+            glob_sets.append(compile_globs(globs, glob_syntax) if globs else None)
+
+        prefixes = None
+        if all(globs is not None for globs in glob_sets):
+            prefixes = compile_globs([g for globs in glob_sets for g in globs.patterns], glob_syntax).prefixes
+        all_files, scanned = self._iter_files(
+            include_hidden,
+            exclude_dirs,
+            exclude_globs,
+            max_files,
+            prefixes,
+            use_ignore=not args.get("no_ignore", False),
+            glob_syntax=glob_syntax,
+        )
+        _track_paths(os.path.join(self.root, rel) for rel in all_files)
+        phases = _request_phases()
+        counts = [0] * len(matchers)
+        combined: Dict[Tuple[int, ...], MultiMatcher] = {}
+        hits: List[Dict] = []
         bytes_read = 0
         files_scanned = 0
-        for rel in selected:
-            full = self._resolve(rel)
+        emit = _stream_emitter()
+        emitted = 0
+        exhausted: Optional[str] = None
+        stopped = _interrupted()
+        for rel in all_files:
+            if emit is not None and len(hits) > emitted:
+                emit({"hits": hits[emitted:]})
+                emitted = len(hits)
+            stopped = _interrupted()
+            if stopped or all(count >= cap for count, cap in zip(counts, caps)):
+                break
+            applies: Dict[GlobSet, bool] = {}
+            active: List[int] = []
+            with _timed(phases, "filter"):
+                for idx, globs in enumerate(glob_sets):
+                    if counts[idx] >= caps[idx]:
+                        continue
+                    if globs is not None:
+                        if globs not in applies:
+                            applies[globs] = globs.match(rel)
+                        if not applies[globs]:
+                            continue
+                    active.append(idx)
+            if not active:
+                continue
+
             files_scanned += 1
             try:
+                full = self._resolve(rel)
                 size = os.path.getsize(full)
-            except OSError:
+            except (OSError, ValueError):
                 continue
             if size > max_bytes:
+                if phases is not None:
+                    phases.skipped_size += 1
                 continue
-            try:
-                with open(full, "r", encoding="utf-8", errors="replace") as handle:
-                    prev_lines = deque(maxlen=context)
-                    pending: deque = deque()
-                    line_iter = enumerate(handle, start=1)
-                    while True:
-                        try:
-                            idx, raw = pending.popleft() if pending else next(line_iter)
-                        except StopIteration:
-                            break
-                        bytes_read += len(raw)
-                        line = raw.rstrip("\n")
-                        if is_match(line):
-                            hit = {
-                                "path": rel,
-                                "line": idx,
-                                "text": line,
-                            }
-                            if context > 0:
-                                ctx_lines = list(prev_lines)
-                                ctx_lines.append({"line": idx, "text": line})
-                                future = []
-                                for _ in range(context):
-                                    try:
-                                        next_idx, next_raw = next(line_iter)
-                                    except StopIteration:
-                                        break
-                                    bytes_read += len(next_raw)
-                                    next_line = next_raw.rstrip("\n")
-                                    future.append({"line": next_idx, "text": next_line})
-                                    pending.append((next_idx, next_raw))
-                                if future:
-                                    ctx_lines.extend(future)
-                                hit["context"] = ctx_lines
-                            hits.append(hit)
-                            if len(hits) >= max_hits:
-                                result = {"hits": hits, "truncated": True}
-                                result["metrics"] = {
-                                    "time_ms": _now_ms() - start_ms,
-                                    "bytes_read": bytes_read,
-                                    "files_scanned": files_scanned,
-                                    "hits": len(hits),
-                                }
-                                return result
-                        prev_lines.append({"line": idx, "text": line})
-            except OSError:
+            key = tuple(active)
+            multi = combined.get(key)
+            if multi is None:
+                multi = combined[key] = MultiMatcher([matchers[idx] for idx in active])
+            text, file_bytes = _load_text(full, multi.might_match, phases, skip_binary)
+            bytes_read += file_bytes
+            _, exhausted = _charge_budget(file_bytes)
+            if text is None:
+                if exhausted:
+                    break
                 continue
+            with _timed(phases, "match"):
+                for line_no, line_start, line_end in _candidate_lines(text, multi.finder):
+                    line = text[line_start:line_end]
+                    for idx in active:
+                        if counts[idx] >= caps[idx] or not matchers[idx].is_match(line):
+                            continue
+                        hit = {"path": rel, "line": line_no, "text": line, "pattern_id": ids[idx]}
+                        if context > 0:
+                            hit["context"] = _context_lines(text, line_start, line_end, line_no, context)
+                        fit, exhausted = _charge_budget(line_costs=[_hit_lines(hit)])
+                        if not fit:
+                            break
+                        hits.append(hit)
+                        counts[idx] += 1
+                    if exhausted == "lines" or all(counts[idx] >= caps[idx] for idx in active):
+                        break
+            if exhausted:
+                break
 
-        result = {"hits": hits, "truncated": False}
+        per_pattern = [
+            {"id": ids[idx], "hits": counts[idx], "truncated": counts[idx] >= caps[idx]}
+            for idx in range(len(matchers))
+        ]
+        if emit is not None and len(hits) > emitted:
+            emit({"hits": hits[emitted:]})
+        result = {
+            "hits": [] if emit else hits,
+            "patterns": per_pattern,
+            "truncated": bool(exhausted or stopped) or any(item["truncated"] for item in per_pattern),
+        }
+        if exhausted:
+            result["budget_exhausted"] = exhausted
+        if stopped:
+            result[stopped] = True
         result["metrics"] = {
             "time_ms": _now_ms() - start_ms,
             "bytes_read": bytes_read,
             "files_scanned": files_scanned,
             "hits": len(hits),
         }
+        if emit is not None:
+            result["streamed"] = True
         return result
 
     def extract_symbols(self, args: Dict) -> Dict:
@@ -363,27 +2495,19 @@ class ZenoServer:
             raise ValueError("missing path")
         max_symbols = int(args.get("max_symbols", 400))
         resolved = self._resolve(path)
+        _track_paths([resolved])
 
-        symbols = []
-        bytes_read = 0
+        phases = _request_phases()
         with open(resolved, "r", encoding="utf-8", errors="replace") as handle:
-            for idx, raw in enumerate(handle, start=1):
-                bytes_read += len(raw)
-                line = raw.rstrip("\n")
-                for kind, regex in SYMBOL_PATTERNS:
-                    match = regex.search(line)
-                    if match:
-                        symbols.append({"kind": kind, "name": match.group(1), "line": idx})
-                        if len(symbols) >= max_symbols:
-                            result = {"path": self._rel(resolved), "symbols": symbols, "truncated": True}
-                            result["metrics"] = {
-                                "time_ms": _now_ms() - start_ms,
-                                "bytes_read": bytes_read,
-                                "files_scanned": 1,
-                                "symbols": len(symbols),
-                            }
-                            return result
-        result = {"path": self._rel(resolved), "symbols": symbols, "truncated": False}
+            if phases is None:
+                symbols, bytes_read, truncated = _scan_symbols(handle, max_symbols)
+            else:
+                with phases.phase("io"):
+                    lines = handle.readlines()
+                with phases.phase("match"):
+                    symbols, bytes_read, truncated = _scan_symbols(lines, max_symbols)
+        _charge_budget(bytes_read)
+        result = {"path": self._rel(resolved), "symbols": symbols, "truncated": truncated}
         result["metrics"] = {
             "time_ms": _now_ms() - start_ms,
             "bytes_read": bytes_read,
@@ -392,6 +2516,58 @@ class ZenoServer:
         }
         return result
 
+    def batch(self, args: Dict) -> Dict:
+        start_ms = _now_ms()
+        requests = args.get("requests")
+        if not isinstance(requests, list) or not requests:
+            raise ValueError("missing requests")
+        for sub in requests:
+            if not isinstance(sub, dict):
+                raise ValueError("batch requests must be objects")
+            if sub.get("op") == "batch":
+                raise ValueError("nested batch is not supported")
+            if sub.get("op") == "hello":
+                raise ValueError("hello must be sent on its own")
+        parallel = bool(args.get("parallel", True))
+        max_parallel = max(1, int(args.get("max_parallel", BATCH_MAX_PARALLEL)))
+        scope = BatchScope()
+
+        def run_all() -> List[Dict]:
+            _BATCH.set(scope)
+            if not parallel or len(requests) == 1:
+                return [_handle_request(self, sub) for sub in requests]
+            with ThreadPoolExecutor(max_workers=min(max_parallel, len(requests))) as executor:
+                futures = [
+                    executor.submit(contextvars.copy_context().run, _handle_request, self, sub) for sub in requests
+                ]
+                return [future.result() for future in futures]
+
+        try:
+            responses = contextvars.copy_context().run(run_all)
+        finally:
+            scope.close()
+
+        bytes_read = 0
+        files_scanned = 0
+        errors = 0
+        for response in responses:
+            if not response["ok"]:
+                errors += 1
+                continue
+            sub_metrics = response["result"].get("metrics", {})
+            bytes_read += sub_metrics.get("bytes_read", 0)
+            files_scanned += sub_metrics.get("files_scanned", 0)
+
+        result = {"results": responses}
+        result["metrics"] = {
+            "time_ms": _now_ms() - start_ms,
+            "bytes_read": bytes_read,
+            "files_scanned": files_scanned,
+            "requests": len(responses),
+            "errors": errors,
+        }
+        return result
+
     def stat(self, args: Dict) -> Dict:
         start_ms = _now_ms()
         path = args.get("path")
@@ -429,11 +2605,511 @@ class ZenoServer:
         }
         return result
 
+    def session(self, args: Dict) -> Dict:
+        start_ms = _now_ms()
+        budget = _session_budget()
+        if budget is None:
+            raise ValueError("no session")
+        if "budget" in args:
+            limits = args.get("budget") or {}
+            if not isinstance(limits, dict):
+                raise ValueError("budget must be an object")
+            budget.configure(limits)
+        elif args.get("reset"):
+            budget.reset()
+
+        result = {"budget": budget.snapshot(), "exhausted": budget.exhausted()}
+        result["metrics"] = {
+            "time_ms": _now_ms() - start_ms,
+            "bytes_read": 0,
+            "files_scanned": 0,
+        }
+        return result
+
+    def cancel(self, args: Dict) -> Dict:
+        start_ms = _now_ms()
+        target = args.get("id")
+        if target is None:
+            raise ValueError("missing id")
+        key = (_session_budget(), target) if isinstance(target, (str, int)) else None
+        with self._in_flight_lock:
+            running = self._in_flight.get(key) if key is not None else None
+        if running is not None:
+            running.cancelled = True
+
+        result = {"id": target, "found": running is not None}
+        result["metrics"] = {
+            "time_ms": _now_ms() - start_ms,
+            "bytes_read": 0,
+            "files_scanned": 0,
+        }
+        return result
+
+    def stats(self, args: Dict) -> Dict:
+        start_ms = _now_ms()
+        result = self.op_stats.snapshot(reset=bool(args.get("reset", False)))
+        result["metrics"] = {
+            "time_ms": _now_ms() - start_ms,
+            "bytes_read": 0,
+            "files_scanned": 0,
+        }
+        return result
+
+    def hello(self, args: Dict) -> Dict:
+        start_ms = _now_ms()
+        wanted = args.get("codec") or ["json"]
+        if isinstance(wanted, str):
+            wanted = [wanted]
+        codec = negotiate(wanted)
+        ensure_ascii = bool(args.get("ascii", self.ensure_ascii)) if codec == "json" else False
+
+        result = {
+            "codec": codec,
+            "ascii": ensure_ascii,
+            "codecs": available_codecs(),
+            "json_encoder": json_encoder(),
+            "root": self.root,
+        }
+        result["metrics"] = {
+            "time_ms": _now_ms() - start_ms,
+            "bytes_read": 0,
+            "files_scanned": 0,
+        }
+        return result
+
+
+def _summary(result: Dict) -> Dict:
+    return {
+        "truncated": result.get("truncated"),
+        "count": len(result.get("files", []))
+        or len(result.get("hits", []))
+        or len(result.get("symbols", []))
+        or len(result.get("items", []))
+        or len(result.get("results", []))
+        or None,
+        "metrics": result.get("metrics", {}),
+    }
+
+
+def _decode_request(raw: bytes, codec: Codec) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """Return (request, None) or (None, error response) for one input message."""
+    try:
+        request = codec.decode(raw)
+    except (ValueError, TypeError) as exc:
+        return None, {"id": None, "ok": False, "error": {"message": str(exc)}}
+    if not isinstance(request, dict):
+        return None, {"id": None, "ok": False, "error": {"message": "request must be an object"}}
+    return request, None
+
+
+def _handle_request(
+    server: "ZenoServer",
+    request: Dict,
+    write: Optional[Callable[[Dict], None]] = None,
+    session: Optional[SessionBudget] = None,
+) -> Dict:
+    """Run one request and return its response envelope, logging both events.
+
+    `write` sends frames to the client; when given and the request sets
+    `stream: true` on a streaming op, partial frames are written through it
+    before the final response is returned. `session` is the budget the
+    request is charged to; sub-requests of a batch inherit the batch's
+    session, deadline and cancellation, and are skipped once it stops.
+    """
+    started = time.perf_counter()
+    log_handle = server.log_handle
+    req_id = request.get("id")
+    op = request.get("op")
+    raw_args = request.get("args") or {}
+    args_dict = raw_args if isinstance(raw_args, dict) else {}
+    parent = _REQUEST.get()
+    ctx = RequestContext(req_id, op)
+    ctx.parent = parent
+    ctx.session = session if session is not None else parent.session if parent is not None else None
+    if write is not None and args_dict.get("stream") and op in STREAMING_OPS:
+        ctx.emit = lambda frame: write({"id": req_id, "partial": True, **frame})
+    if args_dict.get("timings") and op in TIMED_OPS:
+        ctx.phases = PhaseTimes()
+    ctx.profiled = bool(args_dict.get("profile"))
+    _log(log_handle, {"ts": _utc_ts(), "event": "request", "id": req_id, "op": op, "args": raw_args})
+
+    def fail(error: Dict) -> Dict:
+        _log(log_handle, {"ts": _utc_ts(), "event": "error", "id": req_id, "error": error})
+        if op in server.ops:
+            server.op_stats.record(op, (time.perf_counter() - started) * 1000, None)
+        return {"id": req_id, "ok": False, "error": error}
+
+    if op not in server.ops:
+        return fail({"message": f"unknown op: {op}"})
+    if raw_args is not args_dict:
+        return fail({"message": "args must be an object"})
+
+    stopped = parent.interrupted() if parent is not None else None
+    if stopped:
+        return fail({"message": f"batch {stopped.replace('_', ' ')}", stopped: True})
+
+    if ctx.session is not None and op not in UNBUDGETED_OPS:
+        exhausted = ctx.session.start_op()
+        if exhausted:
+            return fail({"message": f"session budget exhausted: {exhausted}", "budget_exhausted": exhausted})
+
+    token = _REQUEST.set(ctx)
+    try:
+        deadline_ms = args_dict.get("deadline_ms")
+        if deadline_ms is not None:
+            ctx.deadline = time.monotonic() + float(deadline_ms) / 1000
+        with server.cancellable(ctx):
+            result = server.run(op, args_dict)
+    except Exception as exc:  # noqa: BLE001
+        return fail({"message": str(exc)})
+    finally:
+        _REQUEST.reset(token)
+    server.op_stats.record(op, (time.perf_counter() - started) * 1000, result)
+    _log(
+        log_handle,
+        {"ts": _utc_ts(), "event": "response", "id": req_id, "op": op, "summary": _summary(result)},
+    )
+    return {"id": req_id, "ok": True, "result": result}
+
+
+def _serve_serial(server: "ZenoServer") -> None:
+    session = server.new_session()
+    wire = server.new_wire()
+    write = _stdout_writer(wire)
+    while True:
+        raw = read_message(sys.stdin.buffer, wire.codec)
+        if raw is None:
+            break
+        request, error = _decode_request(raw, wire.codec)
+        response = error or _handle_request(server, request, write, session)
+        write(response)
+        wire.switch(request, response)
+
+
+async def _serve_lines(
+    server: "ZenoServer",
+    wire: Wire,
+    read_message: Callable[[], Awaitable[Optional[bytes]]],
+    write: Callable[[Dict], None],
+    frame_write: Callable[[Dict], None],
+    executor: ThreadPoolExecutor,
+    slots: asyncio.Semaphore,
+    ordered: bool,
+) -> None:
+    """Run requests read from one stream on a shared pool.
+
+    `write` is called on the event loop with final responses; `frame_write`
+    is called from worker threads with partial frames. Both encode with
+    `wire.encode`. Responses carry the request `id`, so clients can correlate
+    them out of order. With `ordered`, responses are held back and written
+    in request order. The stream is one budget session. The stream keeps
+    being read while every slot is busy, so `cancel` and `stats` are
+    answered at once and can drop requests still waiting for a slot.
+    """
+    loop = asyncio.get_running_loop()
+    session = server.new_session()
+    in_order: deque = deque()
+    tasks = set()
+
+    def flush_ordered() -> None:
+        while in_order and in_order[0].done():
+            write(in_order.popleft().result())
+
+    async def run(request: Dict) -> Dict:
+        # Registered while it waits for a slot, so `cancel` can drop it before it starts.
+        waiting = RequestContext(request.get("id"), request.get("op"))
+        waiting.session = session
+        with server.cancellable(waiting):
+            await slots.acquire()
+        try:
+            if waiting.cancelled:
+                error = {"message": "cancelled before it started", "cancelled": True}
+                _log(server.log_handle, {"ts": _utc_ts(), "event": "error", "id": waiting.id, "error": error})
+                return {"id": waiting.id, "ok": False, "error": error}
+            return await loop.run_in_executor(executor, _handle_request, server, request, frame_write, session)
+        finally:
+            slots.release()
+
+    def finished(task: asyncio.Task) -> None:
+        tasks.discard(task)
+        if ordered:
+            flush_ordered()
+        else:
+            write(task.result())
+
+    while True:
+        raw = await read_message()
+        if raw is None:
+            break
+        request, response = _decode_request(raw, wire.codec)
+        if response is None and request.get("op") == "hello":
+            # In-flight requests answer in the old codec before the stream switches.
+            if tasks:
+                await asyncio.gather(*tasks)
+            response = _handle_request(server, request, None, session)
+            write(response)
+            wire.switch(request, response)
+            continue
+        if response is None and request.get("op") in ("cancel", "stats"):
+            # Answered on the loop: these must not wait for a free slot.
+            response = _handle_request(server, request, None, session)
+        if response is not None:
+            if ordered:
+                done = loop.create_future()
+                done.set_result(response)
+                in_order.append(done)
+                flush_ordered()
+            else:
+                write(response)
+            continue
+        task = loop.create_task(run(request))
+        tasks.add(task)
+        if ordered:
+            in_order.append(task)
+        task.add_done_callback(finished)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def _serve_concurrent(server: "ZenoServer", max_in_flight: int, ordered: bool) -> None:
+    """Serve stdin/stdout with up to `max_in_flight` requests running at once."""
+    loop = asyncio.get_running_loop()
+    stdin_reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zeno-stdin")
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="zeno-op")
+
+    wire = server.new_wire()
+    write = _stdout_writer(wire)
+
+    async def read() -> Optional[bytes]:
+        return await loop.run_in_executor(stdin_reader, read_message, sys.stdin.buffer, wire.codec)
+
+    try:
+        slots = asyncio.Semaphore(max_in_flight)
+        await _serve_lines(server, wire, read, write, write, executor, slots, ordered)
+    finally:
+        executor.shutdown(wait=True)
+        stdin_reader.shutdown(wait=False)
+
+
+def _parse_listen(address: str, root: str) -> Tuple[str, object]:
+    """Return ("unix", path) or ("tcp", (host, port)) for a --listen value."""
+    if address == "auto":
+        return "unix", default_socket_path(root)
+    kind, _, rest = address.partition(":")
+    if kind == "unix" and rest:
+        return "unix", rest
+    if kind == "tcp":
+        host, _, port = rest.rpartition(":")
+        if host and port.isdigit():
+            return "tcp", (host, int(port))
+    raise ValueError(f"invalid listen address: {address} (expected unix:PATH, tcp:HOST:PORT or auto)")
+
+
+def default_socket_path(root: str) -> str:
+    """Per-root socket in the per-user runtime directory; zeno_client.py derives the same one.
+
+    The directory is `$XDG_RUNTIME_DIR/zeno`, else `zeno-<uid>` in the temp directory.
+    """
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    directory = os.path.join(runtime, "zeno") if runtime else os.path.join(tempfile.gettempdir(), f"zeno-{os.getuid()}")
+    digest = hashlib.sha1(_realpath(root).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"{digest}.sock")
+
+
+def _private_socket_dir(path: str) -> None:
+    """Create the directory of an `auto` socket as 0700, refusing one another user could write."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise SystemExit(f"refusing socket directory {directory}: it must be a 0700 directory owned by this user")
+
+
+def _claim_unix_socket(path: str) -> None:
+    """Remove a stale socket file, refusing to replace a live daemon."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise SystemExit(f"zeno_server already listening on {path}")
+    finally:
+        probe.close()
+
+
+async def _serve_listen(server: "ZenoServer", kind: str, target, max_in_flight: int, ordered: bool) -> None:
+    """Serve JSONL over a Unix or TCP socket, one line stream per connection.
+
+    All connections share one request pool, so `max_in_flight` bounds the
+    whole daemon. The file inventory, line index, result cache and trigram
+    index stay warm across connections. SIGINT/SIGTERM stop the daemon and
+    remove its socket file.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="zeno-op")
+    slots = asyncio.Semaphore(max_in_flight)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        wire = server.new_wire()
+
+        def send(data: bytes) -> None:
+            if not writer.is_closing():
+                writer.write(data)
+
+        def write(obj: Dict) -> None:
+            send(wire.encode(obj))
+
+        def frame_write(obj: Dict) -> None:
+            loop.call_soon_threadsafe(send, wire.encode(obj))
+
+        async def read() -> Optional[bytes]:
+            try:
+                return await read_message_async(reader, wire.codec)
+            except (ConnectionError, ValueError):
+                return None
+
+        try:
+            await _serve_lines(server, wire, read, write, frame_write, executor, slots, ordered)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    if kind == "unix":
+        _claim_unix_socket(target)
+        listener = await asyncio.start_unix_server(handle, path=target, limit=MAX_REQUEST_LINE)
+    else:
+        host, port = target
+        listener = await asyncio.start_server(handle, host=host, port=port, limit=MAX_REQUEST_LINE)
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    bound = target if kind == "unix" else "%s:%d" % listener.sockets[0].getsockname()[:2]
+    _log(server.log_handle, {"ts": _utc_ts(), "event": "listen", "address": f"{kind}:{bound}"})
+    print(f"zeno_server listening on {kind}:{bound}", file=sys.stderr, flush=True)
+    try:
+        async with listener:
+            await stop.wait()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if kind == "unix" and os.path.exists(target):
+            os.unlink(target)
+
+
+def _parse_budget(text: str) -> Dict[str, int]:
+    """Parse a --budget value such as `ops=30,lines=2000,bytes=50000000`."""
+    limits: Dict[str, int] = {}
+    for item in text.split(","):
+        kind, sep, value = item.strip().partition("=")
+        if not sep or kind not in SessionBudget.KINDS or not value.isdigit():
+            raise argparse.ArgumentTypeError(f"invalid budget item: {item!r} (expected ops=N, lines=N or bytes=N)")
+        limits[kind] = int(value)
+    return limits
+
 
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="JSONL REPL server for Zeno workflows")
     parser.add_argument("--root", required=True, help="Root directory to serve")
     parser.add_argument("--log", help="Optional JSONL log file path")
+    parser.add_argument(
+        "--log-max-bytes",
+        type=int,
+        default=0,
+        help="Rotate the log once it reaches this size (default: 0, never)",
+    )
+    parser.add_argument(
+        "--log-backups",
+        type=int,
+        default=LOG_BACKUPS,
+        help=f"Rotated logs to keep as LOG.1 ... LOG.N (default: {LOG_BACKUPS})",
+    )
+    parser.add_argument(
+        "--log-fsync-interval",
+        type=float,
+        default=LOG_FSYNC_INTERVAL,
+        help=f"Seconds between log fsyncs; 0 syncs every batch (default: {LOG_FSYNC_INTERVAL})",
+    )
+    parser.add_argument(
+        "--log-overflow",
+        choices=["block", "drop"],
+        default="block",
+        help="When the log queue is full: block the request or drop the event (default: block)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Process pool size for grep requests with parallel=true (default: CPU count)",
+    )
+    parser.add_argument(
+        "--trigram-index",
+        help="Trigram index from zeno_index.py --trigrams used to narrow grep candidates",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help=(
+            "Max requests in flight; above 1, responses are written as they complete "
+            f"(default: 1, serial; {LISTEN_CONCURRENCY} with --listen)"
+        ),
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="With --concurrency, write responses in request order for clients that expect it",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=RESULT_CACHE_SIZE,
+        help=f"Result cache entries for list_files/grep/grep_multi/extract_symbols; 0 disables (default: {RESULT_CACHE_SIZE})",
+    )
+    parser.add_argument(
+        "--git",
+        choices=["auto", "tracked", "off"],
+        default="auto",
+        help=(
+            "File inventory source inside a git work tree: auto = git ls-files with untracked files, "
+            "tracked = index only, off = always walk (default: auto)"
+        ),
+    )
+    parser.add_argument(
+        "--budget",
+        type=_parse_budget,
+        help=(
+            "Default session budget, e.g. ops=30,lines=2000,bytes=50000000; "
+            "each stdio stream or daemon connection is one session"
+        ),
+    )
+    parser.add_argument(
+        "--stats-file",
+        help="Append a JSONL snapshot of the stats op output here periodically and on exit",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=STATS_DUMP_INTERVAL,
+        help=f"Seconds between --stats-file snapshots (default: {STATS_DUMP_INTERVAL:g})",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Enable the per-request profile arg; cProfile .pstats and Chrome trace JSON are written here",
+    )
+    parser.add_argument(
+        "--utf8",
+        action="store_true",
+        help="Write non-ASCII text as raw UTF-8 instead of \\u escapes (clients can also ask via hello)",
+    )
+    parser.add_argument(
+        "--listen",
+        help="Run as a daemon on unix:PATH, tcp:HOST:PORT, or auto (per-root socket zeno_client.py finds)",
+    )
     return parser.parse_args()
 
 
@@ -441,67 +3117,41 @@ def main() -> int:
     args = _parse_args()
     log_handle = None
     if args.log:
-        log_handle = open(args.log, "a", encoding="utf-8")
-    server = ZenoServer(args.root, log_handle)
-
-    ops = {
-        "list_files": server.list_files,
-        "read_file": server.read_file,
-        "grep": server.grep,
-        "peek": server.peek,
-        "extract_symbols": server.extract_symbols,
-        "stat": server.stat,
-    }
+        log_handle = LogWriter(
+            args.log,
+            max_bytes=args.log_max_bytes,
+            backups=args.log_backups,
+            fsync_interval=args.log_fsync_interval,
+            overflow=args.log_overflow,
+        )
+    server = ZenoServer(
+        args.root,
+        log_handle,
+        workers=args.workers,
+        trigram_index=args.trigram_index,
+        cache_size=args.cache_size,
+        git=args.git,
+        budget=args.budget,
+        ensure_ascii=not args.utf8,
+        stats_file=args.stats_file,
+        stats_interval=args.stats_interval,
+        profile_dir=args.profile_dir,
+    )
 
-    for raw in sys.stdin:
-        line = raw.strip()
-        if not line:
-            continue
+    if args.listen:
         try:
-            request = json.loads(line)
-        except json.JSONDecodeError as exc:
-            _write_json({"id": None, "ok": False, "error": {"message": str(exc)}})
-            continue
-
-        req_id = request.get("id")
-        op = request.get("op")
-        args_dict = request.get("args") or {}
-        _log(log_handle, {"ts": _utc_ts(), "event": "request", "id": req_id, "op": op, "args": args_dict})
-
-        if op not in ops:
-            error = {"message": f"unknown op: {op}"}
-            _write_json({"id": req_id, "ok": False, "error": error})
-            _log(log_handle, {"ts": _utc_ts(), "event": "error", "id": req_id, "error": error})
-            continue
-
-        try:
-            result = ops[op](args_dict)
-            response = {"id": req_id, "ok": True, "result": result}
-            _write_json(response)
-            metrics = result.get("metrics", {})
-            _log(
-                log_handle,
-                {
-                    "ts": _utc_ts(),
-                    "event": "response",
-                    "id": req_id,
-                    "op": op,
-                    "summary": {
-                        "truncated": result.get("truncated"),
-                        "count": len(result.get("files", []))
-                        or len(result.get("hits", []))
-                        or len(result.get("symbols", []))
-                        or len(result.get("items", []))
-                        or None,
-                        "metrics": metrics,
-                    },
-                },
-            )
-        except Exception as exc:  # noqa: BLE001
-            error = {"message": str(exc)}
-            _write_json({"id": req_id, "ok": False, "error": error})
-            _log(log_handle, {"ts": _utc_ts(), "event": "error", "id": req_id, "error": error})
+            kind, target = _parse_listen(args.listen, server.root)
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+        if args.listen == "auto":
+            _private_socket_dir(target)
+        asyncio.run(_serve_listen(server, kind, target, args.concurrency or LISTEN_CONCURRENCY, args.ordered))
+    elif (args.concurrency or 1) > 1:
+        asyncio.run(_serve_concurrent(server, args.concurrency, args.ordered))
+    else:
+        _serve_serial(server)
 
+    server.close()
     if log_handle:
         log_handle.close()
     return 0
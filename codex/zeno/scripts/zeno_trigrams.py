@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Binary trigram index shared by zeno_index.py (writer) and zeno_server.py (reader).
+
+The file is laid out so a reader can mmap it and decode only the posting
+lists a query needs:
+- header: magic, version, trigram and dense-trigram counts, and the byte
+  length of a JSON metadata block (`root`, `generated_at`, `files` as
+  `[rel, size, mtime_ns]` in file-id order, `stats`);
+- the metadata block;
+- the trigram table: one record per trigram, sorted by trigram bytes,
+  holding the trigram and the offset where its posting list starts; a list
+  ends where the next one starts;
+- the dense table: sorted trigrams present in too many files to be worth a
+  posting list;
+- the posting lists: ascending file ids as LEB128 varint deltas.
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+from struct import Struct
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAGIC = b"ZTRI"
+VERSION = 2
+HEADER = Struct("<4sIIII")
+RECORD = Struct("<3sI")
+GRAM_SIZE = 3
+
+
+def _varints(ids: Iterable[int]) -> bytearray:
+    out = bytearray()
+    previous = 0
+    for file_id in ids:
+        delta = file_id - previous
+        previous = file_id
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return out
+
+
+def write_index(path: str, meta: Dict, postings: Dict[bytes, List[int]], dense: Iterable[bytes]) -> None:
+    """Write an index atomically; `postings` maps 3-byte trigrams to ascending file ids."""
+    meta_blob = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    grams = sorted(postings)
+    dense = sorted(dense)
+    table = bytearray()
+    lists = bytearray()
+    for gram in grams:
+        table += RECORD.pack(gram, len(lists))
+        lists += _varints(postings[gram])
+    if len(lists) > 0xFFFFFFFF:
+        raise ValueError("posting lists exceed 4 GiB")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as handle:
+            handle.write(HEADER.pack(MAGIC, VERSION, len(grams), len(dense), len(meta_blob)))
+            handle.write(meta_blob)
+            handle.write(table)
+            handle.write(b"".join(dense))
+            handle.write(lists)
+        # Replace rather than rewrite in place: a server may have the old file mapped.
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class IndexFile:
+    """A memory-mapped index; trigrams are looked up one at a time by binary search."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as handle:
+            self._buf = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buf) < HEADER.size:
+            raise ValueError("truncated trigram index")
+        magic, version, self._count, self._dense_count, meta_len = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a version {VERSION} trigram index")
+        self.meta: Dict = json.loads(self._buf[HEADER.size : HEADER.size + meta_len])
+        self._table = HEADER.size + meta_len
+        self._dense = self._table + self._count * RECORD.size
+        self._lists = self._dense + self._dense_count * GRAM_SIZE
+        if len(self._buf) < self._lists:
+            raise ValueError("truncated trigram index")
+
+    def _offset(self, idx: int) -> int:
+        if idx == self._count:
+            return len(self._buf) - self._lists
+        return RECORD.unpack_from(self._buf, self._table + idx * RECORD.size)[1]
+
+    def is_dense(self, gram: bytes) -> bool:
+        buf = self._buf
+        lo, hi = 0, self._dense_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self._dense + mid * GRAM_SIZE
+            key = buf[pos : pos + GRAM_SIZE]
+            if key == gram:
+                return True
+            if key < gram:
+                lo = mid + 1
+            else:
+                hi = mid
+        return False
+
+    def lookup(self, gram: bytes) -> Optional[Tuple[int, int]]:
+        """Return the (start, end) byte span of `gram`'s posting list, or None if no file has it."""
+        buf = self._buf
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self._table + mid * RECORD.size
+            key = buf[pos : pos + GRAM_SIZE]
+            if key == gram:
+                return self._offset(mid), self._offset(mid + 1)
+            if key < gram:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def postings(self, span: Tuple[int, int]) -> List[int]:
+        """Decode the file ids stored in a span returned by `lookup`."""
+        buf = self._buf
+        pos, end = self._lists + span[0], self._lists + span[1]
+        ids: List[int] = []
+        current = 0
+        while pos < end:
+            delta = 0
+            shift = 0
+            while True:
+                byte = buf[pos]
+                pos += 1
+                delta |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            current += delta
+            ids.append(current)
+        return ids
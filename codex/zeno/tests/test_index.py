@@ -23,3 +23,19 @@ def test_index_basic():
         data = json.loads(out_path.read_text(encoding="utf-8"))
         assert data["stats"]["symbols"] >= 2
         assert data["stats"]["imports"] >= 1
+
+
+def test_index_honors_gitignore():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base = Path(tmpdir)
+        (base / "gen").mkdir()
+        (base / "gen" / "api.py").write_text("def generated():\n    pass\n", encoding="utf-8")
+        (base / "app.py").write_text("def run():\n    pass\n", encoding="utf-8")
+        (base / ".gitignore").write_text("gen/\n", encoding="utf-8")
+        paths = {}
+        for flag in ([], ["--no-ignore"]):
+            result = subprocess.run(["python3", SCRIPT, "--root", str(base)] + flag, capture_output=True, text=True)
+            assert result.returncode == 0, result.stderr
+            paths[bool(flag)] = {sym["path"] for sym in json.loads(result.stdout)["symbols"]}
+        assert paths[False] == {"app.py"}
+        assert paths[True] == {"app.py", "gen/api.py"}
@@ -27,3 +27,15 @@ def test_modes_plan_jsonl():
     payload = json.loads(lines[0])
     assert "op" in payload
     assert "args" in payload
+
+
+def test_modes_security_plan_multi():
+    result = subprocess.run(
+        ["python3", SCRIPT, "plan", "--mode", "security-audit", "--multi", "--format", "jsonl"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0
+    ops = [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+    assert [op["op"] for op in ops] == ["list_files", "grep_multi"]
+    assert len(ops[1]["args"]["patterns"]) > 1